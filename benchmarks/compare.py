@@ -0,0 +1,81 @@
+#compare.py
+"""
+Compare two benchmark result files from run.py and flag regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.10]
+
+Exits with status 1 when any tracked metric got worse by more than the
+threshold (relative), so it can gate CI or a release checklist.
+"""
+import argparse
+import json
+import sys
+
+# (path in the result JSON, True if higher is better)
+METRICS = [
+    ("import_s", False),
+    ("warm_up_s", False),
+    ("baseline_rss_mb", False),
+    ("ingestion.wall_s", False),
+    ("ingestion.docs_per_sec", True),
+    ("ingestion.chunks_per_sec", True),
+    ("queries.sequential.first_ms", False),
+    ("queries.sequential.p50_ms", False),
+    ("queries.sequential.p95_ms", False),
+    ("queries.sequential.p99_ms", False),
+    ("queries.concurrent.p50_ms", False),
+    ("queries.concurrent.p95_ms", False),
+    ("queries.concurrent.qps", True),
+    ("peak_rss_mb", False),
+    ("index_bytes", False),
+]
+
+
+def lookup(result, path):
+    for key in path.split("."):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(baseline, candidate, threshold):
+    """Rows of (metric, old, new, relative change, regressed)."""
+    rows = []
+    for path, higher_is_better in METRICS:
+        old, new = lookup(baseline, path), lookup(candidate, path)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        rows.append((path, old, new, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    rows = compare(baseline, candidate, args.threshold)
+    width = max((len(path) for path, *_ in rows), default=10)
+    for path, old, new, change, regressed in rows:
+        flag = "❌" if regressed else "  "
+        print(f"{flag} {path:<{width}}  {old:>12.3f} → {new:>12.3f}  ({change:+.1%})")
+
+    regressions = [path for path, *_, regressed in rows if regressed]
+    if regressions:
+        print(f"⚠️ {len(regressions)} regression(s) above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
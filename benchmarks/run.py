@@ -0,0 +1,384 @@
+#run.py
+"""
+Offline benchmark of ingestion and question answering.
+
+Builds a corpus from the sample files in config/ (optionally copied --scale
+times and topped up with --synthetic generated text documents) inside a
+scratch directory, runs detect_and_ingest over it, then asks --queries
+questions through run_rag and --concurrency parallel run_rag_async calls
+against the stub LLM in stub_llm.py. Reports import and warm-up time, RSS
+right after import, per-stage timings (from the telemetry histograms),
+docs/sec, p50/p95/p99 query latency, peak RSS of the process and its
+conversion workers, and the on-disk index size, and saves everything as
+JSON for compare.py.
+
+    python -m benchmarks.run [--scale 1] [--synthetic 0] [--queries 50] [--concurrency 8]
+                             [--llm-latency-ms 0] [--stub-server] [--warm-cache] [--out results.json]
+
+The embedding and answer caches are off unless --warm-cache is given, so
+repeated runs measure real work. Models are downloaded on first use as usual.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_DIR = REPO_ROOT / "config"
+RESULTS_DIR = REPO_ROOT / "benchmarks" / "results"
+USER_ID = "bench"
+CHATBOT_ID = "bench"
+
+QUESTIONS = [
+    "What is the letter about?",
+    "Who signed the letter?",
+    "Which sensors are described and what do they measure?",
+    "What is the operating temperature range of the sensors?",
+    "Summarise the figures in the spreadsheet.",
+    "What colour is the car in the picture?",
+    "List the key dates mentioned in the documents.",
+    "What is part number BX-4471 used for?",
+]
+
+_WORDS = ("sensor voltage calibration report letter customer delivery invoice pressure "
+          "temperature module firmware warranty contract payment schedule network "
+          "battery storage analysis quarterly revenue threshold alarm").split()
+
+
+def synthetic_document(rng, words):
+    """Deterministic pseudo-text with sentences, headings and part numbers."""
+    out = []
+    for i in range(words // 12):
+        if i % 40 == 0:
+            out.append(f"\n\n## Section {i // 40 + 1}\n\n")
+        sentence = " ".join(rng.choice(_WORDS) for _ in range(11))
+        if rng.random() < 0.1:
+            sentence += f" part BX-{rng.randint(1000, 9999)}"
+        out.append(sentence.capitalize() + ". ")
+    return "".join(out)
+
+
+def build_corpus(documents_dir, scale, synthetic, synthetic_words, samples=True, seed=0):
+    """Fill the chatbot's documents folder; returns the number of files."""
+    documents_dir.mkdir(parents=True, exist_ok=True)
+    count = 0
+    if samples:
+        for copy in range(scale):
+            for path in sorted(SAMPLE_DIR.iterdir()):
+                if not path.is_file():
+                    continue
+                name = path.name if copy == 0 else f"{path.stem}_{copy}{path.suffix}"
+                shutil.copyfile(path, documents_dir / name)
+                count += 1
+    rng = random.Random(seed)
+    for i in range(synthetic):
+        (documents_dir / f"synthetic_{i:05d}.txt").write_text(
+            synthetic_document(rng, synthetic_words), encoding="utf-8"
+        )
+        count += 1
+    return count
+
+
+class PeakRSS:
+    """Samples the RSS of this process plus its children (Docling workers) in the background."""
+
+    def __init__(self, interval=0.05):
+        import psutil
+        self._process = psutil.Process()
+        self.interval = interval
+        self.phase = "setup"
+        self.peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except Exception:
+                pass
+        return rss / (1024 * 1024)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rss = self._sample()
+            except Exception:
+                rss = 0.0
+            self.peaks[self.phase] = max(self.peaks.get(self.phase, 0.0), rss)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return {phase: round(mb, 1) for phase, mb in self.peaks.items()}
+
+
+def stage_snapshot(pipeline):
+    """{stage: (count, seconds)} summed over tenants from the telemetry histogram."""
+    from ingestion.telemetry import STAGE_SECONDS
+    totals = {}
+    for metric in STAGE_SECONDS[pipeline].collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            count, seconds = totals.get(stage, (0, 0.0))
+            if sample.name.endswith("_count"):
+                totals[stage] = (count + sample.value, seconds)
+            elif sample.name.endswith("_sum"):
+                totals[stage] = (count, seconds + sample.value)
+    return totals
+
+
+def stage_delta(before, after):
+    stages = {}
+    for stage, (count, seconds) in after.items():
+        count0, seconds0 = before.get(stage, (0, 0.0))
+        if count - count0:
+            stages[stage] = {
+                "count": int(count - count0),
+                "total_s": round(seconds - seconds0, 4),
+                "mean_ms": round((seconds - seconds0) / (count - count0) * 1000, 2),
+            }
+    return stages
+
+
+def latency_summary(latencies_ms):
+    import numpy as np
+    if not latencies_ms:
+        return {}
+    values = np.asarray(latencies_ms)
+    return {
+        "n": len(latencies_ms),
+        "mean_ms": round(float(values.mean()), 2),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_ingestion(rss):
+    from ingestion.dispatcher import detect_and_ingest
+    from ingestion.jobs import IngestionJob
+    from ingestion.telemetry import tenant
+    from ingestion.vectordb import vector_db
+    from ingestion.registry import get_image_collection
+    from ingestion.tenancy import tenant_collection_name
+
+    rss.phase = "ingestion"
+    job = IngestionJob(USER_ID, CHATBOT_ID)
+    before = stage_snapshot("ingest")
+    start = time.perf_counter()
+    with tenant(USER_ID, CHATBOT_ID):
+        summary = detect_and_ingest(USER_ID, CHATBOT_ID, "uploads", progress=job.progress)
+    wall = time.perf_counter() - start
+
+    ingested = len(summary["added"]) + len(summary["updated"]) - len(summary["failed"])
+    chunks = vector_db.get_docs_collection(USER_ID, CHATBOT_ID)._collection.count()
+    images = get_image_collection(tenant_collection_name("images", USER_ID, CHATBOT_ID)).count()
+    return {
+        "wall_s": round(wall, 3),
+        "files": ingested,
+        "failed": summary["failed"],
+        "chunks": chunks,
+        "images": images,
+        "docs_per_sec": round(ingested / wall, 3) if wall else None,
+        "chunks_per_sec": round(chunks / wall, 3) if wall else None,
+        "stages": stage_delta(before, stage_snapshot("ingest")),
+        "files_detail": job.to_dict()["files"],
+    }
+
+
+def stub_pool(llm_latency_ms, token_ms, stub_server):
+    """An LLM pool of one stub endpoint: in-process, or over HTTP to models/stub_server.py."""
+    from models.pool import Endpoint, LLMPool
+    if not stub_server:
+        from benchmarks.stub_llm import StubLLM, AsyncStubLLM
+        return LLMPool([Endpoint("stub", "stub", client=StubLLM(llm_latency_ms, token_ms),
+                                 async_client=AsyncStubLLM(llm_latency_ms, token_ms))])
+    from models.stub_server import start_stub_server
+    import models.pool
+    _, models.pool.LLM_STUB_URL = start_stub_server(latency_ms=llm_latency_ms, jitter_ms=0)
+    return LLMPool([Endpoint("stub", "stub")])
+
+
+def run_queries(rss, n_queries, concurrency, include_images, llm_latency_ms, token_ms, stub_server=False):
+    from ingestion import main as app
+
+    app.llm_pool = stub_pool(llm_latency_ms, token_ms, stub_server)
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(n_queries)]
+    results = {}
+
+    rss.phase = "queries_sequential"
+    before = stage_snapshot("rag")
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        app.run_rag(question, USER_ID, CHATBOT_ID, include_images)
+        latencies.append((time.perf_counter() - start) * 1000)
+    results["sequential"] = latency_summary(latencies)
+    if latencies:
+        results["sequential"]["first_ms"] = round(latencies[0], 2)
+    results["sequential"]["stages"] = stage_delta(before, stage_snapshot("rag"))
+
+    if concurrency > 0 and questions:
+        rss.phase = "queries_concurrent"
+
+        async def concurrent():
+            semaphore = asyncio.Semaphore(concurrency)
+            latencies = []
+
+            async def one(question):
+                async with semaphore:
+                    start = time.perf_counter()
+                    await app.run_rag_async(question, USER_ID, CHATBOT_ID, include_images)
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(q) for q in questions))
+            return latencies, time.perf_counter() - start
+
+        before = stage_snapshot("rag")
+        latencies, wall = asyncio.run(concurrent())
+        results["concurrent"] = latency_summary(latencies)
+        results["concurrent"].update(
+            concurrency=concurrency,
+            wall_s=round(wall, 3),
+            qps=round(len(latencies) / wall, 3) if wall else None,
+            stages=stage_delta(before, stage_snapshot("rag")),
+        )
+    results["llm_pool"] = app.llm_pool.pool_stats()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and RAG queries offline")
+    parser.add_argument("--scale", type=int, default=1, help="copies of the sample corpus")
+    parser.add_argument("--synthetic", type=int, default=0, help="extra generated text documents")
+    parser.add_argument("--synthetic-words", type=int, default=2000)
+    parser.add_argument("--no-samples", action="store_true", help="only use synthetic documents")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel async queries (0 = skip)")
+    parser.add_argument("--no-images", action="store_true", help="ask without image retrieval")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--stub-server", action="store_true",
+                        help="reach the stub LLM over HTTP (models/stub_server.py) instead of in-process")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the embedding and answer caches on")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    parser.add_argument("--out", help="result JSON path (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="rag-bench-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    started_at = datetime.now(timezone.utc)
+    out = Path(args.out or RESULTS_DIR / f"{started_at.strftime('%Y%m%dT%H%M%SZ')}.json").resolve()
+
+    # The pipeline uses relative uploads/ and database/ paths and reads its
+    # settings at import time: move and configure before importing it
+    os.chdir(workdir)
+    sys.path.insert(0, str(REPO_ROOT))
+    if not args.warm_cache:
+        os.environ["EMBEDDING_CACHE"] = "0"
+        os.environ["ANSWER_CACHE"] = "0"
+
+    rss = PeakRSS().start()
+    files = build_corpus(
+        workdir / "uploads" / "users" / USER_ID / CHATBOT_ID / "documents",
+        args.scale, args.synthetic, args.synthetic_words, samples=not args.no_samples
+    )
+
+    rss.phase = "import"
+    start = time.perf_counter()
+    import ingestion.main  # noqa: F401  (the API module; models load lazily)
+    import_s = time.perf_counter() - start
+    from ingestion.startup import startup_stats, warm_up
+    baseline_rss_mb = startup_stats()["phases"]["imported"]["rss_mb"]
+
+    rss.phase = "warm_up"
+    start = time.perf_counter()
+    warm_up()
+    warm_up_s = time.perf_counter() - start
+
+    try:
+        ingestion_result = run_ingestion(rss)
+        query_result = run_queries(rss, args.queries, args.concurrency, not args.no_images,
+                                   args.llm_latency_ms, args.token_ms, args.stub_server)
+    finally:
+        peaks = rss.stop()
+
+    from ingestion.embedding_backends import backend_for
+    result = {
+        "meta": {
+            "started_at": started_at.isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+            "embedding_backends": {"docs": backend_for("docs"), "images": backend_for("images")},
+            "corpus_files": files,
+        },
+        "import_s": round(import_s, 3),
+        "warm_up_s": round(warm_up_s, 3),
+        "baseline_rss_mb": baseline_rss_mb,
+        "ingestion": ingestion_result,
+        "queries": query_result,
+        "peak_rss_mb": max(peaks.values()) if peaks else None,
+        "peak_rss_mb_by_phase": peaks,
+        "index_bytes": dir_size(workdir / "database"),
+        "lexical_index_bytes": dir_size(workdir / "database" / "lexical"),
+        "derived_bytes": dir_size(workdir / "uploads"),
+    }
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    seq = query_result.get("sequential", {})
+    print(f"📊 {ingestion_result['files']} files in {ingestion_result['wall_s']}s "
+          f"({ingestion_result['docs_per_sec']} docs/s, {ingestion_result['chunks']} chunks); "
+          f"queries p50 {seq.get('p50_ms')} ms, p95 {seq.get('p95_ms')} ms, p99 {seq.get('p99_ms')} ms; "
+          f"peak RSS {result['peak_rss_mb']} MB; index {result['index_bytes'] / 1e6:.1f} MB")
+    print(f"💾 Results written to {out}")
+
+    if not args.keep and not args.workdir:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
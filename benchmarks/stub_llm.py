@@ -0,0 +1,81 @@
+#stub_llm.py
+"""
+Offline stand-in for the Groq/OpenRouter clients.
+
+Mimics the slice of the OpenAI-style chat API that ingestion/main.py uses
+(`client.chat.completions.create(model, messages, max_tokens, stream)`),
+sleeping a fixed latency and answering with a canned text, so benchmarks
+measure our own pipeline and not a remote provider.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+ANSWER = "This is a benchmark answer produced by the stub LLM. " * 4
+
+
+def _prompt_tokens(messages):
+    chars = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(part.get("text") or part.get("image_url", {}).get("url", "")) for part in content)
+    return chars // 4
+
+
+def _usage(messages, answer):
+    return SimpleNamespace(prompt_tokens=_prompt_tokens(messages), completion_tokens=len(answer) // 4)
+
+
+def _response(messages, answer):
+    message = SimpleNamespace(content=answer, role="assistant")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=_usage(messages, answer))
+
+
+def _chunks(messages, answer):
+    words = answer.split(" ")
+    for i, word in enumerate(words):
+        delta = SimpleNamespace(content=word + ("" if i == len(words) - 1 else " "))
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+    yield SimpleNamespace(choices=[], usage=_usage(messages, answer))
+
+
+class StubLLM:
+    """Synchronous client: latency_ms before the answer (or the first token when streaming)."""
+
+    def __init__(self, latency_ms=0.0, token_ms=0.0, answer=ANSWER):
+        self.latency_s = latency_ms / 1000
+        self.token_s = token_ms / 1000
+        self.answer = answer
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, max_tokens=None, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency_s)
+        if stream:
+            return self._stream(messages)
+        return _response(messages, self.answer)
+
+    def _stream(self, messages):
+        for chunk in _chunks(messages, self.answer):
+            time.sleep(self.token_s)
+            yield chunk
+
+
+class AsyncStubLLM(StubLLM):
+    """Async client with the same timings, for run_rag_async / run_rag_stream."""
+
+    async def _create(self, model, messages, max_tokens=None, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency_s)
+        if stream:
+            return self._stream(messages)
+        return _response(messages, self.answer)
+
+    async def _stream(self, messages):
+        for chunk in _chunks(messages, self.answer):
+            await asyncio.sleep(self.token_s)
+            yield chunk
@@ -0,0 +1,168 @@
+#answer_cache.py
+"""
+Per-chatbot answer cache for repeated and near-duplicate questions.
+
+Exact repeats are matched on a hash of the normalised question before any
+embedding happens; near-duplicates are matched by cosine similarity of the
+(normalised) query embedding. Every entry remembers the chatbot's corpus
+version, the mtime of its ingestion manifest, so any ingestion or deletion
+invalidates the chatbot's answers, in every worker process.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from .manifest import MANIFEST_NAME, chatbot_root
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_PER_CHATBOT = int(os.getenv("ANSWER_CACHE_MAX_PER_CHATBOT", "500"))
+ANSWER_CACHE_MAX_CHATBOTS = int(os.getenv("ANSWER_CACHE_MAX_CHATBOTS", "1000"))
+# Cosine similarity above which two questions share an answer
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+def corpus_version(user_id, chatbot_id, base_storage_path="uploads"):
+    """Changes whenever ingestion rewrites the chatbot's manifest."""
+    try:
+        return os.stat(chatbot_root(base_storage_path, user_id, chatbot_id) / MANIFEST_NAME).st_mtime_ns
+    except OSError:
+        return None
+
+
+class _Scope:
+    def __init__(self, version):
+        self.version = version
+        self.entries = OrderedDict()
+        self._matrix = None
+        self._keys = None
+
+    def matrix(self):
+        """Stacked question vectors, rebuilt only when the entries change."""
+        if self._matrix is None:
+            keys = [k for k, e in self.entries.items() if e["vector"] is not None]
+            self._keys = keys
+            self._matrix = (np.vstack([self.entries[k]["vector"] for k in keys])
+                            if keys else np.zeros((0, 0), dtype=np.float32))
+        return self._keys, self._matrix
+
+    def changed(self):
+        self._matrix = None
+        self._keys = None
+
+
+class AnswerCache:
+    def __init__(self, base_storage_path="uploads"):
+        self.base_storage_path = base_storage_path
+        self._scopes = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _scope(self, user_id, chatbot_id, include_images, create=False):
+        key = (str(user_id), str(chatbot_id), bool(include_images))
+        version = corpus_version(user_id, chatbot_id, self.base_storage_path)
+        scope = self._scopes.get(key)
+        if scope is not None and scope.version != version:
+            # the corpus changed since these answers were produced
+            del self._scopes[key]
+            self.invalidations += 1
+            scope = None
+        if scope is None and create:
+            scope = self._scopes[key] = _Scope(version)
+            while len(self._scopes) > ANSWER_CACHE_MAX_CHATBOTS:
+                _, dropped = self._scopes.popitem(last=False)
+                self.evictions += len(dropped.entries)
+        if scope is not None:
+            self._scopes.move_to_end(key)
+        return scope
+
+    def _fresh(self, scope, key):
+        entry = scope.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > ANSWER_CACHE_TTL:
+            del scope.entries[key]
+            scope.changed()
+            return None
+        scope.entries.move_to_end(key)
+        return entry
+
+    def lookup_exact(self, user_id, chatbot_id, include_images, question):
+        """Stored response for the same normalised question, or None."""
+        key = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        with self._lock:
+            scope = self._scope(user_id, chatbot_id, include_images)
+            entry = self._fresh(scope, key) if scope else None
+            if entry is None:
+                return None
+            self.exact_hits += 1
+            return entry["response"]
+
+    def lookup_similar(self, user_id, chatbot_id, include_images, vector):
+        """Stored response of the most similar question above the threshold, or None."""
+        with self._lock:
+            scope = self._scope(user_id, chatbot_id, include_images)
+            if scope is not None:
+                keys, matrix = scope.matrix()
+                if keys:
+                    scores = matrix @ np.asarray(vector, dtype=np.float32)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= ANSWER_CACHE_SIMILARITY:
+                        entry = self._fresh(scope, keys[best])
+                        if entry is not None:
+                            self.semantic_hits += 1
+                            return entry["response"]
+            self.misses += 1
+            return None
+
+    def store(self, user_id, chatbot_id, include_images, question, vector, response):
+        key = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        with self._lock:
+            scope = self._scope(user_id, chatbot_id, include_images, create=True)
+            scope.entries[key] = {"vector": vector, "response": response, "created_at": time.time()}
+            scope.entries.move_to_end(key)
+            while len(scope.entries) > ANSWER_CACHE_MAX_PER_CHATBOT:
+                scope.entries.popitem(last=False)
+                self.evictions += 1
+            scope.changed()
+            self.stores += 1
+
+    def invalidate(self, user_id, chatbot_id):
+        with self._lock:
+            for key in [k for k in self._scopes if k[:2] == (str(user_id), str(chatbot_id))]:
+                del self._scopes[key]
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "chatbots": len(self._scopes),
+                "entries": sum(len(s.entries) for s in self._scopes.values()),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,102 @@
+#batcher.py
+"""
+Cross-request micro-batching of query embeddings.
+
+Under concurrent load every /ask embedded its one question on its own. On
+CPU a batch of one leaves most of the matrix-multiply throughput unused. A
+MicroBatcher per model kind ("docs" for the text model, "images" for the
+OpenCLIP text tower) queues the questions of concurrent requests. One
+worker thread takes whatever arrived within QUERY_BATCH_MAX_WAIT_MS of the
+first question, up to QUERY_BATCH_MAX_SIZE questions, encodes them in one
+call and hands each caller its own vectors.
+
+QUERY_BATCH_MAX_WAIT_MS bounds the latency a lone question pays. 0 never
+waits and only batches what is already queued. Lists of QUERY_BATCH_MAX_SIZE
+questions or more (e.g. /ask/batch) are already a batch and skip the queue.
+Batch sizes, queue waits and queue depth go to the query_embedding_*
+metrics.
+
+Each uvicorn worker process has its own batchers.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from .telemetry import observe_batch, set_queue_depth
+
+QUERY_BATCHING = os.getenv("QUERY_BATCHING", "1") == "1"
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Gathers embed(texts) calls from many threads into batched fn(texts) calls.
+    fn must return one vector per text, in order.
+    """
+
+    def __init__(self, kind, fn, max_size=QUERY_BATCH_MAX_SIZE, max_wait_ms=QUERY_BATCH_MAX_WAIT_MS,
+                 enabled=QUERY_BATCHING):
+        self.kind = kind
+        self.fn = fn
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=f"embed-batcher-{self.kind}", daemon=True)
+                self._worker.start()
+
+    def embed(self, texts):
+        """Vectors for texts, computed together with other callers' texts when possible."""
+        texts = list(texts)
+        if not texts:
+            return []
+        if not self.enabled or len(texts) >= self.max_size:
+            return self.fn(texts)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((texts, future, time.perf_counter()))
+        set_queue_depth(self.kind, self._queue.qsize())
+        return future.result()
+
+    def _collect(self):
+        """The first queued request plus whatever else arrives before the deadline or the size cap."""
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        set_queue_depth(self.kind, self._queue.qsize())
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            texts = [text for item_texts, _, _ in batch for text in item_texts]
+            try:
+                vectors = self.fn(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+            observe_batch(self.kind, len(texts), [started - queued for _, _, queued in batch])
@@ -0,0 +1,99 @@
+# chunking.py
+"""
+Semantic chunking that embeds each sentence window exactly once.
+
+Follows SemanticChunker's percentile breakpoints (sentence windows of
+buffer 1, cosine distance between neighbours), but embeds every window of
+every document in one batched call and derives each chunk's vector as the
+normalised mean of its windows, so chunks are not embedded a second time.
+"""
+import os
+import re
+import time
+import numpy as np
+from langchain.schema import Document
+from .telemetry import span
+
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+"
+BREAKPOINT_PERCENTILE = 95
+# "mean" derives chunk vectors from sentence windows, "reembed" encodes each chunk again
+CHUNK_EMBEDDING_MODE = os.getenv("CHUNK_EMBEDDING_MODE", "mean")
+
+
+def split_sentences(text):
+    return [s for s in re.split(SENTENCE_SPLIT_REGEX, text) if s.strip()]
+
+
+def combine_sentences(sentences, buffer_size=1):
+    """Each sentence together with its buffer_size neighbours on both sides."""
+    combined = []
+    for i in range(len(sentences)):
+        start = max(0, i - buffer_size)
+        combined.append(" ".join(sentences[start:i + buffer_size + 1]))
+    return combined
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _breakpoints(vectors):
+    """Indices after which a new chunk starts, SemanticChunker percentile style."""
+    if len(vectors) < 2:
+        return []
+    distances = 1.0 - np.sum(vectors[:-1] * vectors[1:], axis=1)
+    threshold = np.percentile(distances, BREAKPOINT_PERCENTILE)
+    return [i for i, d in enumerate(distances) if d > threshold]
+
+
+def semantic_chunks(documents, embeddings):
+    """
+    Split documents into semantic chunks.
+    Returns (chunks, vectors) where vectors[i] is the embedding of chunks[i]
+    under the document prompt, ready for VectorDB.store_documents.
+    """
+    start = time.perf_counter()
+    per_doc = []
+    windows = []
+    for doc in documents:
+        # table row groups (tables.py) are already sized chunks: keep them whole
+        if "row_start" in doc.metadata:
+            sentences = [doc.page_content] if doc.page_content.strip() else []
+        else:
+            sentences = split_sentences(doc.page_content)
+        if not sentences:
+            continue
+        per_doc.append((doc, sentences, len(windows)))
+        windows.extend(combine_sentences(sentences))
+
+    if not windows:
+        return [], []
+
+    # One batched forward pass over every sentence window of every document
+    with span("embedding", "ingest"):
+        window_vectors = _normalize(np.asarray(embeddings.embed_documents(windows), dtype=np.float32))
+
+    chunks, vectors = [], []
+    for doc, sentences, offset in per_doc:
+        doc_vectors = window_vectors[offset:offset + len(sentences)]
+        bounds = _breakpoints(doc_vectors) + [len(sentences) - 1]
+        first = 0
+        for last in bounds:
+            chunks.append(Document(
+                page_content=" ".join(sentences[first:last + 1]),
+                metadata=dict(doc.metadata)
+            ))
+            vectors.append(doc_vectors[first:last + 1].mean(axis=0))
+            first = last + 1
+
+    if CHUNK_EMBEDDING_MODE == "reembed":
+        with span("embedding", "ingest"):
+            vectors = embeddings.embed_documents([c.page_content for c in chunks])
+    else:
+        vectors = _normalize(np.vstack(vectors)).tolist()
+
+    print(f"✂️ {len(chunks)} chunks from {len(windows)} sentence windows "
+          f"in {time.perf_counter() - start:.1f}s")
+    return chunks, vectors
@@ -0,0 +1,393 @@
+# conversion.py
+"""
+Docling conversion stage.
+
+Files with a fast loader (plain text, CSV, XLSX; see loaders.py) are read in
+the calling process. The rest are fanned out to a pool of spawned worker
+processes, each holding one warmed DocumentConverter, and the results are put
+back in input order. This module stays free of model/vector-store imports so
+workers start light.
+
+PDF_PROFILE picks how much of Docling's PDF pipeline runs:
+  - "full": OCR, table structure and picture crops (the default)
+  - "digital": no OCR, for born-digital PDFs with a text layer
+  - "text": no OCR, no table structure model, no pictures; fastest
+PDF_OCR, PDF_TABLE_STRUCTURE and PDF_PICTURE_IMAGES override single parts.
+Whole-page images are never used downstream and stay off unless
+PDF_PAGE_IMAGES=1.
+"""
+import math
+import os
+import signal
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from pathlib import Path
+import pandas as pd
+from langchain.schema import Document
+from .progress import notify
+from .loaders import loader_for
+from .tables import TableWriter
+from .telemetry import observe
+
+# Number of conversion processes (1 = convert in the calling process)
+DOCLING_WORKERS = int(os.getenv("DOCLING_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Seconds a single file may spend in Docling before it is abandoned
+DOCLING_FILE_TIMEOUT = float(os.getenv("DOCLING_FILE_TIMEOUT", "600"))
+
+PDF_PROFILES = {
+    "full": {"ocr": True, "table_structure": True, "picture_images": True},
+    "digital": {"ocr": False, "table_structure": True, "picture_images": True},
+    "text": {"ocr": False, "table_structure": False, "picture_images": False},
+}
+PDF_PROFILE = os.getenv("PDF_PROFILE", "full")
+if PDF_PROFILE not in PDF_PROFILES:
+    raise ValueError(f"PDF_PROFILE must be one of {', '.join(PDF_PROFILES)}, not {PDF_PROFILE!r}")
+PDF_IMAGES_SCALE = float(os.getenv("PDF_IMAGES_SCALE", "1.5"))
+PDF_PAGE_IMAGES = os.getenv("PDF_PAGE_IMAGES", "0") == "1"
+
+
+def pdf_setting(name):
+    """A PDF pipeline switch: its PDF_{NAME} override, else the profile's value."""
+    override = os.getenv(f"PDF_{name.upper()}")
+    if override is not None:
+        return override == "1"
+    return PDF_PROFILES[PDF_PROFILE][name]
+
+
+_converter = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ConversionTimeout(Exception):
+    pass
+
+
+def build_converter():
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+
+    # Configure Docling's PDF pipeline from the profile
+    pipeline_options = PdfPipelineOptions(
+        do_ocr=pdf_setting("ocr"),
+        do_table_structure=pdf_setting("table_structure"),
+        generate_picture_images=pdf_setting("picture_images"),
+        generate_page_images=PDF_PAGE_IMAGES,
+        images_scale=PDF_IMAGES_SCALE,
+        # Docling stops between pages once this is exceeded (works on every OS)
+        document_timeout=DOCLING_FILE_TIMEOUT
+    )
+    return DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+    )
+
+
+def get_converter():
+    """The DocumentConverter of this process, built on first use."""
+    global _converter
+    if _converter is None:
+        _converter = build_converter()
+    return _converter
+
+
+def _init_worker(threads_per_worker):
+    # Split the cores between workers instead of letting each torch grab all of them
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_worker)
+    import torch
+    from docling.datamodel.base_models import InputFormat
+
+    torch.set_num_threads(threads_per_worker)
+    get_converter().initialize_pipeline(InputFormat.PDF)
+
+
+def save_picture_item(element, conv_doc, out_dir: Path, base_name: str, counter: int):
+    """
+    Save a PictureItem to out_dir. Returns the saved filepath (str) or None.
+    """
+    try:
+        pil_img = element.get_image(conv_doc)
+        if pil_img is None:
+            return None
+        if pil_img.mode in ("RGBA", "P", "LA"):
+            pil_img = pil_img.convert("RGB")
+        filename = f"{base_name}_picture_{counter}.png"
+        filepath = out_dir / filename
+        # ensure out_dir exists
+        out_dir.mkdir(parents=True, exist_ok=True)
+        pil_img.save(filepath, format="PNG")
+        return str(filepath)
+    except Exception as e:
+        print(f"⚠️ Failed to save picture: {e}")
+        return None
+
+
+def export_table_item(table_item, path: Path, table_ix: int, out_dir: Path):
+    """
+    Export a TableItem to CSV and Parquet in out_dir and return
+    (csv_path_str or None, row-group Documents) (see tables.py).
+    """
+    try:
+        df = table_item.export_to_dataframe()
+    except Exception:
+        try:
+            rows = []
+            for row in table_item.data.table_cells:
+                cells = [c.text for c in row]
+                rows.append(cells)
+            df = pd.DataFrame(rows)
+        except Exception as e:
+            print(f"⚠️ Failed to extract table: {e}")
+            df = pd.DataFrame()
+
+    if df.empty:
+        return None, []
+    out_dir.mkdir(parents=True, exist_ok=True)
+    csv_path = out_dir / f"{path.stem}-table-{table_ix + 1}.csv"
+    try:
+        writer = TableWriter(
+            [str(c) for c in df.columns],
+            {"source": str(path), "origin": path.name, "element_type": "table", "table_index": table_ix + 1},
+            out_dir / f"{path.stem}-table-{table_ix + 1}.parquet",
+            csv_path=csv_path,
+            title=f"{path.name}, table {table_ix + 1}"
+        )
+        for row in df.itertuples(index=False, name=None):
+            writer.add(row)
+        return str(csv_path), writer.close()
+    except Exception as e:
+        print(f"⚠️ Failed to convert table: {e}")
+        return None, []
+
+
+def _raise_timeout(signum, frame):
+    raise ConversionTimeout(f"conversion exceeded {DOCLING_FILE_TIMEOUT:.0f}s")
+
+
+def convert_file(path, out_dir):
+    """
+    Convert one file and save its images & tables to out_dir/{filename}/.
+    Returns {"docs", "full_markdown", "images", "tables"} where docs are the
+    element-level Documents; raises on failure or timeout.
+    """
+    from docling.datamodel.document import TextItem, TableItem, PictureItem
+
+    start = time.perf_counter()
+    path = Path(path)
+    base_name = path.stem
+    file_out_dir = Path(out_dir) / path.name
+    docs, images, tables = [], [], []
+
+    # SIGALRM only exists on POSIX and only fires in the main thread, which is
+    # where pool workers run; in-process conversions rely on document_timeout.
+    use_alarm = (hasattr(signal, "SIGALRM") and DOCLING_FILE_TIMEOUT > 0
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(math.ceil(DOCLING_FILE_TIMEOUT))
+    try:
+        conv_res = get_converter().convert(str(path))
+        conv_doc = conv_res.document
+        table_counter = 0
+        picture_counter = 0
+        for element, level in conv_doc.iterate_items():
+            if isinstance(element, TextItem):
+                text = (element.text or "").strip()
+                if text:
+                    meta = {
+                        "source": str(path),
+                        "origin": path.name,
+                        "element_type": "text",
+                        "page": getattr(element, "page_no", 1),
+                    }
+                    docs.append(Document(page_content=text, metadata=meta))
+            elif isinstance(element, TableItem):
+                table_counter += 1
+                csv_path, table_docs = export_table_item(
+                    element, path, table_counter - 1, file_out_dir
+                )
+                if csv_path:
+                    tables.append(csv_path)
+                if table_docs:
+                    docs.extend(table_docs)
+                else:
+                    docs.append(Document(page_content="[table content]", metadata={
+                        "source": str(path),
+                        "origin": path.name,
+                        "element_type": "table",
+                        "table_index": table_counter,
+                    }))
+            elif isinstance(element, PictureItem):
+                picture_counter += 1
+                pic_path = save_picture_item(
+                    element, conv_doc, file_out_dir, base_name, picture_counter
+                )
+                if pic_path:
+                    images.append(pic_path)
+                    meta = {
+                        "source": str(path),
+                        "origin": path.name,
+                        "element_type": "picture",
+                        "picture_index": picture_counter,
+                        "local_path": pic_path,
+                    }
+                    docs.append(Document(
+                        page_content=f"[IMAGE: {os.path.basename(pic_path)}]",
+                        metadata=meta
+                    ))
+        try:
+            full_md = conv_doc.export_to_markdown()
+        except Exception:
+            # ignore export_to_markdown failures
+            full_md = ""
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+    return {"docs": docs, "full_markdown": full_md, "images": images, "tables": tables,
+            "seconds": time.perf_counter() - start}
+
+
+def load_fast(loader, path, out_dir):
+    """Run a fast loader like convert_file: timed, raising on failure."""
+    start = time.perf_counter()
+    result = loader(Path(path), Path(out_dir))
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,)
+            )
+            print(f"🏭 Started {workers} Docling workers ({threads} threads each)")
+        return _pool
+
+
+def _discard_pool(pool, terminate=False):
+    """
+    Drop a broken or stuck pool; the next batch starts a fresh one.
+    terminate: also kill its workers. A worker stuck in native code would
+    otherwise live on, holding its models and memory, one more per timeout.
+    Other batches still running on the pool get their files failed.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    if not terminate:
+        return
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join(timeout=5)
+    print(f"🛑 Terminated {len(processes)} stuck Docling workers")
+
+
+def convert_files(file_paths, out_dir, progress=None, workers=DOCLING_WORKERS):
+    """
+    Convert files in parallel and return one result per input path, in input
+    order: the convert_file dict on success or {"error": str} on failure.
+    Files with a fast loader are read here while the Docling pool works.
+    """
+    file_paths = [Path(p) for p in file_paths]
+    results = [None] * len(file_paths)
+    start = time.perf_counter()
+    fast = [i for i, path in enumerate(file_paths) if loader_for(path)]
+    heavy = [i for i, path in enumerate(file_paths) if not loader_for(path)]
+
+    pool = futures = None
+    if heavy and workers > 1:
+        pool = _get_pool(workers)
+        futures = {}
+        for i in heavy:
+            notify(progress, file_paths[i].name, "converting")
+            futures[pool.submit(convert_file, str(file_paths[i]), str(out_dir))] = i
+
+    for i in fast:
+        notify(progress, file_paths[i].name, "converting")
+        try:
+            results[i] = load_fast(loader_for(file_paths[i]), file_paths[i], out_dir)
+        except Exception as e:
+            results[i] = {"error": str(e)}
+        _report(progress, file_paths[i], results[i])
+
+    if heavy and workers <= 1:
+        for i in heavy:
+            notify(progress, file_paths[i].name, "converting")
+            try:
+                results[i] = convert_file(file_paths[i], out_dir)
+            except Exception as e:
+                results[i] = {"error": str(e)}
+            _report(progress, file_paths[i], results[i])
+    elif heavy:
+        # Backstop for conversions the in-worker timeout cannot interrupt
+        rounds = math.ceil(len(heavy) / workers)
+        try:
+            for future in as_completed(futures, timeout=DOCLING_FILE_TIMEOUT * (rounds + 1)):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except BrokenProcessPool as e:
+                    results[i] = {"error": f"Docling worker crashed: {e}"}
+                    _discard_pool(pool)
+                except Exception as e:
+                    results[i] = {"error": str(e)}
+                _report(progress, file_paths[i], results[i])
+        except TimeoutError:
+            _discard_pool(pool, terminate=True)
+            for i in heavy:
+                if results[i] is None:
+                    results[i] = {"error": "conversion timed out"}
+                    _report(progress, file_paths[i], results[i])
+
+    elapsed = time.perf_counter() - start
+    print(f"⚡ Converted {len(file_paths)} files in {elapsed:.1f}s "
+          f"({len(file_paths) / elapsed if elapsed else 0:.2f} files/s, {len(fast)} fast-path, "
+          f"{len(heavy)} Docling on {max(1, workers)} workers)")
+    _report_formats(file_paths, results)
+    return results
+
+
+def _report_formats(file_paths, results):
+    """Per-format files/s and MB/s of the successful conversions, also as convert_{ext} stages."""
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for path, result in zip(file_paths, results):
+        if "error" in result:
+            continue
+        fmt = path.suffix.lower().lstrip(".") or "none"
+        observe(f"convert_{fmt}", result["seconds"], "ingest")
+        totals[fmt][0] += 1
+        totals[fmt][1] += path.stat().st_size
+        totals[fmt][2] += result["seconds"]
+    for fmt, (files, size, seconds) in sorted(totals.items()):
+        rate = f"{files / seconds:.2f} files/s, {size / 1e6 / seconds:.2f} MB/s" if seconds else "instant"
+        print(f"   {fmt}: {files} files, {size / 1e6:.1f} MB in {seconds:.2f}s ({rate})")
+
+
+def _report(progress, path, result):
+    if "error" in result:
+        print(f"❌ Docling failed for {path}: {result['error']}")
+        notify(progress, path.name, "failed", error=result["error"])
+    else:
+        print(f"📸 Extracted {len(result['images'])} images from {path.name}")
+        notify(progress, path.name, "converted",
+               elements=len(result["docs"]), images=len(result["images"]),
+               tables=len(result["tables"]))
@@ -2,58 +2,191 @@
 
 print("🔧 Initializing dispatcher...")
 import os
+import shutil
 from .text_ingestion import ingest_texts
-from .images_ingestion import ingest_images
+from .images_ingestion import ingest_images, delete_images, delete_chatbot_images, drop_positional_images
+from .vectordb import vector_db
+from .registry import list_collection_names
+from .tenancy import chatbot_collection_names
+from .progress import notify
+from .telemetry import span, count_ingested
+from .manifest import (
+    chatbot_root,
+    derived_dir_for,
+    legacy_artifacts,
+    known_sha256,
+    load_upload_hashes,
+    load_manifest,
+    save_manifest,
+    diff_manifest,
+    record_file,
+)
 
 DOC_EXT = {".pdf", ".txt", ".docx", ".doc", ".xlsx", ".xls", ".csv",
         ".pptx", ".ppt", ".html", ".htm", ".rtf", ".odt", ".msg"}
 IMG_EXT = {".jpg", ".jpeg", ".png", ".bmp", ".gif"}
 
-def detect_and_ingest(user_id, chatbot_id, base_storage_path="uploads"):
-    """Ingest documents for a specific user and chatbot from the storage structure"""
+def forget_file(user_id, chatbot_id, chatbot_path, filename, documents_path):
+    """Drop the vectors and derived artifacts of one previously ingested upload"""
+    vector_db.delete_documents(
+        user_id, chatbot_id, origin=filename,
+        source=os.path.join(documents_path, filename)
+    )
+    delete_images(user_id, chatbot_id, origin=filename)
+    shutil.rmtree(derived_dir_for(chatbot_path, filename), ignore_errors=True)
+
+def move_legacy_artifacts(user_id, chatbot_id, chatbot_path, documents_path, known_uploads):
+    """
+    Move the images/tables an older text_ingestion wrote next to the uploads
+    into derived/{upload}/legacy/, where they go with their upload, and drop
+    the vectors ingested from them. Run once per chatbot.
+    """
+    names = [entry.name for entry in os.scandir(documents_path) if entry.is_file()]
+    artifacts = legacy_artifacts(names, known_uploads)
+    for name, upload in sorted(artifacts.items()):
+        path = os.path.join(documents_path, name)
+        vector_db.delete_documents(user_id, chatbot_id, origin=name, source=path)
+        delete_images(user_id, chatbot_id, origin=name)
+        target = derived_dir_for(chatbot_path, upload) / "legacy"
+        target.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target / name)
+    if artifacts:
+        print(f"🧹 Moved {len(artifacts)} legacy artifacts out of {documents_path}")
+
+def delete_chatbot(user_id, chatbot_id, base_storage_path="uploads"):
+    """
+    Drop a chatbot's collections, uploads, derived artifacts and manifest.
+    Returns False, deleting nothing, if the chatbot has neither files nor collections.
+    """
+    root = chatbot_root(base_storage_path, user_id, chatbot_id)
+    names = list_collection_names(vector_db.persist_dir)
+    if not root.is_dir() and not any(chatbot_collection_names(kind, user_id, chatbot_id, names)
+                                     for kind in ("docs", "images")):
+        return False
+    vector_db.delete_chatbot(user_id, chatbot_id)
+    delete_chatbot_images(user_id, chatbot_id)
+    shutil.rmtree(root, ignore_errors=True)
+    print(f"🗑️ Deleted chatbot {chatbot_id} of user {user_id}")
+    return True
+
+def detect_and_ingest(user_id, chatbot_id, base_storage_path="uploads", progress=None):
+    """
+    Ingest documents for a specific user and chatbot from the storage structure.
+
+    Only files whose content hash differs from the chatbot manifest are ingested;
+    new, changed and deleted files have any old vectors removed first.
+    Returns a summary dict of added/updated/removed/unchanged/failed filenames.
+    progress: optional callback(filename, stage, **info) fed by every ingestion stage.
+    """
     # Build the specific path for this user and chatbot
-    user_chatbot_path = os.path.join(base_storage_path, "users", str(user_id), str(chatbot_id), "documents")
-    
+    chatbot_path = chatbot_root(base_storage_path, user_id, chatbot_id)
+    user_chatbot_path = os.path.join(chatbot_path, "documents")
+    summary = {"added": [], "updated": [], "removed": [], "unchanged": [], "failed": []}
+
     # Check if the directory exists
     if not os.path.exists(user_chatbot_path):
         print(f"⚠️ Directory not found: {user_chatbot_path}")
-        return
-    
-    docs, imgs = [], []
-    
+        return summary
+
+    manifest = load_manifest(chatbot_path)
+    # files received through POST /chatbots were hashed while streaming in
+    upload_hashes = load_upload_hashes(chatbot_path)
+    if manifest.get("legacy_artifacts") != "moved":
+        # images/tables extracted by an older ingestion run are not uploads
+        move_legacy_artifacts(user_id, chatbot_id, chatbot_path, user_chatbot_path,
+                              set(upload_hashes) | set(manifest["files"]))
+        manifest["legacy_artifacts"] = "moved"
+        save_manifest(chatbot_path, manifest)
+
+    current = {}
+
     try:
         for fn in sorted(os.listdir(user_chatbot_path)):
             ext = os.path.splitext(fn)[1].lower()
             path = os.path.join(user_chatbot_path, fn)
-            if os.path.isfile(path):  # Only process files, not directories
-                if ext in DOC_EXT:
-                    docs.append(path)
-                elif ext in IMG_EXT:
-                    imgs.append(path)
+            if not os.path.isfile(path):  # Only process files, not directories
+                continue
+            if ext in DOC_EXT or ext in IMG_EXT:
+                current[fn] = path
     except FileNotFoundError:
         print(f"❌ Documents directory not found for user {user_id}, chatbot {chatbot_id}")
-        return
+        return summary
     except PermissionError:
         print(f"❌ Permission denied accessing documents for user {user_id}, chatbot {chatbot_id}")
-        return
+        return summary
+
+    if manifest.get("image_ids") != "content":
+        # chatbots ingested before image ids were content hashes may have lost
+        # images to reused ids: start every upload over, once
+        if drop_positional_images(user_id, chatbot_id):
+            for fn in list(manifest["files"]):
+                forget_file(user_id, chatbot_id, chatbot_path, fn, user_chatbot_path)
+                manifest["files"].pop(fn)
+        manifest["image_ids"] = "content"
+        save_manifest(chatbot_path, manifest)
+    hashes = {}
+    with span("hashing", "ingest"):
+        for fn, path in current.items():
+            notify(progress, fn, "hashing")
+            hashes[fn] = known_sha256(upload_hashes, fn, path)
+    added, changed, unchanged, removed = diff_manifest(manifest, hashes)
+    summary.update(added=added, updated=changed, removed=removed, unchanged=unchanged)
+
+    print(f"📊 {len(added)} new, {len(changed)} changed, {len(removed)} deleted, "
+          f"{len(unchanged)} unchanged files for user {user_id}, chatbot {chatbot_id}")
+
+    for fn in unchanged:
+        notify(progress, fn, "skipped")
 
-    print(f"📊 Found {len(docs)} documents and {len(imgs)} images for user {user_id}, chatbot {chatbot_id}")
+    # files new to the manifest can still have vectors: chatbots ingested
+    # before the manifest existed, tenants moved by migrate_tenants.py, or a
+    # run that died before recording them. Forget those too, or they double.
+    with span("forget", "ingest"):
+        for fn in added + changed + removed:
+            forget_file(user_id, chatbot_id, chatbot_path, fn, user_chatbot_path)
+            manifest["files"].pop(fn, None)
+            if fn in removed:
+                notify(progress, fn, "removed")
+    if changed or removed:
+        manifest["version"] += 1
+        save_manifest(chatbot_path, manifest)
+
+    to_ingest = added + changed
+    for fn in to_ingest:
+        notify(progress, fn, "queued")
+    docs = [current[fn] for fn in to_ingest if os.path.splitext(fn)[1].lower() in DOC_EXT]
+    imgs = [current[fn] for fn in to_ingest if os.path.splitext(fn)[1].lower() in IMG_EXT]
 
     if imgs:
         print(f"🖼️ Images detected → image ingestion for user {user_id}, chatbot {chatbot_id}")
-        ingest_images(user_id=user_id, chatbot_id=chatbot_id, file_paths=imgs)
+        ingest_images(user_id=user_id, chatbot_id=chatbot_id, file_paths=imgs, progress=progress,
+                      base_storage=base_storage_path)
 
+    failed = []
     if docs:
         print(f"📚 Docs detected → text ingestion for user {user_id}, chatbot {chatbot_id}")
-        ingest_texts(user_id=user_id, chatbot_id=chatbot_id, file_paths=docs)
+        failed = ingest_texts(user_id=user_id, chatbot_id=chatbot_id, file_paths=docs,
+                              base_storage=base_storage_path, progress=progress)
+    summary["failed"] = [os.path.basename(path) for path in failed]
+    count_ingested("files", len(to_ingest) - len(failed))
+
+    if to_ingest:
+        for fn in to_ingest:
+            if fn in summary["failed"]:
+                continue
+            kind = "image" if current[fn] in imgs else "document"
+            record_file(manifest, fn, hashes[fn], os.path.getsize(current[fn]), kind)
+        manifest["version"] += 1
+        save_manifest(chatbot_path, manifest)
 
-    if not docs and not imgs:
+    if not current and not removed:
         print(f"⚠️ No documents or images found in {user_chatbot_path}")
+    return summary
 
 if __name__ == "__main__":
     # Example usage options:
-    
+
     # Option 1: Process specific user and chatbot
     user_id = "1"  # Replace with actual user ID
     chatbot_id = "1"  # Replace with actual chatbot ID
-    detect_and_ingest(user_id, chatbot_id, "uploads")
\ No newline at end of file
+    detect_and_ingest(user_id, chatbot_id, "uploads")
@@ -0,0 +1,265 @@
+#embedding_backends.py
+"""
+Selectable text and image embedding backends.
+
+TEXT_EMBEDDING_BACKEND / IMAGE_EMBEDDING_BACKEND pick one of the specs below.
+Besides the full-size fp32 models there are smaller models, int8 dynamic
+quantization of the PyTorch weights, and ONNX Runtime exports (optionally
+int8-quantized) that are built once under EMBEDDING_MODEL_DIR. Vectors of
+different backends never share a collection: every backend other than the
+original default gets its own collection name suffix (see tenancy.py), and
+reembed.py copies a chatbot's chunks and images from one backend to another.
+"""
+import os
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_TEXT_BACKEND = "instructor-xl"
+DEFAULT_IMAGE_BACKEND = "openclip-vit-h-14"
+
+TEXT_EMBEDDING_BACKEND = os.getenv("TEXT_EMBEDDING_BACKEND", DEFAULT_TEXT_BACKEND)
+IMAGE_EMBEDDING_BACKEND = os.getenv("IMAGE_EMBEDDING_BACKEND", DEFAULT_IMAGE_BACKEND)
+# ONNX exports and quantized weights are written here once per backend
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", os.path.join("database", "models"))
+# ONNX Runtime intra-op threads (0 = let ONNX Runtime decide)
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+ONNX_BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+INSTRUCTOR_DOC_PROMPT = "Represent the document for retrieval:"
+INSTRUCTOR_QUERY_PROMPT = "Represent the question for retrieving supporting documents:"
+BGE_QUERY_PROMPT = "Represent this sentence for searching relevant passages: "
+
+# runtime: "torch" (sentence-transformers) or "onnx"; quantize: None or "int8";
+# cache_name: key under which the embedding cache stores this backend's vectors
+TEXT_BACKENDS = {
+    "instructor-xl": {
+        "model": "hkunlp/instructor-xl", "runtime": "torch", "quantize": None,
+        "doc_prompt": INSTRUCTOR_DOC_PROMPT, "query_prompt": INSTRUCTOR_QUERY_PROMPT,
+        "cache_name": "hkunlp/instructor-xl",
+    },
+    "instructor-xl-int8": {
+        "model": "hkunlp/instructor-xl", "runtime": "torch", "quantize": "int8",
+        "doc_prompt": INSTRUCTOR_DOC_PROMPT, "query_prompt": INSTRUCTOR_QUERY_PROMPT,
+    },
+    "bge-small": {
+        "model": "BAAI/bge-small-en-v1.5", "runtime": "torch", "quantize": None,
+        "doc_prompt": "", "query_prompt": BGE_QUERY_PROMPT,
+    },
+    "bge-small-onnx": {
+        "model": "BAAI/bge-small-en-v1.5", "runtime": "onnx", "quantize": None, "pooling": "cls",
+        "doc_prompt": "", "query_prompt": BGE_QUERY_PROMPT,
+    },
+    "bge-small-onnx-int8": {
+        "model": "BAAI/bge-small-en-v1.5", "runtime": "onnx", "quantize": "int8", "pooling": "cls",
+        "doc_prompt": "", "query_prompt": BGE_QUERY_PROMPT,
+    },
+    "bge-base-onnx-int8": {
+        "model": "BAAI/bge-base-en-v1.5", "runtime": "onnx", "quantize": "int8", "pooling": "cls",
+        "doc_prompt": "", "query_prompt": BGE_QUERY_PROMPT,
+    },
+    "minilm-onnx-int8": {
+        "model": "sentence-transformers/all-MiniLM-L6-v2", "runtime": "onnx", "quantize": "int8",
+        "pooling": "mean", "doc_prompt": "", "query_prompt": "",
+    },
+}
+
+IMAGE_BACKENDS = {
+    "openclip-vit-h-14": {"model": "ViT-H-14", "checkpoint": "laion2b_s32b_b79k", "quantize": None},
+    "openclip-vit-b-32": {"model": "ViT-B-32", "checkpoint": "laion2b_s34b_b79k", "quantize": None},
+    "openclip-vit-b-32-int8": {"model": "ViT-B-32", "checkpoint": "laion2b_s34b_b79k", "quantize": "int8"},
+}
+
+
+def text_backend(name=None):
+    name = name or TEXT_EMBEDDING_BACKEND
+    if name not in TEXT_BACKENDS:
+        raise ValueError(f"Unknown text embedding backend {name!r}; choose from {sorted(TEXT_BACKENDS)}")
+    return name, TEXT_BACKENDS[name]
+
+
+def image_backend(name=None):
+    name = name or IMAGE_EMBEDDING_BACKEND
+    if name not in IMAGE_BACKENDS:
+        raise ValueError(f"Unknown image embedding backend {name!r}; choose from {sorted(IMAGE_BACKENDS)}")
+    return name, IMAGE_BACKENDS[name]
+
+
+def backend_for(kind, name=None):
+    """Resolved backend name for a collection kind ("docs" or "images")."""
+    return text_backend(name)[0] if kind == "docs" else image_backend(name)[0]
+
+
+def default_backend(kind):
+    return DEFAULT_TEXT_BACKEND if kind == "docs" else DEFAULT_IMAGE_BACKEND
+
+
+def cache_name(name=None):
+    name, spec = text_backend(name)
+    return spec.get("cache_name", name)
+
+
+def _quantize_int8(module):
+    """int8 dynamic quantization of a PyTorch module's Linear layers, in place."""
+    import torch
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_text_backend(name=None):
+    """LangChain Embeddings for a text backend."""
+    name, spec = text_backend(name)
+    if spec["runtime"] == "onnx":
+        return OnnxEmbeddings(name, spec)
+
+    import torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    # int8 dynamic quantization only runs on CPU
+    device = "cuda" if torch.cuda.is_available() and not spec["quantize"] else "cpu"
+    embeddings = HuggingFaceEmbeddings(
+        model_name=spec["model"],
+        model_kwargs={'device': device},
+        encode_kwargs={
+            "prompt": spec["doc_prompt"],
+            "normalize_embeddings": True
+        },
+        query_encode_kwargs={
+            "prompt": spec["query_prompt"],
+            "normalize_embeddings": True
+        }
+    )
+    if spec["quantize"] == "int8":
+        _quantize_int8(embeddings._client)
+    return embeddings
+
+
+def load_image_backend(name=None):
+    """Chroma embedding function for an image backend."""
+    name, spec = image_backend(name)
+    from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+
+    if spec["quantize"] == "int8":
+        embedding = OpenCLIPEmbeddingFunction(model_name=spec["model"], checkpoint=spec["checkpoint"], device="cpu")
+        _quantize_int8(embedding._model)
+        return embedding
+    return OpenCLIPEmbeddingFunction(model_name=spec["model"], checkpoint=spec["checkpoint"])
+
+
+def encode_image_batch(embedding, images):
+    """
+    Normalized OpenCLIP vectors for RGB arrays in one forward pass. Chroma's
+    embedding function runs the model once per image; this stacks the
+    preprocessed batch instead and gives the same vectors.
+    """
+    model = getattr(embedding, "_model", None)
+    preprocess = getattr(embedding, "_preprocess", None)
+    if model is None or preprocess is None:
+        return embedding(images)
+
+    import numpy as np
+    import torch
+    from PIL import Image
+
+    batch = torch.stack([preprocess(Image.fromarray(image)) for image in images])
+    with torch.no_grad():
+        features = model.encode_image(batch.to(getattr(embedding, "device", "cpu")))
+        features /= features.norm(dim=-1, keepdim=True)
+    return [np.asarray(row, dtype=np.float32) for row in features.cpu().numpy()]
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings served by ONNX Runtime. The Hugging Face encoder is
+    exported (and int8-quantized if asked) on first use; afterwards only the
+    tokenizer and the .onnx file are loaded, without PyTorch weights.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.encode_kwargs = {"prompt": spec["doc_prompt"]}
+        self.query_encode_kwargs = {"prompt": spec["query_prompt"]}
+        model_path = self._ensure_exported(os.path.join(EMBEDDING_MODEL_DIR, name))
+
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(os.path.dirname(model_path), "tokenizer.json"))
+        self.tokenizer.enable_truncation(spec.get("max_length", 512))
+        self.tokenizer.enable_padding()
+
+    def _ensure_exported(self, out_dir):
+        fp32_path = os.path.join(out_dir, "model.onnx")
+        int8_path = os.path.join(out_dir, "model_int8.onnx")
+        target = int8_path if self.spec["quantize"] == "int8" else fp32_path
+        if os.path.exists(target):
+            return target
+
+        os.makedirs(out_dir, exist_ok=True)
+        if not os.path.exists(fp32_path):
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+
+            print(f"📦 Exporting {self.spec['model']} to ONNX in {out_dir}")
+            tokenizer = AutoTokenizer.from_pretrained(self.spec["model"])
+            model = AutoModel.from_pretrained(self.spec["model"]).eval()
+            sample = tokenizer(["warm up"], return_tensors="pt")
+            tmp = fp32_path + ".tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    (sample["input_ids"], sample["attention_mask"]),
+                    tmp,
+                    input_names=["input_ids", "attention_mask"],
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "last_hidden_state": {0: "batch", 1: "sequence"},
+                    },
+                    opset_version=17,
+                )
+            os.replace(tmp, fp32_path)
+            tokenizer.save_pretrained(out_dir)
+
+        if target == int8_path:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            print(f"📦 Quantizing {fp32_path} to int8")
+            tmp = int8_path + ".tmp"
+            quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+            os.replace(tmp, int8_path)
+        return target
+
+    def _encode(self, texts, prompt):
+        import numpy as np
+
+        vectors = []
+        for i in range(0, len(texts), ONNX_BATCH_SIZE):
+            encodings = self.tokenizer.encode_batch([prompt + text for text in texts[i:i + ONNX_BATCH_SIZE]])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+            if self.spec.get("pooling") == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = attention_mask[:, :, None].astype(hidden.dtype)
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.extend(pooled.tolist())
+        return vectors
+
+    def embed_documents(self, texts):
+        return self._encode(list(texts), self.encode_kwargs["prompt"])
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        return self._encode(list(texts), self.query_encode_kwargs["prompt"])
@@ -0,0 +1,207 @@
+#embedding_cache.py
+"""
+Persistent embedding cache.
+
+Vectors are stored in SQLite keyed by sha256(model, instruction prompt, text),
+with an in-memory LRU in front. CachedEmbeddings wraps any LangChain
+Embeddings so documents, sentence windows and repeated questions are only
+encoded once across uploads, chatbots and restarts.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join("database", "embedding_cache.sqlite3"))
+# Rows kept on disk; the least recently used are evicted past this
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+# Vectors kept in the in-memory LRU front
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "20000"))
+# Memory hits whose last_used is written to disk in one batch
+_TOUCH_BATCH = 1000
+
+
+def cache_key(model_name, prompt, text):
+    h = hashlib.sha256()
+    for part in (model_name, prompt or "", text):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                 memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        # {key: time} of memory hits not yet written to last_used on disk
+        self._touched = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, model TEXT, vector BLOB, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+        self._rows = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """Write last_used of the pending memory hits; the caller commits."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys that are cached."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self._touched[key] = now
+                    found[key] = vector
+            self.memory_hits += len(found)
+            missing = list(dict.fromkeys(missing))
+
+            if missing:
+                # SQLite caps bound parameters, so look up in slices
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                        self._touched[key] = now
+                self._flush_touched()
+                self._db.commit()
+                self.disk_hits += sum(1 for key in missing if key in found)
+                self.misses += sum(1 for key in missing if key not in found)
+            elif len(self._touched) >= _TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+        return found
+
+    def put_many(self, model_name, items):
+        """Store {key: vector} and evict the least recently used rows past the cap."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            rows = []
+            for key, vector in items.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model_name, vector.tobytes(), now))
+            # so eviction sees the rows served from memory as recently used
+            self._flush_touched()
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._rows += self._db.total_changes - before
+            overflow = self._rows - self.max_entries
+            if overflow > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._rows -= overflow
+                self.evictions += overflow
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "path": self.path,
+                "entries": self._rows,
+                "max_entries": self.max_entries,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings that consult an EmbeddingCache before the model."""
+
+    def __init__(self, base, model_name, cache):
+        self.base = base
+        self.model_name = model_name
+        self.cache = cache
+        self.doc_prompt = getattr(base, "encode_kwargs", {}).get("prompt", "")
+        self.query_prompt = getattr(base, "query_encode_kwargs", {}).get("prompt", "")
+
+    def _cached(self, texts, prompt, compute):
+        keys = [cache_key(self.model_name, prompt, text) for text in texts]
+        found = self.cache.get_many(keys)
+        todo = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                todo.setdefault(key, text)
+        if todo:
+            computed = compute(list(todo.values()))
+            fresh = dict(zip(todo.keys(), computed))
+            self.cache.put_many(self.model_name, fresh)
+            found.update(fresh)
+        return [np.asarray(found[key], dtype=np.float32).tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        return self._cached(texts, self.doc_prompt, self.base.embed_documents)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        """Many questions under the query prompt, uncached ones in one batch."""
+        return self._cached(texts, self.query_prompt, lambda todo: embed_queries(self.base, todo))
+
+
+def embed_queries(embeddings, texts):
+    """Batch query embedding for any LangChain Embeddings."""
+    if hasattr(embeddings, "embed_queries"):
+        return embeddings.embed_queries(texts)
+    if hasattr(embeddings, "_embed") and hasattr(embeddings, "query_encode_kwargs"):
+        # HuggingFaceEmbeddings: one encode() call with the query prompt
+        encode_kwargs = embeddings.query_encode_kwargs or embeddings.encode_kwargs
+        return embeddings._embed(texts, encode_kwargs)
+    return [embeddings.embed_query(text) for text in texts]
@@ -0,0 +1,88 @@
+#image_variants.py
+"""
+Size-capped image variants for the LLM payload.
+
+At ingest time every image gets a downscaled JPEG/WebP preview under the
+chatbot's derived folder. At query time the ready data URIs are served from
+an LRU keyed by (path, mtime), so a question no longer re-reads and
+base64-encodes full-size PNGs.
+"""
+import base64
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from PIL import Image
+
+# Longest side of the preview sent to the LLM, in pixels
+IMAGE_MAX_DIM = int(os.getenv("IMAGE_MAX_DIM", "1024"))
+# "JPEG" or "WEBP"
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "JPEG").upper()
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_URI_CACHE_SIZE = int(os.getenv("IMAGE_URI_CACHE_SIZE", "256"))
+
+_MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+_EXT = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def _encode_variant(path):
+    """
+    Downscaled, re-encoded bytes of the image at path, as (bytes, format).
+    A JPEG/WebP that already fits the cap is kept as-is when re-encoding
+    would not make it smaller.
+    """
+    with Image.open(path) as img:
+        original_format = img.format
+        fits = max(img.size) <= IMAGE_MAX_DIM
+        img.thumbnail((IMAGE_MAX_DIM, IMAGE_MAX_DIM))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format=IMAGE_VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY, optimize=True)
+    data = buf.getvalue()
+    if fits and original_format in _MIME and os.path.getsize(path) <= len(data):
+        with open(path, "rb") as f:
+            return f.read(), original_format
+    return data, IMAGE_VARIANT_FORMAT
+
+
+def prepare_variant(path, out_dir):
+    """Write the preview of one image into out_dir and return its path (None on failure)."""
+    out_dir = Path(out_dir)
+    try:
+        for fmt in _EXT:
+            existing = out_dir / (Path(path).stem + _EXT[fmt])
+            if existing.exists() and existing.stat().st_mtime >= os.stat(path).st_mtime:
+                return str(existing)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        data, fmt = _encode_variant(path)
+        target = out_dir / (Path(path).stem + _EXT[fmt])
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+        return str(target)
+    except Exception as e:
+        print(f"⚠️ Failed to prepare preview for {path}: {e}")
+        return None
+
+
+def prepare_variants(paths, out_dirs, workers=4):
+    """prepare_variant over many images; PIL releases the GIL while resizing."""
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(prepare_variant, paths, out_dirs))
+
+
+@lru_cache(maxsize=IMAGE_URI_CACHE_SIZE)
+def _data_uri(path, mtime_ns):
+    # previews come back unchanged; images ingested before previews existed
+    # are downscaled here instead
+    data, fmt = _encode_variant(path)
+    return f"data:{_MIME[fmt]};base64,{base64.b64encode(data).decode()}"
+
+
+def image_data_uri(path):
+    """Cached data URI of the size-capped version of an image."""
+    return _data_uri(path, os.stat(path).st_mtime_ns)
@@ -1,38 +1,187 @@
 # images_ingestion.py
 print("🔧 Initializing image ingestion...")
-import chromadb
 from tqdm import tqdm
+import hashlib
+import io
 import os
-from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
-from chromadb.utils.data_loaders import ImageLoader
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from .registry import get_image_collection, get_image_embedding, drop_collection, list_collection_names
+from .embedding_backends import encode_image_batch
+from .tenancy import tenant_collection_name, chatbot_collection_names
+from .progress import notify
+from .manifest import chatbot_root, DERIVED_DIR
+from .image_variants import prepare_variants
+from .telemetry import span, count_ingested
 
-def ingest_images(user_id, chatbot_id, file_paths=[], persist_dir="database"):
+# Images decoded and embedded per OpenCLIP call; bounds memory on large sets
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", "32"))
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", "4"))
+# Images are downscaled to this before embedding; OpenCLIP looks at 224 px anyway
+IMAGE_DECODE_MAX_DIM = int(os.getenv("IMAGE_DECODE_MAX_DIM", "1024"))
+IMAGE_ID_RE = re.compile(r"img_[0-9a-f]{32}_[0-9a-f]{8}")
+
+def image_id(digest, origin):
+    """
+    Stable vector id: the image's content hash plus the upload it came from,
+    so the same picture in two uploads gets two entries that are deleted
+    independently, and re-ingesting an upload overwrites instead of duplicating.
+    """
+    return f"img_{digest[:32]}_{hashlib.sha1(origin.encode('utf-8')).hexdigest()[:8]}"
+
+def drop_positional_images(user_id, chatbot_id, persist_dir="database", page_size=1000):
+    """
+    Delete image vectors still stored under the old positional ids
+    (img_{user}_{chatbot}_{i}) and return how many there were. Each
+    ingestion run restarted i at 0, so the images of a later batch were
+    dropped as duplicates of an earlier batch's ids; which uploads lost
+    images cannot be told from what is left.
+    """
+    collection = get_image_collection(tenant_collection_name("images", user_id, chatbot_id), persist_dir,
+                                      create=False)
+    if collection is None:
+        return 0
+    stale = []
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        stale.extend(vector_id for vector_id in page["ids"] if not IMAGE_ID_RE.fullmatch(vector_id))
+        offset += len(page["ids"])
+    for i in range(0, len(stale), page_size):
+        collection.delete(ids=stale[i:i + page_size])
+    if stale:
+        print(f"🧹 Dropped {len(stale)} positional image ids for user {user_id}, chatbot {chatbot_id}")
+    return len(stale)
+
+def _hash_and_decode(path):
+    """(sha256 hex, RGB array) of one image file, or (None, None) if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG draft mode decodes straight at a reduced scale
+            img.draft("RGB", (IMAGE_DECODE_MAX_DIM, IMAGE_DECODE_MAX_DIM))
+            img = img.convert("RGB")
+            img.thumbnail((IMAGE_DECODE_MAX_DIM, IMAGE_DECODE_MAX_DIM))
+            return digest, np.asarray(img)
+    except Exception as e:
+        print(f"⚠️ Skipping unreadable image {path}: {e}")
+        return None, None
+
+def _decoded_batches(pool, file_paths, batch_size):
+    """Yield (start, [(digest, array)]) per batch, decoding the next batch while the caller embeds."""
+    batches = [file_paths[i:i + batch_size] for i in range(0, len(file_paths), batch_size)]
+    pending = pool.map(_hash_and_decode, batches[0]) if batches else None
+    for n in range(len(batches)):
+        decoded = list(pending)
+        if n + 1 < len(batches):
+            pending = pool.map(_hash_and_decode, batches[n + 1])
+        yield n * batch_size, decoded
+
+def ingest_images(user_id, chatbot_id, file_paths=[], persist_dir="database", origins=None,
+                  progress=None, base_storage="uploads"):
+    """
+    origins: uploaded filename each image belongs to (defaults to the image's own name),
+    used to delete the vectors again when that upload changes.
+    progress: optional callback(filename, stage, **info), called per origin.
+    base_storage: uploads root; size-capped LLM previews go to derived/{origin}/previews.
+
+    Images are hashed and decoded on a thread pool and embedded IMAGE_BATCH_SIZE
+    at a time; vectors are upserted under content-hash ids (see image_id).
+    """
     if not file_paths:
         print("⚠️ No images to ingest!")
         return
 
-    client = chromadb.PersistentClient(path=persist_dir)
-    embedding_fn = OpenCLIPEmbeddingFunction()
-    image_loader = ImageLoader()
-
-    # separate collection for images
-    collection = client.get_or_create_collection(
-        name="images_collection",
-        embedding_function=embedding_fn,
-        data_loader=image_loader
-    )
+    # the chatbot's own images collection, shared OpenCLIP model from the registry
+    collection = get_image_collection(tenant_collection_name("images", user_id, chatbot_id), persist_dir)
+    embed = get_image_embedding()
 
-    ids = [f"img_{user_id}_{chatbot_id}_{i}" for i in range(len(file_paths))]
-    uris = file_paths
+    if origins is None:
+        origins = [os.path.basename(path) for path in file_paths]
 
-    metadatas = [{
-        "user_id": str(user_id),
-        "chatbot_id": str(chatbot_id),
-        "content_type": "image",
-        "source": os.path.basename(path)
-    } for path in file_paths]
+    derived = chatbot_root(base_storage, user_id, chatbot_id) / DERIVED_DIR
+    with span("image_previews", "ingest"):
+        previews = prepare_variants(file_paths, [derived / origin / "previews" for origin in origins])
 
     print(f"📦 Adding {len(file_paths)} images for user {user_id}, chatbot {chatbot_id}...")
-    collection.add(ids=ids, uris=uris, metadatas=metadatas)
+    for origin in sorted(set(origins)):
+        notify(progress, origin, "embedding")
+
+    seen = set()
+    stored = skipped = 0
+    with ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix="img-decode") as pool:
+        for offset, decoded in _decoded_batches(pool, file_paths, IMAGE_BATCH_SIZE):
+            ids, uris, metadatas, arrays = [], [], [], []
+            for i, (digest, array) in enumerate(decoded, start=offset):
+                if digest is None:
+                    continue
+                vector_id = image_id(digest, origins[i])
+                if vector_id in seen:
+                    # same picture repeated within one upload (logos, page headers)
+                    continue
+                seen.add(vector_id)
+                metadata = {
+                    "user_id": str(user_id),
+                    "chatbot_id": str(chatbot_id),
+                    "content_type": "image",
+                    "source": os.path.basename(file_paths[i]),
+                    "origin": origins[i],
+                    "content_hash": digest
+                }
+                if previews[i]:
+                    metadata["preview_path"] = previews[i]
+                ids.append(vector_id)
+                uris.append(file_paths[i])
+                metadatas.append(metadata)
+                arrays.append(array)
+            if not ids:
+                continue
+
+            # already embedded by an earlier run: nothing to redo
+            existing = set(collection.get(ids=ids, include=[])["ids"])
+            keep = [j for j, vector_id in enumerate(ids) if vector_id not in existing]
+            skipped += len(ids) - len(keep)
+            if not keep:
+                continue
+            with span("image_embedding", "ingest"):
+                embeddings = encode_image_batch(embed, [arrays[j] for j in keep])
+            collection.upsert(
+                ids=[ids[j] for j in keep],
+                embeddings=embeddings,
+                uris=[uris[j] for j in keep],
+                metadatas=[metadatas[j] for j in keep]
+            )
+            stored += len(keep)
+
+    count_ingested("images", stored)
+    for origin in sorted(set(origins)):
+        notify(progress, origin, "done")
+
+    print(f"✅ Image ingestion complete for user {user_id}, chatbot {chatbot_id}: "
+          f"{stored} embedded, {skipped} already present.")
+
+def delete_images(user_id, chatbot_id, origin, persist_dir="database"):
+    """Remove every image vector that came from one uploaded file."""
+    collection = get_image_collection(tenant_collection_name("images", user_id, chatbot_id), persist_dir,
+                                      create=False)
+    if collection is None:
+        return
+    collection.delete(where={
+        "$or": [
+            {"origin": {"$eq": origin}},
+            # direct uploads ingested before the origin field existed
+            {"source": {"$eq": origin}}
+        ]
+    })
+    print(f"🗑️ Removed {origin} images for user {user_id}, chatbot {chatbot_id}")
 
-    print(f"✅ Image ingestion complete for user {user_id}, chatbot {chatbot_id}.")
+def delete_chatbot_images(user_id, chatbot_id, persist_dir="database"):
+    """Drop the chatbot's whole images collection, for every embedding backend."""
+    for name in chatbot_collection_names("images", user_id, chatbot_id, list_collection_names(persist_dir)):
+        drop_collection(name, persist_dir)
@@ -0,0 +1,152 @@
+#jobs.py
+"""
+Background ingestion jobs.
+
+POST /chatbots hands the ingestion to a bounded thread pool and returns a job
+ID immediately; GET /jobs/{id} reads the progress recorded here. Jobs for the
+same chatbot run one after another so they never race on its manifest: they
+wait in a per-chatbot queue, and only its head is handed to the pool, so a
+burst for one chatbot never ties up workers that other chatbots could use.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from .dispatcher import detect_and_ingest, delete_chatbot
+from .answer_cache import answer_cache
+from .telemetry import tenant, span
+
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "2"))
+# Finished jobs kept around for status queries before the oldest are dropped
+MAX_FINISHED_JOBS = int(os.getenv("INGEST_MAX_FINISHED_JOBS", "500"))
+
+_executor = ThreadPoolExecutor(max_workers=INGEST_MAX_WORKERS, thread_name_prefix="ingest")
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_chatbot_locks = {}
+# (user_id, chatbot_id) -> jobs waiting behind the one in the pool
+_chatbot_queues = {}
+
+
+class IngestionJob:
+    def __init__(self, user_id, chatbot_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = str(user_id)
+        self.chatbot_id = str(chatbot_id)
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.files = {}
+        self.summary = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def progress(self, filename, stage, **info):
+        """Callback handed down the ingestion pipeline, one call per stage change."""
+        now = time.time()
+        with self._lock:
+            entry = self.files.setdefault(filename, {"started_at": now})
+            entry["stage"] = stage
+            entry["elapsed"] = round(now - entry["started_at"], 3)
+            entry.update(info)
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.id,
+                "user_id": self.user_id,
+                "chatbot_id": self.chatbot_id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "elapsed": round(end - self.started_at, 3) if self.started_at else 0.0,
+                "files": {name: dict(entry) for name, entry in self.files.items()},
+                "summary": self.summary,
+                "error": self.error,
+            }
+
+
+def _chatbot_lock(user_id, chatbot_id):
+    key = (str(user_id), str(chatbot_id))
+    with _jobs_lock:
+        lock = _chatbot_locks.get(key)
+        if lock is None:
+            lock = _chatbot_locks[key] = threading.Lock()
+        return lock
+
+
+def _prune_finished():
+    finished = [job_id for job_id, job in _jobs.items() if job.finished_at]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+
+def _run_next(key):
+    """Run the chatbot's next queued job, then hand the one after it back to the pool."""
+    with _jobs_lock:
+        job, base_storage_path = _chatbot_queues[key].popleft()
+    try:
+        _run(job, base_storage_path)
+    finally:
+        with _jobs_lock:
+            if _chatbot_queues[key]:
+                # back of the pool's queue: other chatbots' jobs go first
+                _executor.submit(_run_next, key)
+            else:
+                del _chatbot_queues[key]
+
+
+def _run(job, base_storage_path):
+    # only held against delete_chatbot_now; jobs of one chatbot never overlap
+    with _chatbot_lock(job.user_id, job.chatbot_id):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            with tenant(job.user_id, job.chatbot_id), span("total", "ingest", job_id=job.id):
+                job.summary = detect_and_ingest(
+                    job.user_id, job.chatbot_id, base_storage_path, progress=job.progress
+                )
+            job.status = "succeeded"
+            # other workers notice through the manifest mtime; drop ours right away
+            answer_cache.invalidate(job.user_id, job.chatbot_id)
+        except Exception as e:
+            print(f"❌ Ingestion job {job.id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            print(f"⏱️ Ingestion job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s")
+
+
+def submit_ingestion(user_id, chatbot_id, base_storage_path="uploads"):
+    """Queue detect_and_ingest for one chatbot and return the job ID."""
+    job = IngestionJob(user_id, chatbot_id)
+    key = (job.user_id, job.chatbot_id)
+    with _jobs_lock:
+        _prune_finished()
+        _jobs[job.id] = job
+        waiting = _chatbot_queues.get(key)
+        if waiting is None:
+            waiting = _chatbot_queues[key] = deque()
+            _executor.submit(_run_next, key)
+        waiting.append((job, base_storage_path))
+    return job.id
+
+
+def delete_chatbot_now(user_id, chatbot_id, base_storage_path="uploads"):
+    """Delete a chatbot once any ingestion running for it has finished; False if it does not exist."""
+    with _chatbot_lock(user_id, chatbot_id):
+        deleted = delete_chatbot(user_id, chatbot_id, base_storage_path)
+        answer_cache.invalidate(user_id, chatbot_id)
+    return deleted
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    return job.to_dict() if job else None
@@ -0,0 +1,175 @@
+#lexical.py
+"""
+Per-chatbot BM25 index next to the dense vectors.
+
+Dense instructor-xl similarity misses exact identifiers, part numbers and
+table cells; a small inverted index catches them. Each chatbot gets its own
+SQLite file under {persist_dir}/lexical/, updated incrementally by
+VectorDB.store_documents / delete_documents with the same IDs as Chroma, so
+the two result lists can be fused by reciprocal rank (see retriever.py).
+Document frequencies and corpus totals are kept as running counters, so a
+query only touches the postings of its own terms.
+"""
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from langchain.schema import Document
+
+LEXICAL_DIR = "lexical"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Terms found in more than this share of chunks are skipped when rarer ones exist
+BM25_MAX_DF_RATIO = float(os.getenv("BM25_MAX_DF_RATIO", "0.5"))
+
+# Words plus identifiers such as "AB-1234", "v2.3.1" or "10/2024" kept whole
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_PART_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercased tokens; compound identifiers also yield their parts."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def index_path(collection_name, persist_dir):
+    return os.path.join(persist_dir, LEXICAL_DIR, f"{collection_name}.sqlite3")
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id TEXT PRIMARY KEY, origin TEXT, source TEXT, length INTEGER,"
+            " content TEXT, metadata TEXT);"
+            "CREATE INDEX IF NOT EXISTS docs_origin ON docs(origin);"
+            "CREATE INDEX IF NOT EXISTS docs_source ON docs(source);"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT, doc_id TEXT, tf INTEGER, PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings(doc_id);"
+            "CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER);"
+            "INSERT OR IGNORE INTO totals VALUES ('docs', 0), ('length', 0);"
+        )
+        self._db.commit()
+
+    def _totals(self):
+        rows = dict(self._db.execute("SELECT name, value FROM totals").fetchall())
+        return rows.get("docs", 0), rows.get("length", 0)
+
+    def count(self):
+        with self._lock:
+            return self._totals()[0]
+
+    def add(self, ids, texts, metadatas):
+        """Index chunks under the IDs they were given in Chroma."""
+        docs, postings, dfs = [], [], Counter()
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            metadata = metadata or {}
+            counts = Counter(tokenize(text))
+            docs.append((doc_id, metadata.get("origin", ""), metadata.get("source", ""),
+                         sum(counts.values()), text, json.dumps(metadata)))
+            postings.extend((term, doc_id, tf) for term, tf in counts.items())
+            dfs.update(counts.keys())
+        with self._lock, self._db:
+            self._db.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?, ?)", docs)
+            self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self._db.executemany(
+                "INSERT INTO terms VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                dfs.items()
+            )
+            self._db.execute("UPDATE totals SET value = value + ? WHERE name = 'docs'", (len(docs),))
+            self._db.execute("UPDATE totals SET value = value + ? WHERE name = 'length'",
+                             (sum(doc[3] for doc in docs),))
+
+    def delete(self, origin, source=None):
+        """Remove every chunk of one uploaded file; returns how many were removed."""
+        with self._lock, self._db:
+            if source:
+                rows = self._db.execute(
+                    "SELECT id, length FROM docs WHERE origin = ? OR source = ?", (origin, source)
+                ).fetchall()
+            else:
+                rows = self._db.execute("SELECT id, length FROM docs WHERE origin = ?", (origin,)).fetchall()
+            for doc_id, _ in rows:
+                terms = self._db.execute("SELECT term FROM postings WHERE doc_id = ?", (doc_id,)).fetchall()
+                self._db.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", terms)
+                self._db.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._db.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+            if rows:
+                self._db.execute("DELETE FROM terms WHERE df <= 0")
+                self._db.execute("UPDATE totals SET value = value - ? WHERE name = 'docs'", (len(rows),))
+                self._db.execute("UPDATE totals SET value = value - ? WHERE name = 'length'",
+                                 (sum(length for _, length in rows),))
+            return len(rows)
+
+    def search(self, query, k=5):
+        """Top k chunks by BM25 as Documents, best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs, total_length = self._totals()
+            if not terms or not n_docs:
+                return []
+            marks = ",".join("?" * len(terms))
+            dfs = dict(self._db.execute(
+                f"SELECT term, df FROM terms WHERE term IN ({marks})", list(terms)
+            ).fetchall())
+            if not dfs:
+                return []
+            rare = {t: df for t, df in dfs.items() if df <= BM25_MAX_DF_RATIO * n_docs}
+            dfs = rare or dfs
+            marks = ",".join("?" * len(dfs))
+            postings = self._db.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p"
+                f" JOIN docs d ON d.id = p.doc_id WHERE p.term IN ({marks})", list(dfs)
+            ).fetchall()
+
+            avg_length = total_length / n_docs or 1.0
+            idf = {t: math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for t, df in dfs.items()}
+            scores = {}
+            for term, doc_id, tf, length in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            top = sorted(scores, key=scores.get, reverse=True)[:k]
+            if not top:
+                return []
+            marks = ",".join("?" * len(top))
+            rows = {row[0]: row for row in self._db.execute(
+                f"SELECT id, content, metadata FROM docs WHERE id IN ({marks})", top
+            ).fetchall()}
+        return [
+            Document(id=doc_id, page_content=rows[doc_id][1], metadata=json.loads(rows[doc_id][2]))
+            for doc_id in top if doc_id in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def backfill_from_collection(index, collection, batch_size=1000):
+    """Index the chunks of a collection that predates its lexical index."""
+    offset = 0
+    while True:
+        batch = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        index.add(batch["ids"], batch["documents"], batch["metadatas"])
+        offset += len(batch["ids"])
+    if offset:
+        print(f"🔤 Built lexical index {index.path} from {offset} existing chunks")
@@ -0,0 +1,168 @@
+#loaders.py
+"""
+Per-format loaders that bypass Docling.
+
+Docling's layout, OCR and table models only pay off on PDFs and office
+documents. Plain text, CSV and XLSX files are read here with streaming
+readers instead: a few milliseconds per file and no model memory. Tables
+become row-group chunks with a Parquet copy (see tables.py). A loader
+returns the same {"docs", "full_markdown", "images", "tables"} dict as
+conversion.convert_file, so everything downstream is unchanged.
+
+Register another format with:
+
+    @register_loader(".ext")
+    def load_ext(path, out_dir): ...
+
+Files without a loader (or every file, with FAST_LOADERS=0) go to Docling.
+"""
+import csv
+import os
+from pathlib import Path
+from langchain.schema import Document
+from .tables import TableWriter
+
+FAST_LOADERS = os.getenv("FAST_LOADERS", "1") == "1"
+# Bytes looked at to guess a text file's encoding and a CSV's dialect
+SNIFF_BYTES = 64 * 1024
+
+LOADERS = {}
+
+
+def register_loader(*extensions):
+    """Route files with these extensions to the decorated loader(path, out_dir)."""
+    def wrap(fn):
+        for ext in extensions:
+            LOADERS[ext.lower()] = fn
+        return fn
+    return wrap
+
+
+def loader_for(path):
+    """The fast loader for a file, or None if it needs Docling."""
+    if not FAST_LOADERS:
+        return None
+    return LOADERS.get(Path(path).suffix.lower())
+
+
+def _metadata(path, element_type, **extra):
+    return {"source": str(path), "origin": path.name, "element_type": element_type, **extra}
+
+
+def guess_encoding(path):
+    """UTF-8 when the head decodes as such, else charset-normalizer's best guess."""
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_BYTES)
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # a multi-byte character cut off by the read is still UTF-8
+        if e.start >= len(head) - 3 and len(head) == SNIFF_BYTES:
+            return "utf-8"
+    from charset_normalizer import from_bytes
+    best = from_bytes(head).best()
+    return best.encoding if best is not None else "latin-1"
+
+
+@register_loader(".txt")
+def load_text(path, out_dir):
+    """One text element per blank-line separated paragraph."""
+    path = Path(path)
+    docs = []
+    paragraph = []
+
+    def flush():
+        text = "\n".join(paragraph).strip()
+        if text:
+            docs.append(Document(page_content=text, metadata=_metadata(path, "text", page=1)))
+        paragraph.clear()
+
+    with open(path, "r", encoding=guess_encoding(path), errors="replace", newline=None) as f:
+        for line in f:
+            if line.strip():
+                paragraph.append(line.rstrip("\n"))
+            else:
+                flush()
+    flush()
+    full_md = "\n\n".join(doc.page_content for doc in docs)
+    return {"docs": docs, "full_markdown": full_md, "images": [], "tables": []}
+
+
+def _csv_dialect(path, encoding):
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+        head = f.read(SNIFF_BYTES)
+    try:
+        return csv.Sniffer().sniff(head, delimiters=",;\t|")
+    except csv.Error:
+        # ragged rows defeat the sniffer: take the most frequent delimiter of the header
+        header = head.splitlines()[0] if head else ""
+        delimiter = max(",;\t|", key=header.count)
+        return type("HeaderDialect", (csv.excel,), {"delimiter": delimiter if header.count(delimiter) else ","})
+
+
+@register_loader(".csv")
+def load_csv(path, out_dir):
+    """Row-group table chunks (see tables.py) plus a Parquet copy in out_dir/{filename}/."""
+    path = Path(path)
+    encoding = guess_encoding(path)
+    file_out_dir = Path(out_dir) / path.name
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as f:
+        rows = (row for row in csv.reader(f, _csv_dialect(path, encoding)) if any(c.strip() for c in row))
+        header = next(rows, None)
+        if header is None:
+            return {"docs": [], "full_markdown": "", "images": [], "tables": []}
+        writer = TableWriter(
+            header,
+            _metadata(path, "table", table_index=1),
+            file_out_dir / f"{path.stem}-table-1.parquet",
+            title=path.name
+        )
+        for row in rows:
+            writer.add(row)
+        docs = writer.close()
+    # the table lives in Parquet; no whole-file markdown parent
+    return {"docs": docs, "full_markdown": "", "images": [], "tables": [str(path)]}
+
+
+def _trim(row):
+    row = list(row)
+    while row and (row[-1] is None or str(row[-1]).strip() == ""):
+        row.pop()
+    return row
+
+
+@register_loader(".xlsx")
+def load_xlsx(path, out_dir):
+    """Row-group table chunks per non-empty sheet, each sheet saved as CSV and Parquet in out_dir/{filename}/."""
+    from openpyxl import load_workbook
+
+    path = Path(path)
+    file_out_dir = Path(out_dir) / path.name
+    docs, tables = [], []
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = (row for row in map(_trim, sheet.iter_rows(values_only=True)) if row)
+            header = next(rows, None)
+            if header is None:
+                continue
+            table_ix = len(tables) + 1
+            file_out_dir.mkdir(parents=True, exist_ok=True)
+            csv_path = file_out_dir / f"{path.stem}-table-{table_ix}.csv"
+            writer = TableWriter(
+                header,
+                _metadata(path, "table", table_index=table_ix, sheet=sheet.title),
+                file_out_dir / f"{path.stem}-table-{table_ix}.parquet",
+                csv_path=csv_path,
+                title=f"{path.name}, sheet {sheet.title}"
+            )
+            for row in rows:
+                writer.add(row)
+            docs.extend(writer.close())
+            tables.append(str(csv_path))
+    finally:
+        workbook.close()
+    return {"docs": docs, "full_markdown": "", "images": [], "tables": tables}
@@ -1,16 +1,42 @@
 #main.py
 import os
-import base64
+import asyncio
+import contextvars
+import json
+import re
 import shutil
+import time
 from fastapi import FastAPI, HTTPException, Query, Form, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
-from .retriever import get_text_retriever, get_image_retriever
-#from models.openrouter import load_openrouter_llm
-from models.groq import load_groq_llm
+from typing import List, Optional
+from .retriever import (
+    get_image_retriever,
+    embed_questions,
+    retrieve_texts_by_vectors,
+    retrieve_images_for_questions,
+)
+from .registry import registry_stats, get_embedding_cache
+from .parents import parent_excerpt
+from .tables import table_passage
+from .rerank import RERANK, RERANK_CANDIDATES, select_passages
+from .image_variants import image_data_uri
+from .answer_cache import ANSWER_CACHE, answer_cache
+from models.pool import LLMPool, LLMUnavailable
 from prompts.prompt import PROMPT
-from .dispatcher import detect_and_ingest
+from .startup import API_ROLE, serves, mark, start_warm_up, is_ready, startup_stats
+from .telemetry import (
+    tenant,
+    span,
+    observe,
+    count_request,
+    count_tokens,
+    count_payload,
+    metrics_payload,
+)
 
 app = FastAPI()
 
@@ -28,9 +54,43 @@ app.add_middleware(
 UPLOAD_DIR = Path("uploads/users")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-# Global variables for LLM (will be initialized on first request)
-client = None
-MODEL_ID = None
+# Models load in the background; /health/ready reports when they are warm
+@app.on_event("startup")
+def warm_up_models():
+    start_warm_up()
+
+def require_role(role: str):
+    """404 for endpoints this worker's API_ROLE does not serve."""
+    if not serves(role):
+        raise HTTPException(status_code=404, detail=f"Not served by this worker (API_ROLE={API_ROLE})")
+
+# user and chatbot ids end up in paths and collection names: keep them to a safe alphabet
+SAFE_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+def check_id(value: str, field: str) -> str:
+    """400 unless value is a usable user or chatbot id."""
+    if not SAFE_ID.fullmatch(str(value)):
+        raise HTTPException(status_code=400, detail=f"{field} may only use letters, digits, '-' and '_'")
+    return str(value)
+
+def check_ids(user_id: str, chatbot_id: str):
+    """check_id for both ids; every endpoint taking them calls this first."""
+    return check_id(user_id, "user_id"), check_id(chatbot_id, "chatbot_id")
+
+# Providers, keys and rate limits of the LLM pool come from LLM_PROVIDERS (see models/pool.py);
+# the pool is built on first request
+llm_pool = None
+
+# Threads running embedding, Chroma queries and image encoding for async requests
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "8"))
+rag_executor = ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS, thread_name_prefix="rag")
+def in_executor(fn, *args):
+    """Run fn on rag_executor, keeping the caller's tenant labels and trace span."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(rag_executor, contextvars.copy_context().run, fn, *args)
+
+# Chunks fetched per question; the rerank stage over-fetches and keeps what fits the budget
+TEXT_RETRIEVAL_K = RERANK_CANDIDATES if RERANK else 5
 
 SYSTEM_MSG = (
     """
@@ -41,49 +101,85 @@ SYSTEM_MSG = (
     """
 )
 
-def initialize_llm():
-    """Initialize the LLM client on first use"""
-    global client, MODEL_ID
-    if client is None:
-        #client, MODEL_ID = load_openrouter_llm()
-        client, MODEL_ID = load_groq_llm()
-
-def encode_image_to_data_uri(path: str) -> str:
-    """Reads an image file and returns a base64 data URI."""
-    ext = os.path.splitext(path)[1].lower()
-    mime = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-    }.get(ext, 'application/octet-stream')
-    with open(path, 'rb') as f:
-        b64 = base64.b64encode(f.read()).decode()
-    return f"data:{mime};base64,{b64}"
+def get_llm_pool():
+    """The shared LLM pool, built from the environment on first use"""
+    global llm_pool
+    if llm_pool is None:
+        llm_pool = LLMPool.from_env()
+    return llm_pool
 
-def retrieve_text_context(query: str, user_id: str, chatbot_id: str):
-    """Retrieves and formats relevant texts for a specific user and chatbot."""
-    text_ret = get_text_retriever(user_id, chatbot_id, k=5)
-    docs = text_ret.invoke(query)
-    context = "\n\n".join(d.page_content for d in docs)
+@app.on_event("shutdown")
+async def close_llm_pool():
+    if llm_pool is not None:
+        await llm_pool.aclose()
+
+def encode_image_to_data_uri(path: str, preview_path: str = None) -> str:
+    """Returns a cached base64 data URI of the size-capped version of an image."""
+    if preview_path and os.path.exists(preview_path):
+        return image_data_uri(preview_path)
+    return image_data_uri(path)
+
+def image_payload_bytes(image_uris: list[str]) -> int:
+    """Bytes of image data URIs sent to the LLM with one question."""
+    return sum(len(uri) for uri in image_uris)
+
+def format_text_context(docs, query: str = None):
+    """
+    Prompt context and source list for retrieved text chunks. Given the
+    question, the chunks are reranked and packed into the context token budget.
+    """
+    # Table chunks are read back as their relevant rows; hierarchical chunks carry
+    # a pointer to their file's full text and are widened with it
+    passages = [
+        table_passage(d, query) or parent_excerpt(d.page_content, d.metadata.get("parent_path"))
+        for d in docs
+    ]
+    if query is not None:
+        with span("rerank"):
+            docs, passages = select_passages(query, docs, passages)
+    context = "\n\n".join(passages)
+    count_payload("text", len(context.encode("utf-8")))
     sources = [{"content": d.page_content, "metadata": d.metadata} for d in docs]
     return context, sources
 
+def retrieve_text_context_by_vector(query: str, query_vector, user_id: str, chatbot_id: str):
+    """retrieve_text_context for a question that is already embedded."""
+    with span("text_search"):
+        docs = retrieve_texts_by_vectors(user_id, chatbot_id, [query_vector], k=TEXT_RETRIEVAL_K,
+                                         questions=[query])[0]
+    return format_text_context(docs, query)
+
+def retrieve_text_context(query: str, user_id: str, chatbot_id: str):
+    """Retrieves and formats relevant texts (dense + BM25) for a specific user and chatbot."""
+    with span("embed_query"):
+        query_vector = embed_questions([query])[0]
+    return retrieve_text_context_by_vector(query, query_vector, user_id, chatbot_id)
+
 def retrieve_image_uris(query: str, include_images: bool, user_id: str, chatbot_id: str):
     """Retrieves image paths and encodes them as data URIs if requested."""
     if not include_images:
         return [], []
     
-    image_ret = get_image_retriever(user_id, chatbot_id, k=5)
-    image_results = image_ret(query)
-    
+    with span("image_search"):
+        image_ret = get_image_retriever(user_id, chatbot_id, k=5)
+        image_results = image_ret(query)
+    return encode_image_results(image_results, user_id, chatbot_id)
+
+def encode_image_results(image_results, user_id: str, chatbot_id: str):
+    """(uri, metadata) pairs from the image retriever → (paths, data URIs)."""
+    with span("image_encode"):
+        paths, uris = _encode_image_results(image_results, user_id, chatbot_id)
+    count_payload("image", image_payload_bytes(uris))
+    return paths, uris
+
+def _encode_image_results(image_results, user_id: str, chatbot_id: str):
     paths = []
     uris = []
     
     for uri, metadata in image_results:
         if os.path.exists(uri):
             paths.append(uri)
-            uris.append(encode_image_to_data_uri(uri))
+            uris.append(encode_image_to_data_uri(uri, metadata.get("preview_path")))
         else:
             # Try to find the image in the user's document directory
             user_docs_dir = os.path.join("storage", "users", user_id, chatbot_id, "documents")
@@ -91,7 +187,7 @@ def retrieve_image_uris(query: str, include_images: bool, user_id: str, chatbot_
             potential_path = os.path.join(user_docs_dir, filename)
             if os.path.exists(potential_path):
                 paths.append(potential_path)
-                uris.append(encode_image_to_data_uri(potential_path))
+                uris.append(encode_image_to_data_uri(potential_path, metadata.get("preview_path")))
     
     return paths, uris
 
@@ -124,41 +220,234 @@ def build_message_payload(context: str, question: str, image_uris: list[str]):
     return messages
 
 def call_llm(messages: list):
-    """Calls the LLM and returns the generated text."""
+    """Calls the LLM through the pool and returns the generated text."""
     try:
-        resp = client.chat.completions.create(
-            model=MODEL_ID,
-            messages=messages,
-            max_tokens=1024
-        )
+        with span("llm"):
+            resp, endpoint = get_llm_pool().complete(messages, max_tokens=1024)
+        count_tokens(getattr(resp, "usage", None), endpoint.provider, endpoint.model)
         return resp.choices[0].message.content
+    except LLMUnavailable:
+        raise
     except Exception as e:
         raise RuntimeError(f"LLM call failed: {e}")
 
-def run_rag(query: str, user_id: str, chatbot_id: str, include_images: bool = True):
-    # Initialize LLM on first use
-    initialize_llm()
-    
+async def call_llm_async(messages: list):
+    """Async variant of call_llm."""
+    try:
+        with span("llm"):
+            resp, endpoint = await get_llm_pool().acomplete(messages, max_tokens=1024)
+        count_tokens(getattr(resp, "usage", None), endpoint.provider, endpoint.model)
+        return resp.choices[0].message.content
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"LLM call failed: {e}")
+
+async def stream_llm(messages: list):
+    """Calls the LLM with streaming and yields text deltas as they arrive."""
+    try:
+        async for chunk, endpoint in get_llm_pool().astream(messages, max_tokens=1024):
+            # usage arrives on the last chunk (OpenAI) or in its x_groq extension (Groq)
+            usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None)
+            count_tokens(usage, endpoint.provider, endpoint.model)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except LLMUnavailable:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"LLM call failed: {e}")
+
+def prepare_rag(query: str, user_id: str, chatbot_id: str, include_images: bool = True):
+    """Retrieval half of the pipeline: returns (messages, sources)."""
     # 1) Text context
     context, text_sources = retrieve_text_context(query, user_id, chatbot_id)
     # 2) Image context
     image_paths, image_uris = retrieve_image_uris(query, include_images, user_id, chatbot_id)
     
-    print(f"Retrieved {len(image_uris)} images for user {user_id}, chatbot {chatbot_id}")
+    print(f"Retrieved {len(image_uris)} images ({image_payload_bytes(image_uris) / 1024:.0f} KB payload) "
+          f"for user {user_id}, chatbot {chatbot_id}")
     
     # 3) Build messages
     messages = build_message_payload(context, query, image_uris)
-    # 4) Call model
-    result = call_llm(messages)
+    return messages, {"text": text_sources, "images": image_paths}
+
+async def prepare_rag_async(query: str, user_id: str, chatbot_id: str, include_images: bool = True,
+                            query_vector=None):
+    """prepare_rag with text and image retrieval running concurrently off the event loop."""
+    with span("retrieval"):
+        if query_vector is not None:
+            text_call = in_executor(retrieve_text_context_by_vector, query, query_vector, user_id, chatbot_id)
+        else:
+            text_call = in_executor(retrieve_text_context, query, user_id, chatbot_id)
+        (context, text_sources), (image_paths, image_uris) = await asyncio.gather(
+            text_call,
+            in_executor(retrieve_image_uris, query, include_images, user_id, chatbot_id)
+        )
+
+    print(f"Retrieved {len(image_uris)} images ({image_payload_bytes(image_uris) / 1024:.0f} KB payload) "
+          f"for user {user_id}, chatbot {chatbot_id}")
+
+    messages = build_message_payload(context, query, image_uris)
+    return messages, {"text": text_sources, "images": image_paths}
+
+async def answer_from_cache(query: str, user_id: str, chatbot_id: str, include_images: bool):
+    """
+    Looks the question up in the answer cache: exact match first, then by
+    embedding similarity. Returns (cached_response or None, query_vector).
+    """
+    if not ANSWER_CACHE:
+        return None, None
+    hit = answer_cache.lookup_exact(user_id, chatbot_id, include_images, query)
+    if hit is not None:
+        return dict(hit, cache="exact"), None
+    with span("embed_query"):
+        query_vector = (await in_executor(embed_questions, [query]))[0]
+    hit = answer_cache.lookup_similar(user_id, chatbot_id, include_images, query_vector)
+    if hit is not None:
+        return dict(hit, cache="semantic"), query_vector
+    return None, query_vector
+
+async def run_rag_async(query: str, user_id: str, chatbot_id: str, include_images: bool = True):
+    """Non-blocking run_rag: many questions can be in flight on one worker."""
+    with tenant(user_id, chatbot_id), span("total"):
+        cached, query_vector = await answer_from_cache(query, user_id, chatbot_id, include_images)
+        if cached is not None:
+            count_request("ask", cached["cache"])
+            return cached
+
+        messages, sources = await prepare_rag_async(query, user_id, chatbot_id, include_images, query_vector)
+        result = await call_llm_async(messages)
+
+        response = {
+            "result": result,
+            "sources": sources
+        }
+        if ANSWER_CACHE:
+            answer_cache.store(user_id, chatbot_id, include_images, query, query_vector, response)
+        count_request("ask", "llm")
+        return response
+
+def run_rag(query: str, user_id: str, chatbot_id: str, include_images: bool = True):
+    with tenant(user_id, chatbot_id), span("total"):
+        messages, sources = prepare_rag(query, user_id, chatbot_id, include_images)
+        # 4) Call model
+        result = call_llm(messages)
     
     return {
         "result": result,
-        "sources": {
-            "text": text_sources,
-            "images": image_paths
-        }
+        "sources": sources
     }
 
+def prepare_rag_batch(questions: list[str], user_id: str, chatbot_id: str, include_images: bool = True):
+    """
+    Retrieval for many questions at once: one embedding pass, one Chroma query
+    for texts and one for images. Returns a (messages, sources) pair per question.
+    """
+    with span("embed_query"):
+        vectors = embed_questions(questions)
+    with span("text_search"):
+        text_batches = retrieve_texts_by_vectors(user_id, chatbot_id, vectors, k=TEXT_RETRIEVAL_K,
+                                                 questions=questions)
+    if include_images:
+        with span("image_search"):
+            image_batches = retrieve_images_for_questions(user_id, chatbot_id, questions, k=5)
+    else:
+        image_batches = [[] for _ in questions]
+
+    prepared = []
+    for question, docs, image_results in zip(questions, text_batches, image_batches):
+        context, text_sources = format_text_context(docs, question)
+        image_paths, image_uris = encode_image_results(image_results, user_id, chatbot_id)
+        messages = build_message_payload(context, question, image_uris)
+        prepared.append((messages, {"text": text_sources, "images": image_paths}))
+    return prepared
+
+async def run_rag_batch(questions: list[str], user_id: str, chatbot_id: str,
+                        include_images: bool = True, concurrency: int = 8):
+    """
+    Python API for bulk questions against one chatbot. Retrieval is batched,
+    LLM calls run at most `concurrency` at a time, and results are yielded as
+    they finish: {"index", "question", "result", "sources"} or {"index", "question", "error"}.
+    """
+    with tenant(user_id, chatbot_id):
+        with span("retrieval"):
+            prepared = await in_executor(prepare_rag_batch, questions, user_id, chatbot_id, include_images)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def answer(index, messages, sources):
+            async with semaphore:
+                try:
+                    result = await call_llm_async(messages)
+                    count_request("ask_batch", "llm")
+                    return {"index": index, "question": questions[index], "result": result, "sources": sources}
+                except Exception as e:
+                    count_request("ask_batch", "error")
+                    return {"index": index, "question": questions[index], "error": str(e)}
+
+        # tasks copy the current context, so the LLM spans keep the tenant labels
+        tasks = [asyncio.create_task(answer(i, messages, sources))
+                 for i, (messages, sources) in enumerate(prepared)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def run_rag_stream(query: str, user_id: str, chatbot_id: str, include_images: bool = True):
+    """
+    Same pipeline as run_rag as Server-Sent Events: one "sources" event,
+    then a "token" event per LLM delta, then "done" with timings.
+    """
+    start = time.perf_counter()
+    # spans measured by hand: a context manager must not stay open across yields
+    with tenant(user_id, chatbot_id):
+        try:
+            cached, query_vector = await answer_from_cache(query, user_id, chatbot_id, include_images)
+            if cached is not None:
+                count_request("ask_stream", cached["cache"])
+                yield sse_event("sources", cached["sources"])
+                yield sse_event("token", {"text": cached["result"]})
+                yield sse_event("done", {
+                    "cache": cached["cache"],
+                    "total_ms": round((time.perf_counter() - start) * 1000, 1)
+                })
+                return
+
+            messages, sources = await prepare_rag_async(query, user_id, chatbot_id, include_images, query_vector)
+            yield sse_event("sources", sources)
+            retrieval_ms = (time.perf_counter() - start) * 1000
+
+            ttfb_ms = None
+            deltas = []
+            async for delta in stream_llm(messages):
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - start) * 1000
+                    observe("ttfb", ttfb_ms / 1000)
+                    print(f"⏱️ First token after {ttfb_ms:.0f} ms (retrieval {retrieval_ms:.0f} ms) "
+                          f"for user {user_id}, chatbot {chatbot_id}")
+                deltas.append(delta)
+                yield sse_event("token", {"text": delta})
+
+            if ANSWER_CACHE:
+                answer_cache.store(user_id, chatbot_id, include_images, query, query_vector,
+                                   {"result": "".join(deltas), "sources": sources})
+            total_ms = (time.perf_counter() - start) * 1000
+            observe("llm", (total_ms - retrieval_ms) / 1000)
+            observe("total", total_ms / 1000)
+            count_request("ask_stream", "llm")
+            yield sse_event("done", {
+                "retrieval_ms": round(retrieval_ms, 1),
+                "ttfb_ms": round(ttfb_ms, 1) if ttfb_ms is not None else None,
+                "total_ms": round(total_ms, 1)
+            })
+        except Exception as e:
+            count_request("ask_stream", "error")
+            yield sse_event("error", {"detail": str(e)})
+
 @app.get("/ask")
 async def ask(
     q: str = Query(..., alias="query"),
@@ -166,49 +455,195 @@ async def ask(
     chatbot_id: str = Query(..., description="Chatbot ID"),
     include_images: bool = True
 ):
+    require_role("query")
+    user_id, chatbot_id = check_ids(user_id, chatbot_id)
     if not q:
         raise HTTPException(status_code=400, detail="The 'query' parameter is required.")
     try:
-        return run_rag(q, user_id, chatbot_id, include_images)
+        return await run_rag_async(q, user_id, chatbot_id, include_images)
+    except LLMUnavailable as e:
+        with tenant(user_id, chatbot_id):
+            count_request("ask", "error")
+        headers = {"Retry-After": str(max(1, round(e.retry_after)))} if e.retry_after else None
+        raise HTTPException(status_code=503, detail=str(e), headers=headers)
     except Exception as e:
+        with tenant(user_id, chatbot_id):
+            count_request("ask", "error")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/ask/stream")
+async def ask_stream(
+    q: str = Query(..., alias="query"),
+    user_id: str = Query(..., description="User ID"),
+    chatbot_id: str = Query(..., description="Chatbot ID"),
+    include_images: bool = True
+):
+    """Streams sources, then answer tokens, as text/event-stream."""
+    require_role("query")
+    user_id, chatbot_id = check_ids(user_id, chatbot_id)
+    if not q:
+        raise HTTPException(status_code=400, detail="The 'query' parameter is required.")
+    return StreamingResponse(
+        run_rag_stream(q, user_id, chatbot_id, include_images),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class BatchAskRequest(BaseModel):
+    user_id: str
+    chatbot_id: str
+    questions: List[str]
+    include_images: bool = True
+    concurrency: int = 8
+
+# Upper bound on questions per /ask/batch request
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "1000"))
+
+@app.post("/ask/batch")
+async def ask_batch(req: BatchAskRequest):
+    """
+    Answers many questions for one chatbot. Streams one JSON object per line
+    as answers finish, then a summary line with the throughput.
+    """
+    require_role("query")
+    check_ids(req.user_id, req.chatbot_id)
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required.")
+    if len(req.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch.")
+
+    async def lines():
+        start = time.perf_counter()
+        errors = 0
+        try:
+            async for item in run_rag_batch(req.questions, req.user_id, req.chatbot_id,
+                                            req.include_images, req.concurrency):
+                if "error" in item:
+                    errors += 1
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+            return
+        elapsed = time.perf_counter() - start
+        yield json.dumps({
+            "done": True,
+            "questions": len(req.questions),
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "questions_per_second": round(len(req.questions) / elapsed, 2) if elapsed else None
+        }) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/")
 async def root():
     return {"message": "Multimodal RAG API is running!"}
 
+@app.get("/health/live")
+async def health_live():
+    """The process is up and serving; says nothing about the models."""
+    return {"status": "alive", "role": API_ROLE}
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 once warm-up has loaded this role's models, 503 before (or if it failed)."""
+    stats = startup_stats()
+    if not is_ready():
+        raise HTTPException(status_code=503, detail=stats)
+    return stats
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit rates and sizes of the answer and embedding caches."""
+    return {
+        "answers": answer_cache.stats(),
+        "embeddings": get_embedding_cache().stats()
+    }
 
-@app.post("/chatbots")
+@app.get("/metrics")
+def metrics():
+    """Prometheus exposition of the stage timings and counters in telemetry.py."""
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/models")
+async def models():
+    """Load time and resident memory of the shared embedding models, plus cold-start phases."""
+    return {**registry_stats(), "startup": startup_stats()}
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """Per-endpoint calls, errors, 429s and hedges of the LLM pool, plus its current hedge delay."""
+    return get_llm_pool().pool_stats()
+
+
+@app.post("/chatbots", status_code=202)
 async def create_chatbot(
     name: str = Form(...),
     user_id: str = Form(...),
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    chatbot_id: Optional[str] = Form(None, description="Add the files to this existing chatbot")
 ):
     """
     Receive chatbot name and multiple files.
-    Saves files to the uploads/ folder.
+    Streams the files into uploads/users/{user_id}/{chatbot_id}/documents
+    (see uploads.py) and queues their ingestion; poll GET /jobs/{job_id}
+    for progress. Without chatbot_id a new chatbot is created.
     """
-    chatbot_id = "1"
-    saved_files = []
-
-    # Construct the folder path: uploads/{user_id}/{chatbot_id}/
-    user_folder = UPLOAD_DIR / str(user_id) / chatbot_id / "documents"
-    user_folder.mkdir(parents=True, exist_ok=True)
-
-    for file in files:
-        file_path = user_folder / file.filename
+    require_role("ingest")
+    from .jobs import submit_ingestion
+    from .uploads import new_chatbot_id, save_uploads
 
-        # Save uploaded file inside project folder
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    user_id = check_id(user_id, "user_id")
+    is_new = chatbot_id is None
+    if is_new:
+        chatbot_id = new_chatbot_id()
+    else:
+        chatbot_id = check_id(chatbot_id, "chatbot_id")
+        if not (UPLOAD_DIR / user_id / chatbot_id).is_dir():
+            raise HTTPException(status_code=404, detail=f"Unknown chatbot '{chatbot_id}'")
 
-        saved_files.append(file.filename)
-    print(f"Saved files for user {user_id}, chatbot '2': {saved_files}")
+    try:
+        saved = await save_uploads(files, user_id, chatbot_id, "uploads")
+    except Exception:
+        if is_new:
+            shutil.rmtree(UPLOAD_DIR / user_id / chatbot_id, ignore_errors=True)
+        raise
+    print(f"📥 Received {len(saved)} files for user {user_id}, chatbot {chatbot_id}: "
+          f"{', '.join(f'{s.filename} ({s.status})' for s in saved)}")
 
-    detect_and_ingest(user_id, chatbot_id, "uploads")
+    job_id = None
+    if any(s.status in ("saved", "replaced") for s in saved):
+        job_id = submit_ingestion(user_id, chatbot_id, "uploads")
     return {
-        "message": "Chatbot created successfully",
+        "message": "Chatbot created, ingestion queued" if is_new else
+                   ("Files added, ingestion queued" if job_id else "No new content"),
         "user_id": user_id,
+        "chatbot_id": chatbot_id,
         "name": name,
-        "files": saved_files
-    }
\ No newline at end of file
+        "files": [s.to_dict() for s in saved],
+        "job_id": job_id
+    }
+
+@app.delete("/chatbots/{chatbot_id}")
+def remove_chatbot(chatbot_id: str, user_id: str = Query(..., description="User ID")):
+    """Delete a chatbot: drops its collections, uploads and derived files."""
+    require_role("ingest")
+    from .jobs import delete_chatbot_now
+
+    user_id, chatbot_id = check_ids(user_id, chatbot_id)
+    if not delete_chatbot_now(user_id, chatbot_id, "uploads"):
+        raise HTTPException(status_code=404, detail=f"Unknown chatbot '{chatbot_id}'")
+    return {"message": "Chatbot deleted", "user_id": user_id, "chatbot_id": chatbot_id}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Per-file stage, elapsed time and chunk counts of an ingestion job."""
+    require_role("ingest")
+    from .jobs import get_job
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job
+
+mark("imported")
@@ -0,0 +1,160 @@
+#manifest.py
+"""
+Per-chatbot ingestion manifest.
+
+Lives at uploads/users/{user_id}/{chatbot_id}/manifest.json and maps every
+ingested upload to the SHA-256 of its content, so the dispatcher only
+re-ingests files whose bytes actually changed.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+DERIVED_DIR = "derived"
+# Hashes computed while receiving uploads, reused by the dispatcher
+UPLOAD_HASHES_NAME = "upload_hashes.json"
+
+# Artifacts older versions of text_ingestion wrote next to the uploads,
+# named after the stem of the document they came from
+LEGACY_DERIVED_RE = re.compile(r"(?P<stem>.+)(_picture_\d+\.png|-table-\d+\.csv)")
+
+
+def chatbot_root(base_storage_path, user_id, chatbot_id):
+    """
+    uploads/users/{user_id}/{chatbot_id}. Raises ValueError if the ids would
+    lead anywhere else ("..", "/", ""), since callers write and delete there.
+    """
+    users = Path(base_storage_path) / "users"
+    root = users / str(user_id) / str(chatbot_id)
+    if not str(user_id) or not str(chatbot_id) or root.resolve().parent.parent != users.resolve():
+        raise ValueError(f"Chatbot path for user {user_id!r}, chatbot {chatbot_id!r} is outside {users}")
+    return root
+
+
+def derived_dir_for(chatbot_path, filename):
+    """Folder holding images/tables extracted from one uploaded file."""
+    return Path(chatbot_path) / DERIVED_DIR / filename
+
+
+def legacy_artifacts(filenames, known_uploads):
+    """
+    {artifact: upload} for the files in documents/ that an older text_ingestion
+    extracted from another upload there ({stem}_picture_N.png, {stem}-table-N.csv).
+    A name alone proves nothing: the stem must belong to another file in the
+    folder, and known_uploads (received through the upload endpoint or already
+    in the manifest) are always uploads.
+    """
+    by_stem = {}
+    for name in sorted(filenames):
+        by_stem.setdefault(os.path.splitext(name)[0], name)
+    found = {}
+    for name in filenames:
+        match = LEGACY_DERIVED_RE.fullmatch(name)
+        if match is None or name in known_uploads:
+            continue
+        upload = by_stem.get(match.group("stem"))
+        if upload is not None and upload != name:
+            found[name] = upload
+    return found
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write_json(path, data):
+    """Write JSON atomically so a crash never leaves half a file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_upload_hashes(chatbot_path):
+    """{filename: {sha256, size, mtime_ns}} recorded by the upload endpoint."""
+    path = Path(chatbot_path) / UPLOAD_HASHES_NAME
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Unreadable upload hashes {path}, rehashing: {e}")
+        return {}
+
+
+def save_upload_hashes(chatbot_path, hashes):
+    _write_json(Path(chatbot_path) / UPLOAD_HASHES_NAME, hashes)
+
+
+def upload_hash_entry(path, digest):
+    st = os.stat(path)
+    return {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def known_sha256(upload_hashes, filename, path):
+    """The upload-time hash of a file if it is untouched since, else a fresh hash."""
+    entry = upload_hashes.get(filename)
+    if entry:
+        st = os.stat(path)
+        if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["sha256"]
+    return file_sha256(path)
+
+
+def load_manifest(chatbot_path):
+    path = Path(chatbot_path) / MANIFEST_NAME
+    if not path.exists():
+        return {"version": 0, "files": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Unreadable manifest {path}, starting fresh: {e}")
+        return {"version": 0, "files": {}}
+    manifest.setdefault("version", 0)
+    manifest.setdefault("files", {})
+    return manifest
+
+
+def save_manifest(chatbot_path, manifest):
+    """Write the manifest atomically so a crash never leaves half a file."""
+    _write_json(Path(chatbot_path) / MANIFEST_NAME, manifest)
+
+
+def diff_manifest(manifest, current_hashes):
+    """
+    Compare {filename: sha256} on disk against the manifest.
+    Returns (added, changed, unchanged, removed) lists of filenames.
+    """
+    known = manifest.get("files", {})
+    added, changed, unchanged = [], [], []
+    for name, digest in sorted(current_hashes.items()):
+        entry = known.get(name)
+        if entry is None:
+            added.append(name)
+        elif entry.get("sha256") != digest:
+            changed.append(name)
+        else:
+            unchanged.append(name)
+    removed = sorted(set(known) - set(current_hashes))
+    return added, changed, unchanged, removed
+
+
+def record_file(manifest, filename, digest, size, kind):
+    manifest["files"][filename] = {
+        "sha256": digest,
+        "size": size,
+        "kind": kind,
+        "ingested_at": time.time(),
+    }
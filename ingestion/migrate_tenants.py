@@ -0,0 +1,105 @@
+#migrate_tenants.py
+"""
+Move vectors from the old shared docs_collection / images_collection into
+per-chatbot collections (see tenancy.py). Embeddings are copied as-is, so
+nothing is re-encoded, and upserts make the migration safe to re-run. The
+shared collections predate embedding backends, so their vectors land in the
+default backend's collections; use reembed.py to move them to another one.
+Vectors without user/chatbot metadata cannot be placed and stay behind;
+--drop-shared refuses to drop a shared collection that still holds any.
+
+    python -m ingestion.migrate_tenants [--persist-dir database] [--batch-size 1000] [--drop-shared]
+"""
+import argparse
+from .registry import DEFAULT_PERSIST_DIR, get_chroma_client
+from .tenancy import tenant_collection_name
+from .embedding_backends import default_backend
+
+SHARED_COLLECTIONS = {"docs": "docs_collection", "images": "images_collection"}
+
+
+def _target(kind, user_id, chatbot_id, persist_dir):
+    """
+    The tenant collection vectors are copied into, created with the metadata
+    the registry gives it. No embedding function: vectors are copied, never
+    computed, so no model is loaded.
+    """
+    backend = default_backend(kind)
+    name = tenant_collection_name(kind, user_id, chatbot_id, backend)
+    return get_chroma_client(persist_dir).get_or_create_collection(
+        name, embedding_function=None, metadata={"embedding_backend": backend}
+    )
+
+
+def migrate_collection(kind, persist_dir=DEFAULT_PERSIST_DIR, batch_size=1000):
+    """
+    Copy one shared collection into tenant collections.
+    Returns ({tenant: count}, number of vectors skipped for lack of user/chatbot metadata).
+    """
+    client = get_chroma_client(persist_dir)
+    shared_name = SHARED_COLLECTIONS[kind]
+    try:
+        # embedding_function=None: we only read stored vectors, never embed here
+        shared = client.get_collection(shared_name, embedding_function=None)
+    except Exception:
+        print(f"⚠️ No {shared_name} to migrate")
+        return {}, 0
+
+    include = ["embeddings", "metadatas", "documents", "uris"]
+    moved = {}
+    skipped = 0
+    offset = 0
+    while True:
+        batch = shared.get(include=include, limit=batch_size, offset=offset)
+        ids = batch["ids"]
+        if not ids:
+            break
+        groups = {}
+        for i, meta in enumerate(batch["metadatas"]):
+            meta = meta or {}
+            key = (meta.get("user_id", ""), meta.get("chatbot_id", ""))
+            groups.setdefault(key, []).append(i)
+
+        for (user_id, chatbot_id), rows in groups.items():
+            if not user_id or not chatbot_id:
+                print(f"⚠️ Skipping {len(rows)} {kind} vectors without user/chatbot metadata")
+                skipped += len(rows)
+                continue
+            documents = batch.get("documents")
+            uris = batch.get("uris")
+            _target(kind, user_id, chatbot_id, persist_dir).upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[batch["embeddings"][i] for i in rows],
+                metadatas=[batch["metadatas"][i] for i in rows],
+                documents=[documents[i] for i in rows] if kind == "docs" and documents else None,
+                uris=[uris[i] for i in rows] if kind == "images" and uris else None,
+            )
+            tenant = tenant_collection_name(kind, user_id, chatbot_id, default_backend(kind))
+            moved[tenant] = moved.get(tenant, 0) + len(rows)
+        offset += len(ids)
+        print(f"📦 {kind}: {offset} vectors migrated")
+    return moved, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the shared collections into per-chatbot collections")
+    parser.add_argument("--persist-dir", default=DEFAULT_PERSIST_DIR)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--drop-shared", action="store_true",
+                        help="delete the shared collections once everything is copied")
+    args = parser.parse_args()
+
+    for kind in ("docs", "images"):
+        moved, skipped = migrate_collection(kind, args.persist_dir, args.batch_size)
+        for tenant, count in sorted(moved.items()):
+            print(f"✅ {tenant}: {count} vectors")
+        if args.drop_shared and skipped:
+            print(f"❌ Keeping {SHARED_COLLECTIONS[kind]}: {skipped} vectors without user/chatbot "
+                  f"metadata were not migrated")
+        elif args.drop_shared and moved:
+            get_chroma_client(args.persist_dir).delete_collection(SHARED_COLLECTIONS[kind])
+            print(f"🗑️ Dropped {SHARED_COLLECTIONS[kind]}")
+
+
+if __name__ == "__main__":
+    main()
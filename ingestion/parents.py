@@ -0,0 +1,60 @@
+#parents.py
+"""
+Non-embedded parent documents.
+
+In the hierarchical representation only the Docling elements are embedded;
+each file's full markdown is written next to its derived artifacts and the
+child chunks point at it through parent_id/parent_path metadata. At answer
+time the retriever swaps a hit for the stretch of its parent around it.
+"""
+import os
+from functools import lru_cache
+from pathlib import Path
+
+PARENT_FILENAME = "full_document.md"
+# Characters of parent text kept on each side of a retrieved chunk (0 = chunk only)
+PARENT_CONTEXT_CHARS = int(os.getenv("PARENT_CONTEXT_CHARS", "600"))
+
+
+def save_parent(file_out_dir, text):
+    """Store a file's full markdown and return its path."""
+    file_out_dir = Path(file_out_dir)
+    file_out_dir.mkdir(parents=True, exist_ok=True)
+    path = file_out_dir / PARENT_FILENAME
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@lru_cache(maxsize=64)
+def _read_parent(path, mtime_ns):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def load_parent(parent_path):
+    """Full text of a parent document, or None if it is gone."""
+    try:
+        return _read_parent(parent_path, os.stat(parent_path).st_mtime_ns)
+    except OSError:
+        return None
+
+
+def parent_excerpt(chunk_text, parent_path, window_chars=PARENT_CONTEXT_CHARS):
+    """
+    The chunk widened with up to window_chars of its parent on each side.
+    Falls back to the chunk itself when the parent or the chunk's position
+    in it cannot be found.
+    """
+    if window_chars <= 0 or not parent_path:
+        return chunk_text
+    parent = load_parent(parent_path)
+    if not parent:
+        return chunk_text
+    # Element text shows up verbatim in the markdown export; anchor on its start
+    anchor = chunk_text[:80]
+    pos = parent.find(anchor)
+    if pos < 0:
+        return chunk_text
+    start = max(0, pos - window_chars)
+    end = min(len(parent), pos + len(chunk_text) + window_chars)
+    return parent[start:end]
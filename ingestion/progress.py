@@ -0,0 +1,6 @@
+#progress.py
+
+def notify(progress, filename, stage, **info):
+    """Report a per-file stage change to an optional progress callback."""
+    if progress is not None:
+        progress(filename, stage, **info)
@@ -0,0 +1,121 @@
+#reembed.py
+"""
+Re-encode tenant collections with another embedding backend (see
+embedding_backends.py). Stored chunk texts and image files are embedded again
+and upserted, under the same IDs and metadata, into the collections named for
+the target backend, so the run is safe to repeat and the source collections
+keep serving until TEXT_EMBEDDING_BACKEND / IMAGE_EMBEDDING_BACKEND is
+switched over.
+
+    python -m ingestion.reembed --kind docs --to bge-small-onnx-int8 \
+        [--from instructor-xl] [--user-id U --chatbot-id C] [--persist-dir database] \
+        [--batch-size 256] [--drop-old]
+"""
+import argparse
+import os
+from .registry import (
+    DEFAULT_PERSIST_DIR,
+    get_chroma_client,
+    get_text_embedding,
+    get_text_store,
+    get_image_collection,
+    get_image_embedding,
+    get_image_loader,
+    list_collection_names,
+    drop_collection,
+    drop_lexical_index,
+)
+from .embedding_backends import backend_for, default_backend
+from .tenancy import split_collection_name, with_backend, chatbot_collection_names
+
+
+def _reembed_batch(kind, target, batch, backend):
+    if kind == "docs":
+        vectors = get_text_embedding(backend).embed_documents(batch["documents"])
+        target.upsert(ids=batch["ids"], embeddings=vectors,
+                      documents=batch["documents"], metadatas=batch["metadatas"])
+        return len(batch["ids"])
+
+    rows = [i for i, uri in enumerate(batch["uris"]) if uri and os.path.exists(uri)]
+    if len(rows) < len(batch["ids"]):
+        print(f"⚠️ Skipping {len(batch['ids']) - len(rows)} images whose files are gone")
+    if not rows:
+        return 0
+    uris = [batch["uris"][i] for i in rows]
+    vectors = get_image_embedding(backend)(get_image_loader()(uris))
+    target.upsert(ids=[batch["ids"][i] for i in rows], embeddings=vectors,
+                  uris=uris, metadatas=[batch["metadatas"][i] for i in rows])
+    return len(rows)
+
+
+def reembed_collection(kind, name, to_backend, persist_dir=DEFAULT_PERSIST_DIR, batch_size=256):
+    """Copy one collection into its to_backend twin; returns (target name, count)."""
+    _, base, _ = split_collection_name(name)
+    target_name = with_backend(base, kind, to_backend)
+    if kind == "docs":
+        target = get_text_store(target_name, persist_dir, to_backend)._collection
+        include = ["documents", "metadatas"]
+    else:
+        target = get_image_collection(target_name, persist_dir, to_backend)
+        include = ["uris", "metadatas"]
+
+    # embedding_function=None: stored texts and uris are read, never embedded here
+    source = get_chroma_client(persist_dir).get_collection(name, embedding_function=None)
+    moved = 0
+    offset = 0
+    while True:
+        batch = source.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        moved += _reembed_batch(kind, target, batch, to_backend)
+        offset += len(batch["ids"])
+        print(f"🔁 {name} → {target_name}: {offset} vectors re-embedded")
+    if kind == "docs":
+        # rebuilt from the finished collection the next time it is opened
+        drop_lexical_index(target_name, persist_dir)
+    return target_name, moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed tenant collections with another embedding backend")
+    parser.add_argument("--kind", choices=["docs", "images"], required=True)
+    parser.add_argument("--to", dest="to_backend", required=True, help="target backend name")
+    parser.add_argument("--from", dest="from_backend", default=None,
+                        help="source backend (default: the kind's original default backend)")
+    parser.add_argument("--user-id")
+    parser.add_argument("--chatbot-id")
+    parser.add_argument("--persist-dir", default=DEFAULT_PERSIST_DIR)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--drop-old", action="store_true",
+                        help="delete each source collection once it is copied")
+    args = parser.parse_args()
+
+    to_backend = backend_for(args.kind, args.to_backend)
+    from_backend = backend_for(args.kind, args.from_backend or default_backend(args.kind))
+    if to_backend == from_backend:
+        parser.error("--to and --from name the same backend")
+
+    names = list_collection_names(args.persist_dir)
+    if args.user_id and args.chatbot_id:
+        names = chatbot_collection_names(args.kind, args.user_id, args.chatbot_id, names)
+    sources = [
+        name for name in names
+        if split_collection_name(name)[0] == args.kind and split_collection_name(name)[2] == from_backend
+        and name not in ("docs_collection", "images_collection")
+    ]
+    if not sources:
+        print(f"⚠️ No {args.kind} collections on {from_backend} to re-embed")
+        return
+
+    for name in sources:
+        target_name, moved = reembed_collection(args.kind, name, to_backend, args.persist_dir, args.batch_size)
+        print(f"✅ {name} → {target_name}: {moved} vectors")
+        if args.drop_old:
+            if args.kind == "docs":
+                drop_lexical_index(name, args.persist_dir)
+            drop_collection(name, args.persist_dir)
+            print(f"🗑️ Dropped {name}")
+
+
+if __name__ == "__main__":
+    main()
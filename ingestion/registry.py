@@ -0,0 +1,324 @@
+#registry.py
+"""
+Process-wide registry for embedding models and Chroma clients.
+
+Every heavy object (text and image embedding backends, PersistentClient,
+Chroma wrapper, BM25 index) is created once per process and shared by retriever.py, vectordb.py and
+images_ingestion.py. Loading is guarded by a per-key lock so concurrent
+requests wait for the first load instead of starting their own.
+Models and clients stay loaded; the per-chatbot entries (collections, BM25
+indexes) are kept in an LRU of REGISTRY_MAX_TENANT_ENTRIES.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+import psutil
+from .telemetry import span
+
+from .embedding_backends import (
+    backend_for,
+    cache_name,
+    default_backend,
+    load_text_backend,
+    load_image_backend,
+)
+
+DEFAULT_PERSIST_DIR = "database"
+
+# Memoize document and query embeddings on disk (see embedding_cache.py)
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+# Per-chatbot entries kept open; the least recently used are dropped past this
+REGISTRY_MAX_TENANT_ENTRIES = int(os.getenv("REGISTRY_MAX_TENANT_ENTRIES", "512"))
+_TENANT_KINDS = ("text_store", "image_collection", "lexical_index")
+
+_instances = {}
+_stats = {}
+_locks = {}
+_locks_guard = threading.Lock()
+_tenant_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def _rss_mb():
+    return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+
+
+def _key_lock(key):
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = threading.Lock()
+        return lock
+
+
+def _close(key, instance):
+    # BM25 indexes hold a SQLite connection; Chroma handles hold nothing of their own
+    if key.startswith("lexical_index:"):
+        instance.close()
+
+
+def _forget(key):
+    """Remove one entry from the registry; returns it, or None if it was not loaded."""
+    with _lru_lock:
+        _tenant_lru.pop(key, None)
+        _stats.pop(key, None)
+        return _instances.pop(key, None)
+
+
+def _touch(key):
+    """Mark a per-chatbot entry as used, closing the least recently used past the cap."""
+    if key.split(":", 1)[0] not in _TENANT_KINDS:
+        return
+    evicted = []
+    with _lru_lock:
+        _tenant_lru[key] = None
+        _tenant_lru.move_to_end(key)
+        while len(_tenant_lru) > REGISTRY_MAX_TENANT_ENTRIES:
+            old, _ = _tenant_lru.popitem(last=False)
+            _stats.pop(old, None)
+            instance = _instances.pop(old, None)
+            if instance is not None:
+                evicted.append((old, instance))
+    for old, instance in evicted:
+        _close(old, instance)
+
+
+def _get_or_load(key, loader):
+    """Return the cached instance for key, loading it exactly once."""
+    instance = _instances.get(key)
+    if instance is not None:
+        _touch(key)
+        return instance
+    with _key_lock(key):
+        instance = _instances.get(key)
+        if instance is not None:
+            _touch(key)
+            return instance
+        rss_before = _rss_mb()
+        start = time.perf_counter()
+        with span("registry_load", component=key):
+            instance = loader()
+        load_s = time.perf_counter() - start
+        rss_after = _rss_mb()
+        _stats[key] = {
+            "load_seconds": round(load_s, 3),
+            "rss_delta_mb": round(rss_after - rss_before, 1),
+            "loaded_at": time.time(),
+        }
+        _instances[key] = instance
+        _touch(key)
+        print(f"🧠 Loaded {key} in {load_s:.2f}s (+{rss_after - rss_before:.0f} MB RSS)")
+        return instance
+
+
+def get_embedding_cache():
+    def load():
+        from .embedding_cache import EmbeddingCache
+        return EmbeddingCache()
+    return _get_or_load("embedding_cache", load)
+
+
+def get_text_model(backend=None):
+    """The bare text embeddings of a backend (default: the configured one), without the cache."""
+    backend = backend_for("docs", backend)
+    return _get_or_load(f"text_embedding:{backend}", lambda: load_text_backend(backend))
+
+
+def get_text_embedding(backend=None):
+    """Shared text embeddings (document and query prompts), cached when enabled."""
+    backend = backend_for("docs", backend)
+    base = get_text_model(backend)
+    if not EMBEDDING_CACHE:
+        return base
+
+    def load():
+        from .embedding_cache import CachedEmbeddings
+        return CachedEmbeddings(base, cache_name(backend), get_embedding_cache())
+    return _get_or_load(f"cached_text_embedding:{backend}", load)
+
+
+def get_image_embedding(backend=None):
+    """Shared OpenCLIP embedding function for the images collections."""
+    backend = backend_for("images", backend)
+    return _get_or_load(f"image_embedding:{backend}", lambda: load_image_backend(backend))
+
+
+def get_query_batcher(kind):
+    """
+    Shared micro-batcher (see batcher.py) for query embeddings: "docs" goes
+    through the cached text embeddings, "images" through OpenCLIP's text tower.
+    """
+    def load():
+        from .batcher import MicroBatcher
+        from .embedding_cache import embed_queries
+        if kind == "docs":
+            return MicroBatcher(kind, lambda texts: embed_queries(get_text_embedding(), texts))
+        return MicroBatcher(kind, lambda texts: get_image_embedding()(texts))
+    return _get_or_load(f"query_batcher:{kind}", load)
+
+
+def get_image_loader():
+    def load():
+        from chromadb.utils.data_loaders import ImageLoader
+        return ImageLoader()
+    return _get_or_load("image_loader", load)
+
+
+def get_reranker(model_name):
+    """Shared cross-encoder for the rerank stage, on CPU."""
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device="cpu")
+    return _get_or_load(f"reranker:{model_name}", load)
+
+
+def get_chroma_client(persist_dir=DEFAULT_PERSIST_DIR):
+    """One PersistentClient per persist directory."""
+    def load():
+        import chromadb
+        return chromadb.PersistentClient(path=persist_dir)
+    return _get_or_load(f"chroma_client:{os.path.abspath(persist_dir)}", load)
+
+
+def _check_backend(collection, kind, backend):
+    """Refuse to mix vectors of two embedding backends in one collection."""
+    found = (collection.metadata or {}).get("embedding_backend", default_backend(kind))
+    if found != backend:
+        raise ValueError(
+            f"Collection {collection.name} holds {found} vectors, not {backend}; "
+            f"run python -m ingestion.reembed to move it"
+        )
+
+
+def collection_exists(collection_name, persist_dir=DEFAULT_PERSIST_DIR):
+    """True if the collection is in Chroma; never creates it."""
+    from chromadb.errors import NotFoundError
+    try:
+        get_chroma_client(persist_dir).get_collection(collection_name, embedding_function=None)
+    except (NotFoundError, ValueError):
+        return False
+    return True
+
+
+def get_text_store(collection_name="docs_collection", persist_dir=DEFAULT_PERSIST_DIR, backend=None, create=True):
+    """
+    LangChain Chroma wrapper over the shared client and a backend's text embeddings.
+    create=False is for read paths: None if the collection does not exist yet.
+    """
+    backend = backend_for("docs", backend)
+    key = f"text_store:{backend}:{os.path.abspath(persist_dir)}:{collection_name}"
+    if not create and key not in _instances and not collection_exists(collection_name, persist_dir):
+        return None
+
+    def load():
+        from langchain_chroma import Chroma
+        store = Chroma(
+            collection_name=collection_name,
+            client=get_chroma_client(persist_dir),
+            embedding_function=get_text_embedding(backend),
+            collection_metadata={"embedding_backend": backend},
+            create_collection_if_not_exists=create
+        )
+        _check_backend(store._collection, "docs", backend)
+        return store
+    return _get_or_load(key, load)
+
+
+def get_image_collection(collection_name="images_collection", persist_dir=DEFAULT_PERSIST_DIR, backend=None,
+                         create=True):
+    """
+    Raw chromadb collection for images, wired to a backend's OpenCLIP model and the image loader.
+    create=False is for read paths: None if the collection does not exist yet.
+    """
+    backend = backend_for("images", backend)
+    key = f"image_collection:{backend}:{os.path.abspath(persist_dir)}:{collection_name}"
+    if not create and key not in _instances and not collection_exists(collection_name, persist_dir):
+        return None
+
+    def load():
+        client = get_chroma_client(persist_dir)
+        options = dict(
+            name=collection_name,
+            embedding_function=get_image_embedding(backend),
+            data_loader=get_image_loader()
+        )
+        if create:
+            collection = client.get_or_create_collection(metadata={"embedding_backend": backend}, **options)
+        else:
+            collection = client.get_collection(**options)
+        _check_backend(collection, "images", backend)
+        return collection
+    return _get_or_load(key, load)
+
+
+def list_collection_names(persist_dir=DEFAULT_PERSIST_DIR):
+    return [c if isinstance(c, str) else c.name for c in get_chroma_client(persist_dir).list_collections()]
+
+
+def get_lexical_index(collection_name, persist_dir=DEFAULT_PERSIST_DIR):
+    """BM25 index paired with a docs collection; built from it the first time."""
+    def load():
+        from .lexical import LexicalIndex, backfill_from_collection, index_path
+        path = index_path(collection_name, persist_dir)
+        is_new = not os.path.exists(path)
+        index = LexicalIndex(path)
+        store = get_text_store(collection_name, persist_dir, create=False) if is_new else None
+        if store is not None:
+            backfill_from_collection(index, store._collection)
+        return index
+    return _get_or_load(f"lexical_index:{os.path.abspath(persist_dir)}:{collection_name}", load)
+
+
+def drop_lexical_index(collection_name, persist_dir=DEFAULT_PERSIST_DIR):
+    """Close and delete the BM25 index of a dropped docs collection."""
+    from .lexical import index_path
+    key = f"lexical_index:{os.path.abspath(persist_dir)}:{collection_name}"
+    index = _forget(key)
+    if index is not None:
+        _close(key, index)
+    path = index_path(collection_name, persist_dir)
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def drop_collection(collection_name, persist_dir=DEFAULT_PERSIST_DIR):
+    """Delete a collection and forget every cached wrapper around it."""
+    client = get_chroma_client(persist_dir)
+    try:
+        client.delete_collection(collection_name)
+    except Exception as e:
+        # already gone, nothing to drop
+        print(f"⚠️ Could not delete collection {collection_name}: {e}")
+    suffix = f":{os.path.abspath(persist_dir)}:{collection_name}"
+    for key in [key for key in list(_instances) if key.endswith(suffix)]:
+        instance = _forget(key)
+        if instance is not None:
+            _close(key, instance)
+
+
+def warm_up(persist_dir=DEFAULT_PERSIST_DIR):
+    """Load the models and run one tiny forward pass so the first query is fast."""
+    start = time.perf_counter()
+    get_chroma_client(persist_dir)
+    get_text_model().embed_query("warm up")
+    get_image_embedding()(["warm up"])
+    print(f"🔥 Embedding models warm in {time.perf_counter() - start:.2f}s")
+
+
+def registry_stats():
+    """Load time and RSS growth per loaded component, plus current process RSS."""
+    stats = {
+        "rss_mb": round(_rss_mb(), 1),
+        "embedding_backends": {"docs": backend_for("docs"), "images": backend_for("images")},
+        "components": {key: dict(stats) for key, stats in list(_stats.items())},
+        "tenant_entries": len(_tenant_lru),
+        "max_tenant_entries": REGISTRY_MAX_TENANT_ENTRIES,
+    }
+    cache = _instances.get("embedding_cache")
+    if cache is not None:
+        stats["embedding_cache"] = cache.stats()
+    return stats
@@ -0,0 +1,115 @@
+#rerank.py
+"""
+Second retrieval stage: rerank the over-fetched candidates and pack them into
+a token budget.
+
+Hybrid retrieval hands over RERANK_CANDIDATES chunks instead of 5. A small
+CPU cross-encoder scores each (question, chunk) pair in one batch, with
+scores memoised per question and chunk text. Passages are then taken best
+first until CONTEXT_TOKEN_BUDGET is spent; a passage that mostly repeats one
+already taken from the same source is skipped, and an oversized one is cut
+to what is left of the budget instead of crowding everything else out.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from .registry import get_reranker
+
+RERANK = os.getenv("RERANK", "1") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Chunks fetched for reranking; only the best make it into the prompt
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+# Upper bound on passages in the prompt, whatever the budget
+CONTEXT_MAX_PASSAGES = int(os.getenv("CONTEXT_MAX_PASSAGES", "8"))
+# Approximate prompt tokens spent on retrieved text
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# A passage is cut rather than skipped only if at least this many tokens are left
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.getenv("CONTEXT_MIN_PASSAGE_TOKENS", "150"))
+# Share of a passage's word 5-grams already in a same-source passage that makes it a duplicate
+CONTEXT_DEDUP_OVERLAP = float(os.getenv("CONTEXT_DEDUP_OVERLAP", "0.6"))
+CHARS_PER_TOKEN = 4
+
+_scores = OrderedDict()
+_scores_lock = threading.Lock()
+_WORD_RE = re.compile(r"\w+")
+
+
+def count_tokens(text):
+    """Cheap token estimate, good enough for budgeting."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _score_key(query, text):
+    return hashlib.sha1(f"{RERANK_MODEL}\0{query}\0{text}".encode("utf-8")).hexdigest()
+
+
+def rerank_scores(query, texts):
+    """Cross-encoder relevance of each text to the query; uncached pairs in one batch."""
+    keys = [_score_key(query, text) for text in texts]
+    with _scores_lock:
+        scores = {key: _scores[key] for key in keys if key in _scores}
+    todo = {key: text for key, text in zip(keys, texts) if key not in scores}
+    if todo:
+        predicted = get_reranker(RERANK_MODEL).predict(
+            [(query, text) for text in todo.values()], batch_size=RERANK_BATCH_SIZE
+        )
+        fresh = dict(zip(todo.keys(), (float(s) for s in predicted)))
+        scores.update(fresh)
+        with _scores_lock:
+            _scores.update(fresh)
+            while len(_scores) > RERANK_CACHE_SIZE:
+                _scores.popitem(last=False)
+    return [scores[key] for key in keys]
+
+
+def _shingles(text, n=5):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _is_duplicate(shingles, taken):
+    if not shingles:
+        return False
+    for other in taken:
+        if len(shingles & other) / min(len(shingles), len(other) or 1) >= CONTEXT_DEDUP_OVERLAP:
+            return True
+    return False
+
+
+def select_passages(query, docs, passages, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Rerank docs (when RERANK is on) and keep the passages that fit the budget.
+    passages[i] is the prompt text for docs[i], e.g. the chunk widened with its
+    parent. Returns the kept (docs, passages), best first.
+    """
+    order = list(range(len(docs)))
+    if RERANK and len(docs) > 1:
+        scores = rerank_scores(query, [d.page_content for d in docs])
+        order.sort(key=lambda i: scores[i], reverse=True)
+
+    kept_docs, kept_passages = [], []
+    taken = {}
+    left = budget
+    for i in order:
+        if len(kept_docs) >= CONTEXT_MAX_PASSAGES or left < CONTEXT_MIN_PASSAGE_TOKENS:
+            break
+        passage = passages[i]
+        source = docs[i].metadata.get("source", "")
+        shingles = _shingles(passage)
+        if _is_duplicate(shingles, taken.get(source, [])):
+            continue
+        tokens = count_tokens(passage)
+        if tokens > left:
+            passage = passage[:left * CHARS_PER_TOKEN]
+            tokens = left
+        taken.setdefault(source, []).append(shingles)
+        kept_docs.append(docs[i])
+        kept_passages.append(passage)
+        left -= tokens
+    return kept_docs, kept_passages
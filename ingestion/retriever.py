@@ -1,73 +1,115 @@
 #retriever.py
-import chromadb
-from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
-from chromadb.utils.data_loaders import ImageLoader
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-import torch
+import os
+from .registry import (
+    DEFAULT_PERSIST_DIR,
+    get_text_embedding,
+    get_image_embedding,
+    get_text_store,
+    get_image_collection,
+    get_lexical_index,
+    get_query_batcher,
+)
+from .tenancy import tenant_collection_name
+from langchain.schema import Document
 
-DEFAULT_PERSIST_DIR = "database"
+# Fuse dense results with the chatbot's BM25 index (see lexical.py)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# Reciprocal rank fusion constant; larger flattens the rank weighting
+RRF_K = int(os.getenv("RRF_K", "60"))
 
 def get_text_embedding_function():
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    return HuggingFaceEmbeddings(
-        model_name="hkunlp/instructor-xl",
-        model_kwargs={'device': device},
-        encode_kwargs={
-            "prompt": "Represent the document for retrieval:",
-            "normalize_embeddings": True
-        },
-        query_encode_kwargs={
-            "prompt": "Represent the question for retrieving supporting documents:",
-            "normalize_embeddings": True
-        }
-    )
+    return get_text_embedding()
 
 def get_image_embedding_function():
-    return OpenCLIPEmbeddingFunction()
+    return get_image_embedding()
 
 def get_text_retriever(user_id, chatbot_id, k=5, persist_dir=DEFAULT_PERSIST_DIR):
-    embedding_fn = get_text_embedding_function()
-    chroma = Chroma(
-        collection_name="docs_collection",
-        persist_directory=persist_dir,
-        embedding_function=embedding_fn
-    )
-    filter_dict = {
-        "$and": [
-            {"user_id": {"$eq": str(user_id)}},
-            {"chatbot_id": {"$eq": str(chatbot_id)}},
-            {"content_type": {"$eq": "text"}}
-        ]
-    }
-    return chroma.as_retriever(search_kwargs={"k": k, "filter": filter_dict})
+    """LangChain retriever over the chatbot's docs, or None if nothing was ingested yet."""
+    # The chatbot's own collection, so no metadata filter is needed
+    chroma = get_text_store(tenant_collection_name("docs", user_id, chatbot_id), persist_dir, create=False)
+    return chroma.as_retriever(search_kwargs={"k": k}) if chroma is not None else None
 
 def get_image_retriever(user_id, chatbot_id, k=5, persist_dir=DEFAULT_PERSIST_DIR):
-    client = chromadb.PersistentClient(path=persist_dir)
-    embedding_fn = get_image_embedding_function()
-    image_loader = ImageLoader()
-
-    collection = client.get_collection(
-        name="images_collection",
-        embedding_function=embedding_fn,
-        data_loader=image_loader
-    )
+    collection = get_image_collection(tenant_collection_name("images", user_id, chatbot_id), persist_dir,
+                                      create=False)
 
     def retrieve_by_text(query_text):
-        filter_dict = {
-            "$and": [
-                {"user_id": {"$eq": str(user_id)}},
-                {"chatbot_id": {"$eq": str(chatbot_id)}},
-                {"content_type": {"$eq": "image"}}
-            ]
-        }
+        if collection is None:
+            return []
+        # OpenCLIP text tower, batched with concurrent requests
+        query_vector = get_query_batcher("images").embed([query_text])[0]
         result = collection.query(
-            query_texts=[query_text],
+            query_embeddings=[query_vector],
             n_results=k,
-            where=filter_dict,
             include=["uris", "metadatas", "distances"]
         )
         uris = result.get("uris", [[]])[0]
         metadatas = result.get("metadatas", [[]])[0]
         return list(zip(uris, metadatas)) if uris and metadatas else []
     return retrieve_by_text
+
+def embed_questions(questions):
+    """
+    Query embeddings for many questions in one forward pass; a few questions
+    share theirs with concurrent requests (see batcher.py).
+    """
+    return get_query_batcher("docs").embed(questions)
+
+def fuse_rankings(rankings, k, rrf_k=RRF_K):
+    """Reciprocal rank fusion of several best-first Document lists, keyed by ID."""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc.id] = scores.get(doc.id, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(doc.id, doc)
+    return [docs[doc_id] for doc_id in sorted(scores, key=scores.get, reverse=True)[:k]]
+
+def retrieve_texts_by_vectors(user_id, chatbot_id, query_vectors, k=5, persist_dir=DEFAULT_PERSIST_DIR,
+                              questions=None):
+    """
+    One Chroma query for many question vectors; returns a list of Document lists.
+    With the questions' text and HYBRID_SEARCH on, each dense list is fused
+    with the BM25 hits for the same question.
+    """
+    name = tenant_collection_name("docs", user_id, chatbot_id)
+    chroma = get_text_store(name, persist_dir, create=False)
+    if chroma is None:
+        # no collection, so no BM25 index either: nothing is created on a query
+        return [[] for _ in query_vectors]
+    hybrid = HYBRID_SEARCH and questions is not None
+    result = chroma._collection.query(
+        query_embeddings=query_vectors,
+        n_results=max(k, HYBRID_CANDIDATES) if hybrid else k,
+        include=["documents", "metadatas", "distances"]
+    )
+    batches = []
+    for ids, texts, metadatas in zip(result["ids"], result["documents"], result["metadatas"]):
+        batches.append([
+            Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        ])
+    if hybrid:
+        lexical = get_lexical_index(name, persist_dir)
+        batches = [
+            fuse_rankings([dense, lexical.search(question, HYBRID_CANDIDATES)], k)
+            for dense, question in zip(batches, questions)
+        ]
+    return batches
+
+def retrieve_images_for_questions(user_id, chatbot_id, questions, k=5, persist_dir=DEFAULT_PERSIST_DIR):
+    """One OpenCLIP text pass and one Chroma query for many questions."""
+    collection = get_image_collection(tenant_collection_name("images", user_id, chatbot_id), persist_dir,
+                                      create=False)
+    if collection is None:
+        return [[] for _ in questions]
+    result = collection.query(
+        query_texts=questions,
+        n_results=k,
+        include=["uris", "metadatas", "distances"]
+    )
+    uris = result.get("uris") or [[] for _ in questions]
+    metadatas = result.get("metadatas") or [[] for _ in questions]
+    return [list(zip(u or [], m or [])) for u, m in zip(uris, metadatas)]
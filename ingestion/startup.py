@@ -0,0 +1,112 @@
+#startup.py
+"""
+Process role, background warm-up and cold-start measurements for the API.
+
+API_ROLE picks what a worker serves:
+- "query": the /ask endpoints only; the ingestion stack (dispatcher, Docling,
+  job pool) is never imported
+- "ingest": /chatbots and /jobs only
+- "all" (default): both
+
+Nothing heavy is loaded at import time. On startup, `start_warm_up()` loads
+what the role needs on a background thread, so /health/live answers right
+away and /health/ready turns 200 once the models are warm. Requests that
+arrive earlier still work: they wait on the registry's per-key load lock
+instead of loading a second copy.
+
+Seconds since process start and RSS are recorded when the app module is
+imported and when warm-up finishes. They are reported by /health/ready and
+/models and exported as the process_startup_* gauges.
+"""
+import os
+import threading
+import time
+import psutil
+from .telemetry import record_startup
+
+API_ROLE = os.getenv("API_ROLE", "all")
+ROLES = ("query", "ingest", "all")
+if API_ROLE not in ROLES:
+    raise ValueError(f"API_ROLE must be one of {', '.join(ROLES)}, not {API_ROLE!r}")
+
+# Load models in the background at startup instead of on the first request
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "1") == "1"
+
+_process = psutil.Process(os.getpid())
+_started_at = _process.create_time()
+_phases = {}
+_state = {"status": "pending", "error": None}
+_state_lock = threading.Lock()
+
+
+def serves(role):
+    """True if this worker handles requests of the given role."""
+    return API_ROLE in (role, "all")
+
+
+def mark(phase):
+    """Record seconds since process start and RSS for a startup phase."""
+    seconds = time.time() - _started_at
+    rss = _process.memory_info().rss
+    _phases[phase] = {"seconds": round(seconds, 3), "rss_mb": round(rss / (1024 * 1024), 1)}
+    record_startup(phase, API_ROLE, seconds, rss)
+    print(f"⏱️ {phase} after {seconds:.2f}s ({rss / (1024 * 1024):.0f} MB RSS, role {API_ROLE})")
+
+
+def warm_up():
+    """Load and exercise everything this role needs, in the calling thread."""
+    from .registry import warm_up as warm_up_embeddings
+    warm_up_embeddings()
+    if serves("query"):
+        from .rerank import RERANK, RERANK_MODEL
+        from .registry import get_reranker
+        if RERANK:
+            get_reranker(RERANK_MODEL).predict([("warm up", "warm up")])
+    if serves("ingest"):
+        from . import jobs  # noqa: F401  (dispatcher, chunking, conversion)
+        from .conversion import DOCLING_WORKERS, get_converter
+        if DOCLING_WORKERS <= 1:
+            # converts in this process; pool workers build their own converter
+            get_converter()
+
+
+def _run_warm_up():
+    with _state_lock:
+        _state["status"] = "warming"
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"❌ Warm-up failed: {e}")
+        with _state_lock:
+            _state.update(status="failed", error=str(e))
+        return
+    mark("ready")
+    with _state_lock:
+        _state["status"] = "ready"
+
+
+def start_warm_up():
+    """Warm up in a daemon thread, or mark ready right away when WARMUP_MODELS=0."""
+    if not WARMUP_MODELS:
+        mark("ready")
+        with _state_lock:
+            _state["status"] = "ready"
+        return
+    threading.Thread(target=_run_warm_up, name="warm-up", daemon=True).start()
+
+
+def is_ready():
+    return _state["status"] == "ready"
+
+
+def startup_stats():
+    """Role, warm-up status and the recorded startup phases."""
+    with _state_lock:
+        state = dict(_state)
+    return {
+        "role": API_ROLE,
+        "status": state["status"],
+        "error": state["error"],
+        "uptime_seconds": round(time.time() - _started_at, 3),
+        "phases": {phase: dict(values) for phase, values in _phases.items()},
+    }
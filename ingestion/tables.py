@@ -0,0 +1,223 @@
+#tables.py
+"""
+Row-group chunks and columnar copies of tables.
+
+A table is no longer indexed as one markdown blob. TableWriter streams its
+rows into chunks of at most TABLE_CHUNK_TOKENS (and TABLE_CHUNK_MAX_ROWS
+rows). Each chunk repeats the header row and records its data-row range
+(row_start..row_end, 1-based, as in the CSV below its header) in metadata.
+The same pass writes the rows once to Parquet in row groups of
+TABLE_PARQUET_BATCH_ROWS, and to CSV if asked. Memory stays bounded by one
+batch however long the table is.
+
+At answer time `table_passage` reads a retrieved chunk's exact row range
+back from the Parquet file and keeps the rows that share terms with the
+question. The prompt then gets the header plus the relevant rows instead of
+a whole sheet.
+"""
+import csv
+import os
+from functools import lru_cache
+from pathlib import Path
+from langchain.schema import Document
+from .lexical import tokenize
+
+TABLE_CHUNK_TOKENS = int(os.getenv("TABLE_CHUNK_TOKENS", "400"))
+TABLE_CHUNK_MAX_ROWS = int(os.getenv("TABLE_CHUNK_MAX_ROWS", "100"))
+TABLE_PARQUET_BATCH_ROWS = int(os.getenv("TABLE_PARQUET_BATCH_ROWS", "10000"))
+CHARS_PER_TOKEN = 4
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    return str(value).replace("|", "\\|").replace("\r", " ").replace("\n", " ").strip()
+
+
+def md_row(cells):
+    return "| " + " | ".join(_cell(c) for c in cells) + " |"
+
+
+def md_header(header):
+    return md_row(header) + "\n|" + "|".join(" --- " for _ in header) + "|"
+
+
+def _column_names(header):
+    """Non-empty, unique column names for the Parquet schema."""
+    names, seen = [], {}
+    for i, name in enumerate(header):
+        name = _cell(name) or f"column_{i + 1}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+class TableWriter:
+    """
+    Streams one table into row-group Documents plus Parquet (and optionally CSV).
+
+        writer = TableWriter(header, metadata, parquet_path, csv_path=None)
+        for row in rows:
+            writer.add(row)
+        docs = writer.close()
+
+    metadata is copied into every chunk, which also gets table_rows,
+    row_start, row_end and parquet_path (and csv_path when written).
+    """
+
+    def __init__(self, header, metadata, parquet_path, csv_path=None, title=""):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.header = [_cell(h) for h in header]
+        self.width = len(self.header)
+        self.metadata = dict(metadata)
+        self.title = title
+        self.parquet_path = Path(parquet_path)
+        self.parquet_path.parent.mkdir(parents=True, exist_ok=True)
+        self.metadata["parquet_path"] = str(self.parquet_path)
+        self._schema = pa.schema([(name, pa.string()) for name in _column_names(self.header)])
+        self._parquet = pq.ParquetWriter(str(self.parquet_path), self._schema)
+        self._csv_file = None
+        if csv_path is not None:
+            self._csv_file = open(csv_path, "w", encoding="utf-8", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(self.header)
+            self.metadata["csv_path"] = str(csv_path)
+            self.metadata["local_path"] = str(csv_path)
+        self._head_md = md_header(self.header)
+        self._batch = []
+        self._chunk_rows = []
+        self._chunk_chars = 0
+        self._chunk_start = 1
+        self.rows = 0
+        self.docs = []
+
+    def _fit(self, row):
+        """Row padded or folded to the header's width (extra cells join the last column)."""
+        row = ["" if c is None else str(c) for c in row]
+        if len(row) > self.width > 0:
+            row = row[:self.width - 1] + [", ".join(c for c in row[self.width - 1:] if c)]
+        return row + [""] * (self.width - len(row))
+
+    def add(self, row):
+        row = self._fit(row)
+        self.rows += 1
+        if self._csv_file is not None:
+            self._csv.writerow(row)
+        self._batch.append(row)
+        if len(self._batch) >= TABLE_PARQUET_BATCH_ROWS:
+            self._flush_batch()
+
+        line = md_row(row)
+        budget = TABLE_CHUNK_TOKENS * CHARS_PER_TOKEN - len(self._head_md)
+        if self._chunk_rows and (self._chunk_chars + len(line) > budget
+                                 or len(self._chunk_rows) >= TABLE_CHUNK_MAX_ROWS):
+            self._flush_chunk()
+        self._chunk_rows.append(line)
+        self._chunk_chars += len(line) + 1
+
+    def _flush_batch(self):
+        import pyarrow as pa
+        if self._batch:
+            columns = list(zip(*self._batch))
+            self._parquet.write_table(pa.Table.from_arrays(
+                [pa.array(col, pa.string()) for col in columns], schema=self._schema
+            ))
+            self._batch = []
+
+    def _flush_chunk(self):
+        if not self._chunk_rows:
+            return
+        start, end = self._chunk_start, self._chunk_start + len(self._chunk_rows) - 1
+        caption = f"{self.title} (rows {start}-{end})\n" if self.title else ""
+        self.docs.append(Document(
+            page_content=caption + self._head_md + "\n" + "\n".join(self._chunk_rows),
+            metadata={**self.metadata, "row_start": start, "row_end": end}
+        ))
+        self._chunk_start = end + 1
+        self._chunk_rows = []
+        self._chunk_chars = 0
+
+    def close(self):
+        """Finish the files and return the chunks, each knowing the table's row count."""
+        self._flush_chunk()
+        self._flush_batch()
+        self._parquet.close()
+        if self._csv_file is not None:
+            self._csv_file.close()
+        for doc in self.docs:
+            doc.metadata["table_rows"] = self.rows
+        return self.docs
+
+
+@lru_cache(maxsize=32)
+def _parquet_file(path, mtime_ns):
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(path)
+
+
+def read_rows(parquet_path, row_start, row_end):
+    """(header, rows) for data rows row_start..row_end (1-based, inclusive), reading only their row groups."""
+    parquet = _parquet_file(parquet_path, os.stat(parquet_path).st_mtime_ns)
+    header = parquet.schema_arrow.names
+    rows = []
+    offset = 0
+    for group in range(parquet.metadata.num_row_groups):
+        count = parquet.metadata.row_group(group).num_rows
+        first, last = offset + 1, offset + count
+        offset = last
+        if last < row_start:
+            continue
+        if first > row_end:
+            break
+        table = parquet.read_row_group(group)
+        columns = [table.column(i).to_pylist() for i in range(table.num_columns)]
+        lo, hi = max(row_start, first) - first, min(row_end, last) - first + 1
+        rows.extend(list(row) for row in zip(*(col[lo:hi] for col in columns)))
+    return header, rows
+
+
+def relevant_rows(query, rows):
+    """
+    The rows sharing a distinctive term with the question, or every row if
+    none does. Terms found in most rows of the group (a repeated prefix, a
+    category value) do not single anything out and are ignored.
+    """
+    terms = {t for t in tokenize(query) if len(t) > 2 or t.isdigit()}
+    if not terms or len(rows) < 2:
+        return rows
+    row_terms = [terms & set(tokenize(" ".join(row))) for row in rows]
+    frequent = {t for t in terms if sum(t in found for found in row_terms) > len(rows) // 2}
+    hits = [row for row, found in zip(rows, row_terms) if found - frequent]
+    return hits or rows
+
+
+def table_passage(doc, query=None):
+    """
+    Prompt text for a retrieved row-group chunk: its header and rows read back
+    from Parquet, narrowed to the rows relevant to the question. None for
+    other chunks or when the Parquet file is gone.
+    """
+    meta = doc.metadata
+    parquet_path = meta.get("parquet_path")
+    if not parquet_path or "row_start" not in meta:
+        return None
+    try:
+        header, rows = read_rows(parquet_path, int(meta["row_start"]), int(meta["row_end"]))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read rows from {parquet_path}: {e}")
+        return None
+    if query:
+        rows = relevant_rows(query, rows)
+    caption = meta.get("origin", "")
+    if meta.get("sheet"):
+        caption += f", sheet {meta['sheet']}"
+    lines = [f"{caption} (rows {meta['row_start']}-{meta['row_end']} of {meta.get('table_rows', '?')})",
+             md_header(header)]
+    lines.extend(md_row(row) for row in rows)
+    return "\n".join(lines)
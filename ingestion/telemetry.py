@@ -0,0 +1,195 @@
+#telemetry.py
+"""
+Stage timings, counters and optional traces for the RAG and ingestion pipelines.
+
+Every stage runs inside `span(stage)`: its duration goes to a Prometheus
+histogram labelled with the stage and the current tenant, and, with
+OTEL_TRACES=1, to an OpenTelemetry span exported over OTLP (configured by
+the usual OTEL_EXPORTER_OTLP_* variables). The tenant is set once per
+request or job with `tenant(user_id, chatbot_id)` and carried by contextvars,
+so code run through `contextvars.copy_context().run` in worker threads keeps
+both its labels and its parent trace span.
+
+GET /metrics serves `metrics_payload()`. With several uvicorn workers, point
+PROMETHEUS_MULTIPROC_DIR at a shared empty directory so every process is
+aggregated.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+OTEL_TRACES = os.getenv("OTEL_TRACES", "0") == "1"
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "rag-api")
+# user_id/chatbot_id labels on every series; turn off if tenants number in the thousands
+METRICS_TENANT_LABELS = os.getenv("METRICS_TENANT_LABELS", "1") == "1"
+
+_RAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+_INGEST_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+_TENANT = ("user_id", "chatbot_id")
+
+STAGE_SECONDS = {
+    "rag": Histogram("rag_stage_seconds", "Time spent per RAG stage",
+                     ("stage",) + _TENANT, buckets=_RAG_BUCKETS),
+    "ingest": Histogram("ingest_stage_seconds", "Time spent per ingestion stage",
+                        ("stage",) + _TENANT, buckets=_INGEST_BUCKETS),
+}
+STAGE_ERRORS = Counter("pipeline_stage_errors_total", "Stages that raised",
+                       ("pipeline", "stage") + _TENANT)
+REQUESTS = Counter("rag_requests_total", "Answered questions by endpoint and outcome",
+                   ("endpoint", "outcome") + _TENANT)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM provider",
+                     ("kind", "provider", "model") + _TENANT)
+PAYLOAD_BYTES = Counter("rag_payload_bytes_total", "Bytes of context sent to the LLM",
+                        ("kind",) + _TENANT)
+INGESTED_ITEMS = Counter("ingested_items_total", "Files, chunks and images ingested",
+                         ("kind",) + _TENANT)
+EMBED_BATCH_SIZE = Histogram("query_embedding_batch_size", "Questions per micro-batched embedding call",
+                             ("kind",), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+EMBED_QUEUE_SECONDS = Histogram("query_embedding_queue_seconds", "Time a question waited for its batch",
+                                ("kind",), buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+EMBED_QUEUE_DEPTH = Gauge("query_embedding_queue_depth", "Questions waiting for the embedding batcher",
+                          ("kind",), multiprocess_mode="livesum")
+STARTUP_SECONDS = Gauge("process_startup_seconds", "Seconds from process start to a startup phase",
+                        ("phase", "role"), multiprocess_mode="liveall")
+STARTUP_RSS = Gauge("process_startup_rss_bytes", "Resident memory when a startup phase was reached",
+                    ("phase", "role"), multiprocess_mode="liveall")
+
+_tenant = contextvars.ContextVar("telemetry_tenant", default=("", ""))
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def _tenant_labels():
+    return _tenant.get() if METRICS_TENANT_LABELS else ("", "")
+
+
+@contextmanager
+def tenant(user_id, chatbot_id):
+    """Label every span and counter inside the block with this chatbot."""
+    token = _tenant.set((str(user_id), str(chatbot_id)))
+    try:
+        yield
+    finally:
+        try:
+            _tenant.reset(token)
+        except ValueError:
+            # an async generator closed from another task; its context is discarded anyway
+            pass
+
+
+def get_tracer():
+    """OpenTelemetry tracer exporting over OTLP, or None when OTEL_TRACES is off."""
+    global _tracer
+    if not OTEL_TRACES:
+        return None
+    if _tracer is not None:
+        return _tracer
+    with _tracer_lock:
+        if _tracer is not None:
+            return _tracer
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer("ingestion")
+    return _tracer
+
+
+@contextmanager
+def span(stage, pipeline="rag", **attributes):
+    """Time one stage into {pipeline}_stage_seconds and, if enabled, an OTel span."""
+    user_id, chatbot_id = _tenant_labels()
+    tracer = get_tracer()
+    otel_span = None
+    if tracer is not None:
+        otel_span = tracer.start_as_current_span(
+            f"{pipeline}.{stage}",
+            attributes={"user_id": user_id, "chatbot_id": chatbot_id, **attributes}
+        )
+        otel_span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.labels(pipeline, stage, user_id, chatbot_id).inc()
+        if otel_span is not None:
+            otel_span.__exit__(type(e), e, e.__traceback__)
+            otel_span = None
+        raise
+    finally:
+        STAGE_SECONDS[pipeline].labels(stage, user_id, chatbot_id).observe(time.perf_counter() - start)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+
+
+def observe(stage, seconds, pipeline="rag"):
+    """Record a duration measured by hand, e.g. across the yields of a stream."""
+    user_id, chatbot_id = _tenant_labels()
+    STAGE_SECONDS[pipeline].labels(stage, user_id, chatbot_id).observe(seconds)
+
+
+def count_request(endpoint, outcome):
+    REQUESTS.labels(endpoint, outcome, *_tenant_labels()).inc()
+
+
+def count_tokens(usage, provider, model):
+    """Prompt/completion tokens from an OpenAI-style usage object, if the provider sent one."""
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            LLM_TOKENS.labels(kind, provider or "", model or "", *_tenant_labels()).inc(tokens)
+
+
+def count_payload(kind, nbytes):
+    if nbytes:
+        PAYLOAD_BYTES.labels(kind, *_tenant_labels()).inc(nbytes)
+
+
+def count_ingested(kind, n):
+    if n:
+        INGESTED_ITEMS.labels(kind, *_tenant_labels()).inc(n)
+
+
+def observe_batch(kind, size, waits):
+    """One micro-batch of query embeddings (see batcher.py) and how long each caller queued."""
+    EMBED_BATCH_SIZE.labels(kind).observe(size)
+    for seconds in waits:
+        EMBED_QUEUE_SECONDS.labels(kind).observe(seconds)
+
+
+def set_queue_depth(kind, depth):
+    EMBED_QUEUE_DEPTH.labels(kind).set(depth)
+
+
+def record_startup(phase, role, seconds, rss_bytes):
+    """Cold-start milestone of this process (see startup.py)."""
+    STARTUP_SECONDS.labels(phase, role).set(seconds)
+    STARTUP_RSS.labels(phase, role).set(rss_bytes)
+
+
+def metrics_payload():
+    """(body, content type) of the Prometheus exposition for this process or all workers."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,52 @@
+#tenancy.py
+"""
+Per-chatbot collection layout.
+
+Each chatbot gets its own docs_* and images_* Chroma collections, so a query
+only searches one tenant's HNSW index and deleting a chatbot drops its
+collections instead of filtering everyone's vectors. Collections of an
+embedding backend other than the default one carry a "__{backend}" suffix,
+so switching backends never mixes vectors of two models.
+"""
+import hashlib
+import re
+from .embedding_backends import backend_for, default_backend
+
+# Ids made of these characters are used as-is, which keeps names readable and
+# unambiguous since "_" only ever separates the parts
+_PLAIN_ID = re.compile(r"[A-Za-z0-9-]{1,40}")
+
+
+def _base_name(kind, user_id, chatbot_id):
+    user_id, chatbot_id = str(user_id), str(chatbot_id)
+    # the chatbot id ends the name, and Chroma names must end in a letter or digit
+    if _PLAIN_ID.fullmatch(user_id) and _PLAIN_ID.fullmatch(chatbot_id) and chatbot_id[-1] != "-":
+        return f"{kind}_{user_id}_{chatbot_id}"
+    digest = hashlib.sha1(f"{user_id}\0{chatbot_id}".encode("utf-8")).hexdigest()[:24]
+    return f"{kind}_h{digest}"
+
+
+def with_backend(base_name, kind, backend=None):
+    backend = backend_for(kind, backend)
+    return base_name if backend == default_backend(kind) else f"{base_name}__{backend}"
+
+
+def tenant_collection_name(kind, user_id, chatbot_id, backend=None):
+    """
+    Collection holding one chatbot's vectors; kind is "docs" or "images",
+    backend defaults to the configured embedding backend for that kind.
+    """
+    return with_backend(_base_name(kind, user_id, chatbot_id), kind, backend)
+
+
+def split_collection_name(name):
+    """(kind, base name, backend) of a tenant collection name."""
+    base, _, backend = name.partition("__")
+    kind = base.split("_", 1)[0]
+    return kind, base, backend or default_backend(kind)
+
+
+def chatbot_collection_names(kind, user_id, chatbot_id, names):
+    """The chatbot's collections of every backend among the given names."""
+    base = _base_name(kind, user_id, chatbot_id)
+    return [name for name in names if split_collection_name(name)[1] == base]
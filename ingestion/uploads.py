@@ -0,0 +1,196 @@
+#uploads.py
+"""
+Receiving files for POST /chatbots.
+
+Each UploadFile is read in UPLOAD_CHUNK_BYTES pieces and written to a temp
+file under the chatbot's .incoming/ folder. The same pass hashes the bytes,
+checks the leading bytes against the extension and enforces the per-file and
+per-request size limits. Only when every file of the request passed are
+they moved into documents/ with os.replace, which is atomic because both
+folders are on the same filesystem. A failed request leaves nothing behind.
+
+Each file gets one of these outcomes:
+- identical to a file already in the chatbot: kept as it is
+- repeated within the request, or the same content under another name: skipped
+- otherwise: moved into documents/
+
+Hashes of the files moved in are written to upload_hashes.json. The
+dispatcher reuses them as the ingestion key instead of reading the file a
+second time.
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from .dispatcher import DOC_EXT, IMG_EXT
+from .manifest import (
+    chatbot_root,
+    known_sha256,
+    load_upload_hashes,
+    save_upload_hashes,
+    upload_hash_entry,
+)
+
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(200 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+INCOMING_DIR = ".incoming"
+
+_SNIFF_BYTES = 512
+
+_OLE = (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",)
+_ZIP = (b"PK\x03\x04",)
+# Leading bytes each extension must start with; None means plain text
+MAGIC = {
+    ".pdf": (b"%PDF-",),
+    ".png": (b"\x89PNG\r\n\x1a\n",),
+    ".jpg": (b"\xff\xd8\xff",),
+    ".jpeg": (b"\xff\xd8\xff",),
+    ".gif": (b"GIF87a", b"GIF89a"),
+    ".bmp": (b"BM",),
+    ".docx": _ZIP, ".xlsx": _ZIP, ".pptx": _ZIP, ".odt": _ZIP,
+    ".doc": _OLE, ".xls": _OLE, ".ppt": _OLE, ".msg": _OLE,
+    ".rtf": (b"{\\rtf",),
+    ".txt": None, ".csv": None, ".html": None, ".htm": None,
+}
+
+_chatbot_locks = {}
+
+
+class StagedUpload:
+    def __init__(self, filename, tmp_path):
+        self.filename = filename
+        self.tmp_path = tmp_path
+        self.sha256 = None
+        self.size = 0
+        self.status = None
+
+    def to_dict(self):
+        return {"filename": self.filename, "sha256": self.sha256, "size": self.size, "status": self.status}
+
+
+def new_chatbot_id():
+    return uuid.uuid4().hex
+
+
+def safe_filename(filename):
+    """The bare file name of an upload, refusing paths and unsupported extensions."""
+    raw = (filename or "").strip()
+    name = os.path.basename(raw.replace("\\", "/"))
+    if not name or name.startswith(".") or name != raw:
+        raise HTTPException(status_code=400, detail=f"Invalid file name {filename!r}")
+    ext = os.path.splitext(name)[1].lower()
+    if ext not in DOC_EXT and ext not in IMG_EXT:
+        raise HTTPException(status_code=415, detail=f"Unsupported file type {ext or '(none)'} for {name}")
+    return name
+
+
+def sniff_matches(filename, head):
+    """True if the first bytes look like what the extension claims."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in MAGIC:
+        return True
+    magic = MAGIC[ext]
+    if magic is None:
+        # text: no NUL bytes unless it is UTF-16 with a BOM
+        return b"\x00" not in head or head.startswith((b"\xff\xfe", b"\xfe\xff"))
+    return head.startswith(magic)
+
+
+async def _receive(upload: UploadFile, staged: StagedUpload, request_left: int):
+    """Stream one upload to its temp file, hashing and checking it on the way."""
+    digest = hashlib.sha256()
+    out = await run_in_threadpool(open, staged.tmp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            if staged.size == 0 and not sniff_matches(staged.filename, chunk[:_SNIFF_BYTES]):
+                raise HTTPException(status_code=415,
+                                    detail=f"{staged.filename} does not look like a {Path(staged.filename).suffix} file")
+            staged.size += len(chunk)
+            if staged.size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"{staged.filename} exceeds {MAX_UPLOAD_FILE_BYTES} bytes")
+            if staged.size > request_left:
+                raise HTTPException(status_code=413,
+                                    detail=f"Upload exceeds {MAX_UPLOAD_REQUEST_BYTES} bytes in total")
+            digest.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+    finally:
+        await run_in_threadpool(out.close)
+    if staged.size == 0:
+        raise HTTPException(status_code=400, detail=f"{staged.filename} is empty")
+    staged.sha256 = digest.hexdigest()
+
+
+def _existing_hashes(chatbot_path, documents_path):
+    """{filename: sha256} of the files already in the chatbot's documents/."""
+    if not documents_path.is_dir():
+        return {}
+    upload_hashes = load_upload_hashes(chatbot_path)
+    return {
+        entry.name: known_sha256(upload_hashes, entry.name, entry.path)
+        for entry in os.scandir(documents_path)
+        if entry.is_file()
+    }
+
+
+def _commit(staged, chatbot_path, documents_path):
+    """Move the accepted uploads into documents/ and record their hashes."""
+    existing = _existing_hashes(chatbot_path, documents_path)
+    by_hash = {digest: name for name, digest in existing.items()}
+    documents_path.mkdir(parents=True, exist_ok=True)
+    upload_hashes = load_upload_hashes(chatbot_path)
+    seen = set()
+    for item in staged:
+        if existing.get(item.filename) == item.sha256:
+            item.status = "unchanged"
+        elif item.sha256 in seen or by_hash.get(item.sha256, item.filename) != item.filename:
+            item.status = "duplicate"
+        else:
+            target = documents_path / item.filename
+            item.status = "replaced" if item.filename in existing else "saved"
+            os.replace(item.tmp_path, target)
+            upload_hashes[item.filename] = upload_hash_entry(target, item.sha256)
+        seen.add(item.sha256)
+    save_upload_hashes(chatbot_path, upload_hashes)
+
+
+async def save_uploads(files, user_id, chatbot_id, base_storage="uploads"):
+    """
+    Receive a request's files into uploads/users/{user_id}/{chatbot_id}/documents.
+    Returns one StagedUpload per file, with its hash, size and outcome.
+    Raises HTTPException (400/413/415) and keeps nothing if any file is refused.
+    """
+    names = [safe_filename(f.filename) for f in files]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="The same file name was sent twice")
+    declared = sum(f.size or 0 for f in files)
+    if declared > MAX_UPLOAD_REQUEST_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_REQUEST_BYTES} bytes in total")
+
+    chatbot_path = chatbot_root(base_storage, user_id, chatbot_id)
+    incoming = chatbot_path / INCOMING_DIR / uuid.uuid4().hex
+    await run_in_threadpool(incoming.mkdir, parents=True, exist_ok=True)
+    staged = [StagedUpload(name, incoming / name) for name in names]
+    try:
+        left = MAX_UPLOAD_REQUEST_BYTES
+        for upload, item in zip(files, staged):
+            if upload.size is not None and upload.size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(status_code=413,
+                                    detail=f"{item.filename} exceeds {MAX_UPLOAD_FILE_BYTES} bytes")
+            await _receive(upload, item, left)
+            left -= item.size
+
+        lock = _chatbot_locks.setdefault((user_id, chatbot_id), asyncio.Lock())
+        async with lock:
+            await run_in_threadpool(_commit, staged, chatbot_path, chatbot_path / "documents")
+    finally:
+        await run_in_threadpool(shutil.rmtree, incoming, ignore_errors=True)
+    return staged
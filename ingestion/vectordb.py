@@ -1,45 +1,50 @@
 #vectordb.py
 print("🔧 Initializing vector database...")
 import os
-import torch
-from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
+import uuid
 from langchain_community.vectorstores.utils import filter_complex_metadata
+from .registry import (
+    get_chroma_client,
+    get_text_embedding,
+    get_text_store,
+    get_lexical_index,
+    list_collection_names,
+    drop_collection,
+    drop_lexical_index,
+)
+from .tenancy import tenant_collection_name, chatbot_collection_names
+from .telemetry import span
 
 class VectorDB:
     def __init__(self, persist_dir="database"):
         self.persist_dir = persist_dir
-        device = "cuda" if torch.cuda.is_available() else "cpu"
 
-        # embeddings for docs
-        self.text_embedding = HuggingFaceEmbeddings(
-            model_name="hkunlp/instructor-xl",
-            model_kwargs={'device': device},
-            encode_kwargs={
-                "prompt": "Represent the document for retrieval:",
-                "normalize_embeddings": True
-            },
-            query_encode_kwargs={
-                "prompt": "Represent the question for retrieving supporting documents:",
-                "normalize_embeddings": True
-            }
-        )
+    @property
+    def text_embedding(self):
+        # embeddings for docs, shared with the retriever through the registry
+        return get_text_embedding()
 
-        self.docs_collection_name = "docs_collection"
+    def get_docs_collection(self, user_id, chatbot_id, create=True):
+        """The chatbot's own docs collection; with create=False, None if it does not exist"""
+        return get_text_store(tenant_collection_name("docs", user_id, chatbot_id), self.persist_dir,
+                              create=create)
 
-    def get_docs_collection(self):
-        return Chroma(
-            collection_name=self.docs_collection_name,
-            persist_directory=self.persist_dir,
-            embedding_function=self.text_embedding
-        )
+    def get_lexical_index(self, user_id, chatbot_id):
+        """The BM25 index over the chatbot's docs collection"""
+        return get_lexical_index(tenant_collection_name("docs", user_id, chatbot_id), self.persist_dir)
 
-    def store_documents(self, documents, user_id, chatbot_id, content_type="text"):
-        """Store only text-based documents"""
+    def store_documents(self, documents, user_id, chatbot_id, content_type="text", embeddings=None):
+        """
+        Store only text-based documents.
+        embeddings: optional precomputed vectors (one per document) that are
+        written as-is instead of encoding the texts again.
+        """
         if not documents:
             return
 
-        chroma = self.get_docs_collection()
+        chroma = self.get_docs_collection(user_id, chatbot_id)
+        # opened (and backfilled if new) before the collection gains these chunks
+        lexical = self.get_lexical_index(user_id, chatbot_id)
         contents = [doc.page_content for doc in documents]
 
         metadatas = []
@@ -56,14 +61,50 @@ class VectorDB:
                 "chatbot_id": str(chatbot_id),
                 "content_type": content_type,
                 "source": doc.metadata.get("source", ""),
+                "origin": doc.metadata.get("origin", ""),
                 "element_type": doc.metadata.get("element_type", "")
             })
             metadatas.append(metadata)
 
-        chroma.add_texts(texts=contents, metadatas=metadatas)
+        ids = [str(uuid.uuid4()) for _ in documents]
+        with span("chroma_add", "ingest"):
+            if embeddings is None:
+                chroma.add_texts(texts=contents, metadatas=metadatas, ids=ids)
+            else:
+                batch = get_chroma_client(self.persist_dir).get_max_batch_size()
+                for i in range(0, len(ids), batch):
+                    chroma._collection.add(
+                        ids=ids[i:i + batch],
+                        embeddings=embeddings[i:i + batch],
+                        documents=contents[i:i + batch],
+                        metadatas=metadatas[i:i + batch]
+                    )
+        # same IDs in the BM25 index so hybrid search can fuse the two rankings
+        with span("lexical_add", "ingest"):
+            lexical.add(ids, contents, metadatas)
 
-        print(f"📥 Ingested {len(documents)} {content_type} docs into {self.docs_collection_name}")
+        print(f"📥 Ingested {len(documents)} {content_type} docs into {chroma._collection.name}")
         return chroma
 
+    def delete_documents(self, user_id, chatbot_id, origin, source=None):
+        """Remove every chunk that came from one uploaded file"""
+        chroma = self.get_docs_collection(user_id, chatbot_id, create=False)
+        if chroma is None:
+            return
+        where = {"origin": {"$eq": origin}}
+        if source:
+            # chunks ingested before the origin field existed only carry the path
+            where = {"$or": [where, {"source": {"$eq": source}}]}
+        chroma._collection.delete(where=where)
+        self.get_lexical_index(user_id, chatbot_id).delete(origin, source)
+        print(f"🗑️ Removed {origin} chunks from {chroma._collection.name}")
+
+    def delete_chatbot(self, user_id, chatbot_id):
+        """Drop the chatbot's whole docs collection, for every embedding backend"""
+        names = list_collection_names(self.persist_dir)
+        for name in chatbot_collection_names("docs", user_id, chatbot_id, names):
+            drop_lexical_index(name, self.persist_dir)
+            drop_collection(name, self.persist_dir)
+
 # Singleton
 vector_db = VectorDB()
@@ -2,14 +2,26 @@
 
 from dotenv import load_dotenv
 import os
-from groq import Groq
+from groq import Groq, AsyncGroq
 
 load_dotenv()
 
-def load_groq_llm(default_model: str = "meta-llama/llama-4-scout-17b-16e-instruct"):
-    api_key = os.getenv("GROQ_API_KEY")
+def load_groq_llm(default_model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+                  api_key: str = None, http_client=None, max_retries: int = 2):
+    """http_client: optional shared httpx.Client (see models/pool.py)."""
+    api_key = api_key or os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY is not set in environment variables.")
 
-    client = Groq(api_key=api_key)
+    client = Groq(api_key=api_key, http_client=http_client, max_retries=max_retries)
+    return client, default_model
+
+def load_groq_async_llm(default_model: str = "meta-llama/llama-4-scout-17b-16e-instruct",
+                        api_key: str = None, http_client=None, max_retries: int = 2):
+    """Async client; keep one per process so its HTTP connections are reused."""
+    api_key = api_key or os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY is not set in environment variables.")
+
+    client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=max_retries)
     return client, default_model
@@ -2,18 +2,40 @@
 
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 load_dotenv()
 
 def load_openrouter_llm(
-    default_model: str = "mistralai/mistral-small-3.2-24b-instruct:free"
+    default_model: str = "mistralai/mistral-small-3.2-24b-instruct:free",
+    api_key: str = None,
+    http_client=None,
+    max_retries: int = 2
 ):
-
-    api_key = os.getenv("OPENROUTER_API_KEY")
+    """http_client: optional shared httpx.Client (see models/pool.py)."""
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
     client = OpenAI(
         base_url="https://openrouter.ai/api/v1",
-        api_key=api_key
+        api_key=api_key,
+        http_client=http_client,
+        max_retries=max_retries
+    )
+
+    return client, default_model
+
+def load_openrouter_async_llm(
+    default_model: str = "mistralai/mistral-small-3.2-24b-instruct:free",
+    api_key: str = None,
+    http_client=None,
+    max_retries: int = 2
+):
+    """Async client; keep one per process so its HTTP connections are reused."""
+    api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+    client = AsyncOpenAI(
+        base_url="https://openrouter.ai/api/v1",
+        api_key=api_key,
+        http_client=http_client,
+        max_retries=max_retries
     )
 
     return client, default_model
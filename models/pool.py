@@ -0,0 +1,524 @@
+# models/pool.py
+"""
+LLM provider pool: weighted routing, per-key rate limits, retries and hedging.
+
+LLM_PROVIDERS lists the providers to route between with their weights, e.g.
+"groq:3,openrouter:1" (default: LLM_PROVIDER, i.e. "groq"). Every API key of
+a provider ({NAME}_API_KEYS="k1,k2", or {NAME}_API_KEY) becomes one endpoint.
+Each endpoint has its own request and token buckets, sized by {NAME}_RPM and
+{NAME}_TPM, and its model can be overridden with {NAME}_MODEL.
+
+Routing per call:
+- Pick an endpoint, weighted, among those whose buckets can take the call
+  right now. If none can, wait for the first that frees up, up to
+  LLM_MAX_QUEUE_SECONDS, instead of sending a request that would get a 429.
+- A 429 puts the endpoint in cooldown for its Retry-After.
+- 429s, 5xx, timeouts and connection errors are retried up to
+  LLM_MAX_ATTEMPTS times with jittered exponential backoff, preferring
+  another endpoint.
+- Once LLM_HEDGE_MIN_SAMPLES calls have been timed, a call slower than the
+  LLM_HEDGE_QUANTILE of recent latencies (at least LLM_HEDGE_MIN_MS) is
+  hedged. A second request goes to another endpoint with free capacity and
+  the first answer wins. Streams hedge on their first chunk and are never
+  retried once a token has been yielded.
+
+All clients of the pool share one httpx.Client and one httpx.AsyncClient,
+so connections are pooled and kept alive across calls. The "stub" provider
+points at models/stub_server.py (LLM_STUB_URL) for tests and benchmarks.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "8"))
+# How long a call may wait for rate-limit capacity before giving up
+LLM_MAX_QUEUE_SECONDS = float(os.getenv("LLM_MAX_QUEUE_SECONDS", "30"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_MS = float(os.getenv("LLM_HEDGE_MIN_MS", "1500"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_STUB_URL = os.getenv("LLM_STUB_URL", "http://127.0.0.1:8089/v1")
+# Rough prompt cost of one image part; text is counted at 4 characters per token
+IMAGE_PART_TOKENS = 1200
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMUnavailable(RuntimeError):
+    """Every endpoint is rate limited or failing; retry_after is a hint in seconds."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _stub_loader(default_model="stub", api_key=None, http_client=None, max_retries=2, use_async=False):
+    from openai import AsyncOpenAI, OpenAI
+    cls = AsyncOpenAI if use_async else OpenAI
+    return cls(base_url=LLM_STUB_URL, api_key=api_key or "stub", http_client=http_client,
+               max_retries=max_retries), default_model
+
+
+def _provider_loaders(name):
+    """(sync loader, async loader, default RPM, default TPM) of a provider."""
+    if name == "groq":
+        from models.groq import load_groq_llm, load_groq_async_llm
+        return load_groq_llm, load_groq_async_llm, 30, 30000
+    if name == "openrouter":
+        from models.openrouter import load_openrouter_llm, load_openrouter_async_llm
+        return load_openrouter_llm, load_openrouter_async_llm, 20, 100000
+    if name == "stub":
+        return (_stub_loader,
+                lambda *args, **kwargs: _stub_loader(*args, use_async=True, **kwargs),
+                6000, 10000000)
+    raise ValueError(f"Unknown LLM provider {name!r}")
+
+
+class TokenBucket:
+    """Refills per_minute units per minute, holds at most one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount can be taken (0 = now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+
+class Endpoint:
+    """One provider + API key (or a ready-made client pair) with its own rate limits."""
+
+    def __init__(self, provider, model, api_key=None, weight=1.0, rpm=None, tpm=None,
+                 client=None, async_client=None):
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.weight = weight
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.client = client
+        self.async_client = async_client
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+        self.stats = {"calls": 0, "ok": 0, "errors": 0, "rate_limited": 0, "hedges": 0}
+
+    @property
+    def name(self):
+        suffix = f"…{self.api_key[-4:]}" if self.api_key else ""
+        return f"{self.provider}{suffix}"
+
+    def wait_time(self, tokens, now):
+        waits = [max(0.0, self.cooldown_until - now)]
+        if self.requests:
+            waits.append(self.requests.wait_time(1, now))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens, now))
+        return max(waits)
+
+    def take(self, tokens, now):
+        if self.requests:
+            self.requests.take(1, now)
+        if self.tokens:
+            self.tokens.take(tokens, now)
+        self.in_flight += 1
+        self.stats["calls"] += 1
+
+
+def estimate_tokens(messages, max_tokens):
+    """Prompt plus completion tokens a call may spend, for the token buckets."""
+    chars, images = 0, 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(part.get("text", ""))
+    return chars // 4 + images * IMAGE_PART_TOKENS + max_tokens
+
+
+def _status(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retryable(error):
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt))
+
+
+class LLMPool:
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError("An LLM pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self._lock = threading.Lock()
+        self._latencies = {"complete": deque(maxlen=200), "stream": deque(maxlen=200)}
+        self._http = None
+        self._async_http = None
+        self._hedge_executor = None
+        self.stats = {"hedges_started": 0, "hedges_won": 0, "queued_seconds": 0.0, "unavailable": 0}
+
+    @classmethod
+    def from_env(cls):
+        spec = os.getenv("LLM_PROVIDERS") or os.getenv("LLM_PROVIDER", "groq")
+        endpoints = []
+        for item in spec.split(","):
+            name, _, weight = item.strip().partition(":")
+            if not name:
+                continue
+            env = name.upper()
+            _, _, default_rpm, default_tpm = _provider_loaders(name)
+            keys = [k.strip() for k in os.getenv(f"{env}_API_KEYS", "").split(",") if k.strip()]
+            keys = keys or [os.getenv(f"{env}_API_KEY")]
+            for key in keys:
+                endpoints.append(Endpoint(
+                    name,
+                    os.getenv(f"{env}_MODEL"),
+                    api_key=key,
+                    weight=float(weight or 1) / len(keys),
+                    rpm=float(os.getenv(f"{env}_RPM", default_rpm)),
+                    tpm=float(os.getenv(f"{env}_TPM", default_tpm)),
+                ))
+        pool = cls(endpoints)
+        print(f"🔀 LLM pool: {', '.join(f'{e.name} (w={e.weight:g})' for e in endpoints)}")
+        return pool
+
+    # -- clients -----------------------------------------------------------
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+    def _sync_client(self, endpoint):
+        if endpoint.client is None:
+            import httpx
+            with self._lock:
+                if self._http is None:
+                    self._http = httpx.Client(limits=self._limits(), timeout=LLM_TIMEOUT_SECONDS)
+            loader = _provider_loaders(endpoint.provider)[0]
+            kwargs = {"api_key": endpoint.api_key, "http_client": self._http, "max_retries": 0}
+            if endpoint.model:
+                endpoint.client, endpoint.model = loader(endpoint.model, **kwargs)
+            else:
+                endpoint.client, endpoint.model = loader(**kwargs)
+        return endpoint.client
+
+    def _async_client(self, endpoint):
+        if endpoint.async_client is None:
+            import httpx
+            with self._lock:
+                if self._async_http is None:
+                    self._async_http = httpx.AsyncClient(limits=self._limits(), timeout=LLM_TIMEOUT_SECONDS)
+            loader = _provider_loaders(endpoint.provider)[1]
+            kwargs = {"api_key": endpoint.api_key, "http_client": self._async_http, "max_retries": 0}
+            if endpoint.model:
+                endpoint.async_client, endpoint.model = loader(endpoint.model, **kwargs)
+            else:
+                endpoint.async_client, endpoint.model = loader(**kwargs)
+        return endpoint.async_client
+
+    # -- scheduling ----------------------------------------------------------
+
+    def _try_acquire(self, tokens, avoid=(), strict=False):
+        """(endpoint, 0) if one has capacity now, else (None, seconds until one may)."""
+        with self._lock:
+            now = time.monotonic()
+            waits = {e: e.wait_time(tokens, now) for e in self.endpoints}
+            ready = [e for e, w in waits.items() if w == 0]
+            preferred = [e for e in ready if e not in avoid]
+            candidates = preferred if (preferred or strict) else ready
+            if not candidates:
+                later = [w for e, w in waits.items() if not (strict and e in avoid)]
+                return None, min(later) if later else None
+            endpoint = random.choices(candidates, weights=[e.weight for e in candidates])[0]
+            endpoint.take(tokens, now)
+            return endpoint, 0.0
+
+    def _release(self, endpoint):
+        with self._lock:
+            endpoint.in_flight -= 1
+
+    def _acquire(self, tokens, avoid=()):
+        start = time.monotonic()
+        while True:
+            endpoint, delay = self._try_acquire(tokens, avoid)
+            if endpoint is not None:
+                self.stats["queued_seconds"] += time.monotonic() - start
+                return endpoint
+            left = start + LLM_MAX_QUEUE_SECONDS - time.monotonic()
+            if delay is None or delay > left:
+                self.stats["unavailable"] += 1
+                raise LLMUnavailable("All LLM endpoints are rate limited", retry_after=delay)
+            time.sleep(delay + 0.01)
+
+    async def _aacquire(self, tokens, avoid=()):
+        start = time.monotonic()
+        while True:
+            endpoint, delay = self._try_acquire(tokens, avoid)
+            if endpoint is not None:
+                self.stats["queued_seconds"] += time.monotonic() - start
+                return endpoint
+            left = start + LLM_MAX_QUEUE_SECONDS - time.monotonic()
+            if delay is None or delay > left:
+                self.stats["unavailable"] += 1
+                raise LLMUnavailable("All LLM endpoints are rate limited", retry_after=delay)
+            await asyncio.sleep(delay + 0.01)
+
+    def _record(self, endpoint, kind, started, error=None):
+        """Book-keeping after one request; returns True if error is worth retrying."""
+        self._release(endpoint)
+        if error is None:
+            endpoint.stats["ok"] += 1
+            self._latencies[kind].append(time.monotonic() - started)
+            return False
+        endpoint.stats["errors"] += 1
+        if _status(error) == 429:
+            endpoint.stats["rate_limited"] += 1
+            cooldown = _retry_after(error) or LLM_BACKOFF_BASE_S * 4
+            with self._lock:
+                endpoint.cooldown_until = max(endpoint.cooldown_until, time.monotonic() + cooldown)
+        print(f"⚠️ LLM call on {endpoint.name} failed: {error}")
+        return _retryable(error)
+
+    def _failed(self, avoid, error):
+        """Endpoints a retry should steer clear of: the one that just failed and any cooling down."""
+        now = time.monotonic()
+        return set(avoid) | {getattr(error, "endpoint", None)} | {e for e in self.endpoints if e.cooldown_until > now}
+
+    def hedge_delay(self, kind):
+        """Seconds after which a call of this kind is hedged, or None."""
+        samples = self._latencies[kind]
+        if not LLM_HEDGE or len(self.endpoints) < 2 or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        quantile = ordered[min(len(ordered) - 1, int(LLM_HEDGE_QUANTILE * len(ordered)))]
+        return max(LLM_HEDGE_MIN_MS / 1000, quantile)
+
+    # -- sync ----------------------------------------------------------------
+
+    def _call(self, endpoint, messages, max_tokens):
+        started = time.monotonic()
+        try:
+            resp = self._sync_client(endpoint).chat.completions.create(
+                model=endpoint.model, messages=messages, max_tokens=max_tokens
+            )
+        except Exception as e:
+            e.retry, e.endpoint = self._record(endpoint, "complete", started, e), endpoint
+            raise
+        self._record(endpoint, "complete", started)
+        return resp, endpoint
+
+    def _hedged(self, messages, max_tokens, tokens, avoid):
+        endpoint = self._acquire(tokens, avoid)
+        delay = self.hedge_delay("complete")
+        if delay is None:
+            return self._call(endpoint, messages, max_tokens)
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+        futures = {self._hedge_executor.submit(self._call, endpoint, messages, max_tokens)}
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            second, _ = self._try_acquire(tokens, set(avoid) | {endpoint}, strict=True)
+            if second is not None:
+                second.stats["hedges"] += 1
+                self.stats["hedges_started"] += 1
+                hedge = self._hedge_executor.submit(self._call, second, messages, max_tokens)
+                futures.add(hedge)
+        error = None
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the slower request, if any, finishes in the background
+                    resp, winner = future.result()
+                    if winner is not endpoint:
+                        self.stats["hedges_won"] += 1
+                    return resp, winner
+                error = error or future.exception()
+        raise error
+
+    def complete(self, messages, max_tokens=1024):
+        """(response, endpoint) of a chat completion, routed, retried and hedged."""
+        tokens = estimate_tokens(messages, max_tokens)
+        avoid = set()
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            try:
+                return self._hedged(messages, max_tokens, tokens, avoid)
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                if not getattr(e, "retry", False) or attempt == LLM_MAX_ATTEMPTS - 1:
+                    raise
+                avoid = self._failed(avoid, e)
+                time.sleep(_backoff(attempt))
+
+    # -- async ---------------------------------------------------------------
+
+    async def _acall(self, endpoint, messages, max_tokens, stream=False):
+        """The response, or for streams (stream, first chunk), on one endpoint."""
+        kind = "stream" if stream else "complete"
+        started = time.monotonic()
+        try:
+            resp = await self._async_client(endpoint).chat.completions.create(
+                model=endpoint.model, messages=messages, max_tokens=max_tokens, stream=stream
+            )
+            if stream:
+                first = await resp.__anext__()
+                resp = (resp, first)
+        except StopAsyncIteration:
+            self._record(endpoint, kind, started)
+            return (_empty_stream(), None), endpoint
+        except asyncio.CancelledError:
+            self._release(endpoint)
+            raise
+        except Exception as e:
+            e.retry, e.endpoint = self._record(endpoint, kind, started, e), endpoint
+            raise
+        self._record(endpoint, kind, started)
+        return resp, endpoint
+
+    async def _ahedged(self, messages, max_tokens, tokens, avoid, stream):
+        kind = "stream" if stream else "complete"
+        endpoint = await self._aacquire(tokens, avoid)
+        delay = self.hedge_delay(kind)
+        if delay is None:
+            return await self._acall(endpoint, messages, max_tokens, stream)
+        tasks = {asyncio.ensure_future(self._acall(endpoint, messages, max_tokens, stream))}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            second, _ = self._try_acquire(tokens, set(avoid) | {endpoint}, strict=True)
+            if second is not None:
+                second.stats["hedges"] += 1
+                self.stats["hedges_started"] += 1
+                tasks.add(asyncio.ensure_future(self._acall(second, messages, max_tokens, stream)))
+        error = None
+        winner = None
+        try:
+            while tasks and winner is None:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task.result()
+                    elif task.exception() is None:
+                        # both answered at once: drop the spare stream
+                        await _close_stream(task.result()[0], stream)
+                    else:
+                        error = error or task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+        if winner is None:
+            raise error
+        if winner[1] is not endpoint:
+            self.stats["hedges_won"] += 1
+        return winner
+
+    async def _aretry(self, messages, max_tokens, stream):
+        tokens = estimate_tokens(messages, max_tokens)
+        avoid = set()
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            try:
+                return await self._ahedged(messages, max_tokens, tokens, avoid, stream)
+            except LLMUnavailable:
+                raise
+            except Exception as e:
+                if not getattr(e, "retry", False) or attempt == LLM_MAX_ATTEMPTS - 1:
+                    raise
+                avoid = self._failed(avoid, e)
+                await asyncio.sleep(_backoff(attempt))
+
+    async def acomplete(self, messages, max_tokens=1024):
+        """Async complete()."""
+        return await self._aretry(messages, max_tokens, stream=False)
+
+    async def astream(self, messages, max_tokens=1024):
+        """Yields (chunk, endpoint); failures before the first chunk are retried or hedged."""
+        (stream, first), endpoint = await self._aretry(messages, max_tokens, stream=True)
+        if first is not None:
+            yield first, endpoint
+        async for chunk in stream:
+            yield chunk, endpoint
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def pool_stats(self):
+        samples = sorted(self._latencies["complete"])
+        return {
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            "hedge_after_s": self.hedge_delay("complete"),
+            "p50_s": round(samples[len(samples) // 2], 3) if samples else None,
+            "endpoints": [
+                {"name": e.name, "model": e.model, "weight": e.weight, "in_flight": e.in_flight,
+                 "cooling_down": e.cooldown_until > time.monotonic(), **e.stats}
+                for e in self.endpoints
+            ],
+        }
+
+    async def aclose(self):
+        """Close the shared connection pools (on app shutdown)."""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+        if self._http is not None:
+            self._http.close()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+
+async def _empty_stream():
+    return
+    yield
+
+
+async def _close_stream(stream, is_stream):
+    if not is_stream:
+        return
+    closer = getattr(stream, "close", None) or getattr(stream, "aclose", None)
+    if closer is not None:
+        result = closer()
+        if asyncio.iscoroutine(result):
+            await result
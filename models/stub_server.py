@@ -0,0 +1,134 @@
+# models/stub_server.py
+"""
+OpenAI-compatible stub LLM server for load tests and failover drills.
+
+Serves POST .../chat/completions (plain and stream=True) with a canned
+answer. Latency, jitter, a requests-per-minute limit (answered with 429 and
+Retry-After) and a random 500 rate are configurable, so the pool in
+models/pool.py can be exercised without spending provider quota.
+
+    python -m models.stub_server --port 8089 --latency-ms 300 --rpm 60 --fail-rate 0.05
+
+and point the API at it with LLM_PROVIDERS=stub LLM_STUB_URL=http://127.0.0.1:8089/v1.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "This is a stub answer from the test LLM server."
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=200, jitter_ms=50, rpm=0, fail_rate=0.0, answer=ANSWER):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rpm = rpm
+        self.fail_rate = fail_rate
+        self.answer = answer
+        self.calls = deque()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "failed": 0}
+
+    def admit(self):
+        """None if the request may proceed, else seconds until it would."""
+        if not self.rpm:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and self.calls[0] <= now - 60:
+                self.calls.popleft()
+            if len(self.calls) >= self.rpm:
+                return self.calls[0] + 60 - now
+            self.calls.append(now)
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server.stats["requests"] += 1
+
+        wait = server.admit()
+        if wait is not None:
+            server.stats["rate_limited"] += 1
+            return self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                              {"Retry-After": f"{wait:.2f}"})
+        time.sleep(max(0.0, random.gauss(server.latency_ms, server.jitter_ms)) / 1000)
+        if random.random() < server.fail_rate:
+            server.stats["failed"] += 1
+            return self._json(500, {"error": {"message": "stub failure", "type": "server_error"}})
+
+        model = request.get("model") or "stub"
+        prompt_tokens = sum(len(json.dumps(m.get("content", ""))) // 4 for m in request.get("messages", []))
+        words = server.answer.split(" ")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        base = {"id": f"stub-{time.time_ns()}", "created": int(time.time()), "model": model}
+        if not request.get("stream"):
+            return self._json(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": server.answer}}],
+                "usage": usage,
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "finish_reason": "stop" if last else None,
+                                  "delta": {"content": word + ("" if last else " ")}}]}
+            if last:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_stub_server(port=0, host="127.0.0.1", **options):
+    """Start a stub server on a background thread; returns (server, base_url)."""
+    server = StubLLMServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429 (0 = unlimited)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 500")
+    args = parser.parse_args()
+    server = StubLLMServer((args.host, args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           rpm=args.rpm, fail_rate=args.fail_rate)
+    print(f"🧪 Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
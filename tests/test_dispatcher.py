@@ -0,0 +1,124 @@
+#test_dispatcher.py
+"""
+detect_and_ingest against an in-memory vector store: the ingestion stages are
+replaced by fakes that record one vector per chunk, so no models are loaded.
+"""
+import os
+import pytest
+
+dispatcher = pytest.importorskip("ingestion.dispatcher")
+
+USER, CHATBOT = "u1", "bot1"
+
+
+class FakeVectors:
+    """Metadata of the stored vectors, deleted the way Chroma's where filters would."""
+
+    def __init__(self):
+        self.docs = []
+        self.images = []
+
+    def delete_documents(self, user_id, chatbot_id, origin, source=None):
+        self.docs = [m for m in self.docs
+                     if m.get("origin") != origin and not (source and m.get("source") == source)]
+
+    def delete_images(self, user_id, chatbot_id, origin):
+        self.images = [m for m in self.images if origin not in (m.get("origin"), m.get("source"))]
+
+
+@pytest.fixture
+def chatbot(tmp_path, monkeypatch):
+    base = tmp_path / "uploads"
+    documents = base / "users" / USER / CHATBOT / "documents"
+    documents.mkdir(parents=True)
+    (documents / "report.pdf").write_bytes(b"%PDF-1.4 report")
+    (documents / "photo.png").write_bytes(b"\x89PNG\r\n\x1a\n photo")
+
+    store = FakeVectors()
+
+    def ingest_texts(user_id, chatbot_id, file_paths, base_storage, progress=None):
+        for path in file_paths:
+            for n in range(3):
+                store.docs.append({"origin": os.path.basename(path), "source": str(path), "chunk": n})
+        return []
+
+    def ingest_images(user_id, chatbot_id, file_paths, progress=None, base_storage=None):
+        for path in file_paths:
+            store.images.append({"origin": os.path.basename(path), "source": os.path.basename(path)})
+
+    monkeypatch.setattr(dispatcher, "vector_db", store)
+    monkeypatch.setattr(dispatcher, "delete_images", store.delete_images)
+    monkeypatch.setattr(dispatcher, "ingest_texts", ingest_texts)
+    monkeypatch.setattr(dispatcher, "ingest_images", ingest_images)
+    monkeypatch.setattr(dispatcher, "drop_positional_images", lambda user_id, chatbot_id: 0)
+    return base, documents, store
+
+
+def test_first_run_over_unmanifested_vectors_does_not_duplicate(chatbot):
+    base, documents, store = chatbot
+    # what the original pipeline stored: no origin, the upload path as source,
+    # plus a full_document entry and the image under its bare name
+    pdf_source = os.path.join(str(documents), "report.pdf")
+    store.docs = [{"source": pdf_source, "element_type": "text"} for _ in range(4)]
+    store.docs.append({"source": pdf_source, "element_type": "full_document"})
+    store.images = [{"source": "photo.png"}]
+
+    summary = dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+
+    assert summary["added"] == ["photo.png", "report.pdf"]
+    assert len(store.docs) == 3
+    assert all(m.get("origin") == "report.pdf" for m in store.docs)
+    assert len(store.images) == 1
+
+
+def test_second_run_keeps_counts(chatbot):
+    base, documents, store = chatbot
+    dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+    counts = len(store.docs), len(store.images)
+
+    summary = dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+
+    assert summary["unchanged"] == ["photo.png", "report.pdf"]
+    assert (len(store.docs), len(store.images)) == counts
+
+
+def test_changed_upload_replaces_its_vectors(chatbot):
+    base, documents, store = chatbot
+    dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+    (documents / "report.pdf").write_bytes(b"%PDF-1.4 report, second edition")
+
+    summary = dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+
+    assert summary["updated"] == ["report.pdf"]
+    assert len(store.docs) == 3
+
+
+def test_legacy_artifacts_are_moved_out_and_forgotten(chatbot):
+    base, documents, store = chatbot
+    (documents / "report_picture_1.png").write_bytes(b"\x89PNG\r\n\x1a\n extracted")
+    (documents / "report-table-1.csv").write_text("a,b\n1,2\n")
+    table_source = os.path.join(str(documents), "report-table-1.csv")
+    store.docs = [{"source": table_source, "element_type": "text"}]
+    store.images = [{"source": "report_picture_1.png"}]
+
+    summary = dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+
+    assert summary["added"] == ["photo.png", "report.pdf"]
+    assert not (documents / "report_picture_1.png").exists()
+    assert not any(m.get("source") == table_source for m in store.docs)
+    assert not any(m.get("source") == "report_picture_1.png" for m in store.images)
+
+
+def test_uploads_named_like_artifacts_are_ingested(chatbot, monkeypatch):
+    base, documents, store = chatbot
+    # no "scan" document to have been extracted from
+    (documents / "scan_picture_1.png").write_bytes(b"\x89PNG\r\n\x1a\n scan")
+    # received through the upload endpoint, so an upload despite report.pdf
+    (documents / "report-table-2.csv").write_text("a,b\n1,2\n")
+    monkeypatch.setattr(dispatcher, "load_upload_hashes", lambda path: {"report-table-2.csv": {}})
+
+    summary = dispatcher.detect_and_ingest(USER, CHATBOT, str(base))
+
+    assert "scan_picture_1.png" in summary["added"]
+    assert "report-table-2.csv" in summary["added"]
+    assert (documents / "report-table-2.csv").exists()
@@ -0,0 +1,34 @@
+#test_embedding_cache.py
+"""EmbeddingCache recency on disk, with small caps and no model."""
+import pytest
+
+pytest.importorskip("numpy")
+embedding_cache = pytest.importorskip("ingestion.embedding_cache")
+
+
+def _last_used(cache, key):
+    return cache._db.execute("SELECT last_used FROM embeddings WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_memory_hits_refresh_last_used_on_the_next_write(tmp_path):
+    cache = embedding_cache.EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=10)
+    cache.put_many("m", {"hot": [1.0]})
+    stored = _last_used(cache, "hot")
+
+    assert "hot" in cache.get_many(["hot"])
+    cache.put_many("m", {"other": [2.0]})
+
+    assert cache.memory_hits == 1
+    assert _last_used(cache, "hot") > stored
+
+
+def test_disk_eviction_keeps_entries_served_from_memory(tmp_path):
+    cache = embedding_cache.EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    cache.put_many("m", {"hot": [1.0], "cold": [2.0]})
+    cache.get_many(["hot"])
+
+    cache.put_many("m", {"a": [3.0], "b": [4.0]})
+
+    keys = {key for (key,) in cache._db.execute("SELECT key FROM embeddings")}
+    assert "hot" in keys
+    assert "cold" not in keys
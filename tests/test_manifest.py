@@ -0,0 +1,78 @@
+#test_manifest.py
+"""Manifest diffing and upload-hash reuse, on plain files."""
+import os
+
+from ingestion.manifest import (
+    diff_manifest,
+    file_sha256,
+    known_sha256,
+    legacy_artifacts,
+    record_file,
+    upload_hash_entry,
+)
+
+
+def _manifest(**files):
+    manifest = {"version": 1, "files": {}}
+    for name, digest in files.items():
+        record_file(manifest, name, digest, 1, "document")
+    return manifest
+
+
+def test_diff_manifest_sorts_files_into_added_changed_unchanged_removed():
+    manifest = _manifest(**{"a.pdf": "1", "b.pdf": "2", "gone.pdf": "3"})
+
+    added, changed, unchanged, removed = diff_manifest(
+        manifest, {"a.pdf": "1", "b.pdf": "22", "new.pdf": "4"})
+
+    assert added == ["new.pdf"]
+    assert changed == ["b.pdf"]
+    assert unchanged == ["a.pdf"]
+    assert removed == ["gone.pdf"]
+
+
+def test_diff_manifest_without_files_adds_everything():
+    assert diff_manifest({"version": 0}, {"b.txt": "2", "a.txt": "1"}) == (["a.txt", "b.txt"], [], [], [])
+
+
+def test_known_sha256_reuses_the_upload_hash_of_an_untouched_file(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    hashes = {"a.txt": upload_hash_entry(path, "recorded")}
+
+    assert known_sha256(hashes, "a.txt", path) == "recorded"
+
+
+def test_known_sha256_rehashes_a_file_changed_since_upload(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    hashes = {"a.txt": upload_hash_entry(path, "recorded")}
+    path.write_text("hello, again")
+
+    assert known_sha256(hashes, "a.txt", path) == file_sha256(path)
+
+
+def test_known_sha256_rehashes_on_a_new_mtime_of_the_same_size(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+    hashes = {"a.txt": upload_hash_entry(path, "recorded")}
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+    assert known_sha256(hashes, "a.txt", path) == file_sha256(path)
+
+
+def test_known_sha256_hashes_files_never_uploaded(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("hello")
+
+    assert known_sha256({}, "a.txt", path) == file_sha256(path)
+
+
+def test_legacy_artifacts_need_the_document_they_came_from():
+    names = ["report.pdf", "report_picture_1.png", "report-table-2.csv",
+             "scan_picture_1.png", "q3-table-2.csv", "mine-table-1.csv", "mine.docx"]
+
+    found = legacy_artifacts(names, known_uploads={"mine-table-1.csv"})
+
+    assert found == {"report_picture_1.png": "report.pdf", "report-table-2.csv": "report.pdf"}
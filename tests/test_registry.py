@@ -0,0 +1,43 @@
+#test_registry.py
+"""The registry's LRU over per-chatbot entries, with stand-in instances."""
+import pytest
+
+registry = pytest.importorskip("ingestion.registry")
+
+
+class FakeIndex:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def empty_registry(monkeypatch):
+    for name, value in (("_instances", {}), ("_stats", {}), ("_tenant_lru", registry.OrderedDict())):
+        monkeypatch.setattr(registry, name, value)
+    monkeypatch.setattr(registry, "REGISTRY_MAX_TENANT_ENTRIES", 2)
+
+
+def test_least_recently_used_tenant_entry_is_closed_and_dropped(empty_registry):
+    a, b, c = FakeIndex(), FakeIndex(), FakeIndex()
+    registry._get_or_load("lexical_index:/db:a", lambda: a)
+    registry._get_or_load("lexical_index:/db:b", lambda: b)
+    # a hit makes "a" the most recently used
+    assert registry._get_or_load("lexical_index:/db:a", FakeIndex) is a
+
+    registry._get_or_load("lexical_index:/db:c", lambda: c)
+
+    assert b.closed and not a.closed and not c.closed
+    assert set(registry._instances) == {"lexical_index:/db:a", "lexical_index:/db:c"}
+    assert "lexical_index:/db:b" not in registry._stats
+
+
+def test_models_and_clients_are_never_evicted(empty_registry):
+    model = object()
+    registry._get_or_load("text_embedding:instructor", lambda: model)
+    for name in "abc":
+        registry._get_or_load(f"text_store:instructor:/db:{name}", object)
+
+    assert registry._instances["text_embedding:instructor"] is model
+    assert len(registry._tenant_lru) == 2
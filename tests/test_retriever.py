@@ -0,0 +1,31 @@
+#test_retriever.py
+"""Query paths on a chatbot with nothing ingested: empty results, nothing created."""
+import pytest
+
+retriever = pytest.importorskip("ingestion.retriever")
+
+
+@pytest.fixture
+def no_collections(monkeypatch):
+    calls = []
+    monkeypatch.setattr(retriever, "get_text_store", lambda name, persist_dir, create=True: calls.append(create))
+    monkeypatch.setattr(retriever, "get_image_collection",
+                        lambda name, persist_dir, create=True: calls.append(create))
+
+    def get_lexical_index(name, persist_dir):
+        raise AssertionError("a query opened (and so created) a BM25 index")
+    monkeypatch.setattr(retriever, "get_lexical_index", get_lexical_index)
+    return calls
+
+
+def test_texts_of_a_missing_chatbot_are_empty(no_collections):
+    batches = retriever.retrieve_texts_by_vectors("u1", "nobody", [[0.1], [0.2]], questions=["a", "b"])
+
+    assert batches == [[], []]
+    assert no_collections == [False]
+
+
+def test_images_of_a_missing_chatbot_are_empty(no_collections):
+    assert retriever.retrieve_images_for_questions("u1", "nobody", ["a", "b"]) == [[], []]
+    assert retriever.get_image_retriever("u1", "nobody")("a") == []
+    assert no_collections == [False, False]
@@ -0,0 +1,72 @@
+#test_uploads.py
+"""The outcome _commit gives each staged upload, with hashes known up front."""
+import hashlib
+
+import pytest
+
+uploads = pytest.importorskip("ingestion.uploads")
+
+from ingestion.manifest import load_upload_hashes  # noqa: E402
+
+
+@pytest.fixture
+def chatbot(tmp_path):
+    chatbot_path = tmp_path / "users" / "u1" / "bot1"
+    documents = chatbot_path / "documents"
+    incoming = chatbot_path / uploads.INCOMING_DIR / "req"
+    incoming.mkdir(parents=True)
+
+    def stage(name, content):
+        item = uploads.StagedUpload(name, incoming / name)
+        item.tmp_path.write_bytes(content)
+        item.sha256 = hashlib.sha256(content).hexdigest()
+        item.size = len(content)
+        return item
+
+    def commit(*items):
+        uploads._commit(list(items), chatbot_path, documents)
+        return [item.status for item in items]
+
+    return chatbot_path, documents, stage, commit
+
+
+def test_new_files_are_saved_and_their_hashes_recorded(chatbot):
+    chatbot_path, documents, stage, commit = chatbot
+    item = stage("a.txt", b"alpha")
+
+    assert commit(item) == ["saved"]
+    assert (documents / "a.txt").read_bytes() == b"alpha"
+    assert load_upload_hashes(chatbot_path)["a.txt"]["sha256"] == item.sha256
+
+
+def test_same_name_and_content_is_unchanged(chatbot):
+    chatbot_path, documents, stage, commit = chatbot
+    commit(stage("a.txt", b"alpha"))
+
+    assert commit(stage("a.txt", b"alpha")) == ["unchanged"]
+
+
+def test_new_content_under_a_known_name_is_replaced(chatbot):
+    chatbot_path, documents, stage, commit = chatbot
+    commit(stage("a.txt", b"alpha"))
+    item = stage("a.txt", b"beta")
+
+    assert commit(item) == ["replaced"]
+    assert (documents / "a.txt").read_bytes() == b"beta"
+    assert load_upload_hashes(chatbot_path)["a.txt"]["sha256"] == item.sha256
+
+
+def test_known_content_under_another_name_is_a_duplicate(chatbot):
+    chatbot_path, documents, stage, commit = chatbot
+    commit(stage("a.txt", b"alpha"))
+
+    assert commit(stage("copy.txt", b"alpha")) == ["duplicate"]
+    assert not (documents / "copy.txt").exists()
+    assert "copy.txt" not in load_upload_hashes(chatbot_path)
+
+
+def test_content_repeated_within_a_request_is_saved_once(chatbot):
+    chatbot_path, documents, stage, commit = chatbot
+
+    assert commit(stage("a.txt", b"alpha"), stage("b.txt", b"alpha")) == ["saved", "duplicate"]
+    assert sorted(p.name for p in documents.iterdir()) == ["a.txt"]